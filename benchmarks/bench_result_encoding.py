@@ -0,0 +1,66 @@
+"""
+Benchmark: tool-result encodings (src/encoding.py) against the previous list-of-dicts
+json.dumps, for serialization time and prompt tokens at several row limits.
+
+Run from the repository root after the database has been built:
+    python benchmarks/bench_result_encoding.py
+"""
+import json
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import encoding
+import prompt
+
+DatabasePath = os.environ.get("DATABASE_PATH", "demo.db")
+Limits = [5, 50, 500]
+Iterations = 200
+
+
+def LegacyEncode(ColumnsInformation, Rows):
+    Results = []
+    for Row in Rows:
+        RowDictionary = {}
+        for Index, Col in enumerate(ColumnsInformation):
+            RowDictionary[Col] = Row[Index]
+        Results.append(RowDictionary)
+    return json.dumps(Results)
+
+
+def CompactEncode(Columns, Rows, Limit, Format):
+    return encoding.EncodeToolResult(encoding.ResultSet(Columns, Rows, Limit), Format)
+
+
+def Measure(Function, *Arguments):
+    Started = time.perf_counter()
+    for _ in range(Iterations):
+        Text = Function(*Arguments)
+    return (time.perf_counter() - Started) / Iterations * 1e6, Text
+
+
+def Main():
+    Connection = sqlite3.connect(DatabasePath)
+    Cursor = Connection.cursor()
+    print(f"Token counts use {'tiktoken o200k_base' if prompt.GetEncoding() is not None else 'the 4 characters/token estimate'}")
+    print(f"{'limit':>6} {'encoding':<14} {'us/encode':>10} {'chars':>9} {'tokens':>8} {'tokens vs legacy':>17}")
+    for Limit in Limits:
+        # Rows are fetched once; only the encoding is timed
+        Cursor.execute(f'SELECT * FROM "accounts" LIMIT {Limit + 1}')
+        Columns = [Column[0] for Column in Cursor.description]
+        Rows = Cursor.fetchall()
+        Micros, Text = Measure(LegacyEncode, Columns, Rows[:Limit])
+        LegacyTokens = prompt.CountTokens(Text)
+        print(f"{Limit:>6} {'list-of-dicts':<14} {Micros:>10.1f} {len(Text):>9} {LegacyTokens:>8} {'1.00x':>17}")
+        for Format in encoding.Encoders:
+            Micros, Text = Measure(CompactEncode, Columns, Rows, Limit, Format)
+            Tokens = prompt.CountTokens(Text)
+            print(f"{Limit:>6} {Format:<14} {Micros:>10.1f} {len(Text):>9} {Tokens:>8} {Tokens / LegacyTokens:>16.2f}x")
+    Connection.close()
+
+
+if __name__ == "__main__":
+    Main()
@@ -0,0 +1,203 @@
+"""
+Micro-benchmarks for the selectSQL path (QuoteColumnInWhere, ValidateWhereClause,
+BuildSelectQuery, ExecuteSQL) and for querySQL aggregates, exact and estimated from the
+sample tables, on synthetic "accounts" tables of 10k to 10M rows.
+
+Tables are generated deterministically and kept in benchmarks/data/ for later runs. Every
+iteration uses a different WHERE clause, so per-clause memoization doesn't flatter the
+numbers, and the query cache is cleared before each ExecuteSQL unless the case is "cached".
+
+Run from the repository root:
+    python benchmarks/bench_sql_tools.py --rows 10000,100000,1000000
+    python benchmarks/bench_sql_tools.py --rows 10000000 --iterations 20
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+# The benchmark measures the code path, not the per-query budgets or the index advisor
+os.environ.setdefault("INDEX_ADVISOR_ENABLED", "0")
+os.environ.setdefault("QUERY_TIMEOUT", "0")
+os.environ.setdefault("QUERY_MAX_VM_STEPS", "0")
+
+BenchmarkDirectory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BenchmarkDirectory)
+sys.path.insert(0, os.path.join(BenchmarkDirectory, "..", "src"))
+
+import report
+import pool
+import catalog
+import cache
+import tools
+import sampling
+
+DataDirectory = os.path.join(BenchmarkDirectory, "data")
+
+Columns = [
+    ("Document Number", "INTEGER", "n"),
+    ("Company Code", "TEXT", "'C' || (n % 40)"),
+    # XAU is rarer than one row per sample, so a sampled GROUP BY would leave it out
+    ("Currency", "TEXT", "CASE WHEN n % 50000 = 7 THEN 'XAU' ELSE CASE n % 5 WHEN 0 THEN 'EUR' WHEN 1 THEN 'USD' WHEN 2 THEN 'GBP' WHEN 3 THEN 'CHF' ELSE 'JPY' END END"),
+    ("Transaction Value", "REAL", "((n * 7919) % 200003) / 10.0 - 5000"),
+    ("Clearing Date", "TEXT", "CASE WHEN n % 11 = 0 THEN NULL ELSE date('2015-01-01', '+' || ((n * 37) % 3650) || ' days') END"),
+    ("Fiscal Year", "INTEGER", "2015 + (n * 13) % 10"),
+    ("Country Key", "TEXT", "CASE n % 7 WHEN 0 THEN 'DE' WHEN 1 THEN 'US' WHEN 2 THEN 'GB' WHEN 3 THEN 'CH' WHEN 4 THEN 'FR' WHEN 5 THEN 'JP' ELSE 'NL' END"),
+    ("Debit/Credit ind", "TEXT", "CASE WHEN n % 3 = 0 THEN 'H' ELSE 'S' END"),
+    ("Posting period", "INTEGER", "1 + n % 12"),
+    ("Text", "TEXT", "'Accrual ' || (n % 997)")
+]
+
+
+def BuildTable(Rows: int) -> str:
+    """Creates (once) a database with Rows synthetic accounts and its schema document."""
+    os.makedirs(DataDirectory, exist_ok=True)
+    DatabasePath = os.path.join(DataDirectory, f"synthetic_{Rows}.db")
+    SchemaPath = DatabasePath[:-3] + ".json"
+    if os.path.exists(DatabasePath) and os.path.exists(SchemaPath):
+        return DatabasePath
+
+    Started = time.perf_counter()
+    Temporary = DatabasePath + ".building"
+    if os.path.exists(Temporary):
+        os.remove(Temporary)
+    Connection = sqlite3.connect(Temporary)
+    Connection.execute("PRAGMA journal_mode = OFF")
+    Connection.execute("PRAGMA synchronous = OFF")
+    Definitions = ", ".join(f'"{Name}" {Type}' for Name, Type, _ in Columns)
+    Connection.execute(f'CREATE TABLE "accounts" ({Definitions})')
+    Names = ", ".join(f'"{Name}"' for Name, _, _ in Columns)
+    Expressions = ", ".join(Expression for _, _, Expression in Columns)
+    Connection.execute(f"""
+        WITH RECURSIVE Sequence(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM Sequence WHERE n < ?)
+        INSERT INTO "accounts" ({Names}) SELECT {Expressions} FROM Sequence
+    """, (Rows,))
+    Connection.commit()
+    Connection.close()
+    os.replace(Temporary, DatabasePath)
+
+    Schema = {"accounts": {
+        "description": f"Synthetic accrual accounts ({Rows} rows)",
+        "columns": [{"name": Name, "type": Type, "nullable": True, "default": None, "primary_key": False}
+                    for Name, Type, _ in Columns]
+    }}
+    with open(SchemaPath, "w") as File:
+        json.dump(Schema, File, indent=2)
+    print(f"built {DatabasePath} in {time.perf_counter() - Started:.1f}s")
+    return DatabasePath
+
+
+def UseDatabase(DatabasePath: str):
+    # Databases built before sampling existed get their sample tables now
+    Connection = sqlite3.connect(DatabasePath)
+    sampling.EnsureSamples(Connection)
+    Connection.close()
+    pool.ClosePool()
+    pool.DatabasePath = DatabasePath
+    catalog.SchemaPath = DatabasePath[:-3] + ".json"
+    catalog.InvalidateCatalog()
+    cache.InvalidateAll()
+
+
+def Clause(Index: int) -> str:
+    return f"Transaction Value > {Index % 1000} AND Currency = 'EUR' AND Clearing Date IS NOT NULL"
+
+
+def Aggregate(Index: int) -> str:
+    return f'SELECT COUNT(*), AVG("Transaction Value") FROM accounts WHERE "Transaction Value" > {Index % 1000}'
+
+
+def Grouped(Index: int) -> str:
+    return f'SELECT Currency, COUNT(*) FROM accounts WHERE "Posting period" <> {13 + Index} GROUP BY Currency'
+
+
+def CheckGroups():
+    """An estimated GROUP BY must name every group the exact one does, the rare ones included."""
+    Exact = {Row[0] for Row in tools.ExecuteQuery(Grouped(0), Exact=True)["rows"]}
+    Estimated = {Row[0] for Row in tools.ExecuteQuery(Grouped(0))["rows"]}
+    assert Estimated == Exact, f"estimated GROUP BY is missing groups {sorted(Exact - Estimated)}"
+
+
+def CheckStatements():
+    """Quoted table names and quoted aliases, with or without AS, pass validation."""
+    for Sql in ('SELECT COUNT(*) FROM "accounts"',
+                'SELECT "Currency" "c", COUNT(*) AS "n" FROM "accounts" "a" GROUP BY "c" ORDER BY "n" DESC'):
+        tools.ExecuteQuery(Sql, Exact=True)
+
+
+def Measure(Function, Iterations: int, Prepare=None):
+    Samples = []
+    Started = time.perf_counter()
+    for Index in range(Iterations):
+        if Prepare:
+            Prepare()
+        Before = time.perf_counter()
+        Function(Index)
+        Samples.append((time.perf_counter() - Before) * 1000)
+    return report.Summarize(Samples, time.perf_counter() - Started)
+
+
+def RunSize(Rows: int, Iterations: int):
+    UseDatabase(BuildTable(Rows))
+    tools.ExecuteSQL("accounts", None, None, None)  # Loads the catalog and opens the pool
+    # Queries scan; fewer iterations on large tables keep the run short
+    QueryIterations = max(3, min(Iterations, 2_000_000 // Rows))
+    Clear = cache.QueryCache.Clear
+    CheckStatements()
+    CheckGroups()
+
+    First = tools.ExecuteSQL("accounts", None, Clause(1), '"Transaction Value" DESC', Limit=20)
+    PageCursor = First["next_cursor"]
+
+    Cases = {
+        "quote": (lambda Index: tools.QuoteColumnInWhere(Clause(Index), TableName="accounts"), Iterations, None),
+        "validate": (lambda Index: tools.ValidateWhereClause(Clause(Index), "accounts"), Iterations, None),
+        "build": (lambda Index: tools.BuildSelectQuery("accounts", None, Clause(Index), '"Transaction Value" DESC', Limit=6),
+                  Iterations, None),
+        # Early matches: stops after Limit + 1 rows
+        "execute.filter": (lambda Index: tools.ExecuteSQL("accounts", None, Clause(Index), None), QueryIterations, Clear),
+        # Rare matches: scans most of the table
+        "execute.selective": (lambda Index: tools.ExecuteSQL("accounts", None,
+                                                             f"Transaction Value > {14990 + Index % 5} AND Fiscal Year = 2019",
+                                                             None), QueryIterations, Clear),
+        # Top-N over the whole table
+        "execute.order": (lambda Index: tools.ExecuteSQL("accounts", ["Document Number", "Transaction Value"],
+                                                         f"Posting period <> {13 + Index}", '"Transaction Value" DESC'),
+                          QueryIterations, Clear),
+        # Second page through the keyset cursor
+        "execute.page2": (lambda Index: tools.ExecuteSQL(Cursor=PageCursor), QueryIterations, Clear),
+        "execute.cached": (lambda Index: tools.ExecuteSQL("accounts", None, Clause(0), None), Iterations, None),
+        # Aggregates over the whole table, then from a sample (the same as exact below SAMPLE_MIN_ROWS)
+        "query.exact": (lambda Index: tools.ExecuteQuery(Aggregate(Index), Exact=True), QueryIterations, Clear),
+        "query.approximate": (lambda Index: tools.ExecuteQuery(Aggregate(Index)), QueryIterations, Clear),
+        # Estimated only when an index can count the groups; scanned otherwise
+        "query.grouped": (lambda Index: tools.ExecuteQuery(Grouped(Index)), QueryIterations, Clear)
+    }
+
+    Results = {}
+    for Name, (Function, Count, Prepare) in Cases.items():
+        Results[f"{Rows}.{Name}"] = Measure(Function, Count, Prepare)
+    return Results
+
+
+def Main():
+    Parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    Parser.add_argument("--rows", default="10000,100000,1000000", help="comma-separated table sizes (up to 10000000)")
+    Parser.add_argument("--iterations", type=int, default=500)
+    Parser.add_argument("--output", help="report path (default: benchmarks/results/bench_sql_tools-<commit>.json)")
+    Arguments = Parser.parse_args()
+
+    Results = {}
+    for Rows in [int(Value) for Value in Arguments.rows.split(",")]:
+        Results.update(RunSize(Rows, Arguments.iterations))
+    pool.ClosePool()
+
+    report.PrintTable(Results)
+    print("report:", report.WriteReport("bench_sql_tools", {"rows": Arguments.rows, "iterations": Arguments.iterations},
+                                        Results, Arguments.output))
+
+
+if __name__ == "__main__":
+    Main()
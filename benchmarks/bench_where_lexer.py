@@ -0,0 +1,112 @@
+"""
+Micro-benchmark: single-pass lexer (src/lexer.py) against the previous per-column
+re.sub quoting and regex-based validation of WHERE clauses.
+
+Run from the repository root:
+    python benchmarks/bench_where_lexer.py
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import lexer
+
+AccountsColumns = [
+    'Unnamed: 0', 'Authorization Group', 'Bus. Transac. Type', 'Calculate Tax', 'Cash Flow-Relevant Doc.',
+    'Cleared Item', 'Clearing Date', 'Clearing Entry Date', 'Clearing Fiscal Year', 'Country Key', 'Currency',
+    'Debit/Credit ind', 'Transaction Value', 'Document Is Back-Posted', 'Exchange rate', 'Fiscal Year.1',
+    'Fiscal Year.2', 'Posting period.1', 'Ref. Doc. Line Item'
+]
+
+LegacyKeywords = {
+    'select', 'from', 'where', 'order', 'by', 'group', 'having', 'distinct', 'limit',
+    'and', 'or', 'not', 'in', 'like', 'between', 'is', 'null', 'true', 'false',
+    'as', 'on', 'inner', 'outer', 'left', 'right', 'join', 'union', 'intersect', 'except',
+    'avg', 'count', 'max', 'min', 'sum', 'abs', 'round', 'length', 'upper', 'lower',
+    'datetime', 'date', 'timestamp', 'integer', 'text', 'real', 'numeric', 'varchar',
+    'int', 'bool', 'float', 'double', 'char'
+}
+
+
+def LegacyQuoteColumnInWhere(WhereClause, AllColumns):
+    AllColumns = sorted(AllColumns, key=len, reverse=True)
+    ProcessedWhere = WhereClause
+    for ColumnName in AllColumns:
+        EscapedName = re.escape(ColumnName)
+        if ' ' in ColumnName:
+            ProcessedWhere = re.sub(r'(?<!\w)(' + EscapedName + r')(?!\w)', f'"{ColumnName}"', ProcessedWhere)
+        else:
+            ProcessedWhere = re.sub(r'\b' + EscapedName + r'\b', f'"{ColumnName}"', ProcessedWhere)
+    return ProcessedWhere
+
+
+def LegacyValidateWhereClause(WhereClause, ValidColumns):
+    ClauseNoStrings = re.sub(r"'[^']*'", '', WhereClause)
+    ClauseNoStrings = re.sub(r'"[^"]*"', '', ClauseNoStrings)
+    PotentialColumns = re.findall(r'\b([a-zA-Z_][a-zA-Z0-9_\.]*)\b', ClauseNoStrings)
+    PotentialColumns = [Col for Col in PotentialColumns if Col.lower() not in LegacyKeywords]
+    Unknown = []
+    for Col in PotentialColumns:
+        ColName = Col.split('.', 1)[1] if '.' in Col else Col
+        if ColName.lower() not in [Vc.lower() for Vc in ValidColumns]:
+            Unknown.append(ColName)
+    return Unknown
+
+
+def WideSchema(Width):
+    Columns = list(AccountsColumns)
+    Index = 0
+    while len(Columns) < Width:
+        Columns.append(f"Metric {Index} Value" if Index % 2 else f"field_{Index}")
+        Index += 1
+    return Columns
+
+
+def LongClause(Columns, Conditions):
+    Parts = []
+    for Index in range(Conditions):
+        Column = Columns[Index % len(Columns)]
+        Parts.append(f"\"{Column}\" IS NOT NULL" if Index % 3 == 0 else f"{Column} > {Index}")
+        if Index % 5 == 0:
+            Parts.append("Currency = 'Transaction Value with Clearing Date'")
+    return " AND ".join(Parts)
+
+
+def Measure(Function, Repeat):
+    Best = float("inf")
+    for _ in range(3):
+        Started = time.perf_counter()
+        for _ in range(Repeat):
+            Function()
+        Best = min(Best, (time.perf_counter() - Started) / Repeat)
+    return Best * 1e6
+
+
+def Main():
+    print(f"{'columns':>8} {'conds':>6} {'legacy quote+validate us':>26} {'lexer us':>10} {'speedup':>8}")
+    for Width in (19, 100, 500):
+        Columns = WideSchema(Width)
+        for Conditions in (4, 32, 128):
+            Clause = LongClause(Columns, Conditions)
+            Repeat = max(3, 2000 // (Width * Conditions // 4 + 1))
+
+            Lex = lexer.Lexicon(Columns)
+
+            def Legacy():
+                LegacyValidateWhereClause(Clause, Columns)
+                LegacyQuoteColumnInWhere(Clause, Columns)
+
+            def Single():
+                # Tokenize directly, bypassing the per-clause memo, so the lexing itself is measured
+                Lex.Tokenize(Clause)
+
+            LegacyMicros = Measure(Legacy, Repeat)
+            LexerMicros = Measure(Single, Repeat)
+            print(f"{Width:>8} {Conditions:>6} {LegacyMicros:>26.1f} {LexerMicros:>10.1f} {LegacyMicros / LexerMicros:>7.1f}x")
+
+
+if __name__ == "__main__":
+    Main()
@@ -0,0 +1,72 @@
+"""
+Compares two benchmark reports (e.g. from two commits) case by case and exits with 1
+when a latency percentile grew, or throughput fell, by more than --threshold percent.
+
+Run from the repository root:
+    python benchmarks/compare.py benchmarks/results/bench_sql_tools-abc1234.json benchmarks/results/bench_sql_tools-def5678.json
+"""
+import argparse
+import json
+import sys
+
+# Latency metrics regress upwards, throughput downwards
+Metrics = {"p50_ms": 1, "p95_ms": 1, "p99_ms": 1, "throughput_per_s": -1}
+
+
+def Load(Path: str):
+    with open(Path) as File:
+        return json.load(File)
+
+
+def Compare(Baseline, Candidate, Threshold: float, MinimumDeltaMs: float):
+    Rows = []
+    Regressions = []
+    for Case, Before in Baseline["results"].items():
+        After = Candidate["results"].get(Case)
+        if After is None:
+            continue
+        for Metric, Direction in Metrics.items():
+            Old, New = Before.get(Metric), After.get(Metric)
+            if not Old or New is None:
+                continue
+            Change = (New - Old) / Old * 100
+            Regressed = Change * Direction > Threshold
+            if Metric.endswith("_ms") and abs(New - Old) < MinimumDeltaMs:
+                # Sub-millisecond swings on fast cases are timer noise, not regressions
+                Regressed = False
+            Rows.append((Case, Metric, Old, New, Change, Regressed))
+            if Regressed:
+                Regressions.append((Case, Metric, Change))
+    return Rows, Regressions
+
+
+def Main():
+    Parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    Parser.add_argument("baseline")
+    Parser.add_argument("candidate")
+    Parser.add_argument("--threshold", type=float, default=10.0, help="percent change that counts as a regression")
+    Parser.add_argument("--min-delta-ms", type=float, default=0.05,
+                        help="latency changes smaller than this many milliseconds never count as regressions")
+    Arguments = Parser.parse_args()
+
+    Baseline, Candidate = Load(Arguments.baseline), Load(Arguments.candidate)
+    if Baseline["benchmark"] != Candidate["benchmark"]:
+        print(f"warning: comparing {Baseline['benchmark']} with {Candidate['benchmark']}")
+    print(f"baseline  {Baseline['git'].get('commit')} ({Baseline['created_at']})")
+    print(f"candidate {Candidate['git'].get('commit')} ({Candidate['created_at']})")
+    if Baseline["environment"] != Candidate["environment"]:
+        print("warning: the reports come from different environments")
+
+    Rows, Regressions = Compare(Baseline, Candidate, Arguments.threshold, Arguments.min_delta_ms)
+    Width = max([len(Row[0]) for Row in Rows] + [4])
+    print(f"{'case':<{Width}} {'metric':<17} {'baseline':>12} {'candidate':>12} {'change':>9}")
+    for Case, Metric, Old, New, Change, Regressed in Rows:
+        print(f"{Case:<{Width}} {Metric:<17} {Old:>12} {New:>12} {Change:>+8.1f}%{'  REGRESSION' if Regressed else ''}")
+
+    if Regressions:
+        print(f"{len(Regressions)} regressions above {Arguments.threshold}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    Main()
@@ -0,0 +1,191 @@
+"""
+Load generator for /chat (or /chat/stream): keeps --concurrency conversations in flight
+and reports end-to-end latency percentiles, throughput and, from the Server-Timing
+header (or the trace event when streaming), where the server spent its time.
+
+Tool calls that fail (a rejected statement, a missing column) are counted from the server's
+tool_calls_total metric, and from the tool_end events when streaming; the run exits with
+status 1 when there were any, unless --allow-tool-errors is given, because the latencies
+would then time the error path instead of the queries.
+
+Start the mock model and the app first (see mock_openai.py), then from the repository root:
+    python benchmarks/load_chat.py --concurrency 16 --requests 400
+    python benchmarks/load_chat.py --stream --duration 60 --scenario select,query
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from collections import defaultdict, Counter
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import report
+
+
+def ParseServerTiming(Header: str):
+    Timings = {}
+    for Entry in (Header or "").split(","):
+        Name, _, Parameters = Entry.strip().partition(";")
+        if Parameters.startswith("dur="):
+            Timings[Name] = float(Parameters[4:])
+    return Timings
+
+
+def ParseToolErrors(Text: str):
+    """Failed tool calls per tool from the Prometheus text of /metrics."""
+    Errors = Counter()
+    for Line in Text.splitlines():
+        if Line.startswith("tool_calls_total{") and 'outcome="error"' in Line:
+            Labels, _, Value = Line.rpartition(" ")
+            Tool = Labels.partition('tool="')[2].partition('"')[0]
+            Errors[Tool] += int(float(Value))
+    return Errors
+
+
+async def ReadToolErrors(Client: httpx.AsyncClient):
+    Response = await Client.get("/metrics")
+    return ParseToolErrors(Response.text) if Response.status_code == 200 else Counter()
+
+
+RunId = uuid.uuid4().hex[:8]
+
+
+def BuildMessages(Index: int, Scenarios, RepeatQuestions: bool):
+    Scenario = Scenarios[Index % len(Scenarios)]
+    # Unique questions (across runs too) keep the answer cache out of the measurement unless asked otherwise
+    Suffix = "" if RepeatQuestions else f" (run {RunId}, request {Index})"
+    Tag = "" if Scenario == "mixed" else f"[scenario:{Scenario}] "
+    return [{"role": "user", "content": f"{Tag}Show me the accounts with large transactions{Suffix}"}]
+
+
+async def SendChat(Client: httpx.AsyncClient, Messages):
+    Started = time.perf_counter()
+    Response = await Client.post("/chat", json={"conversationHistory": Messages})
+    Elapsed = (time.perf_counter() - Started) * 1000
+    return Response.status_code, Elapsed, None, ParseServerTiming(Response.headers.get("server-timing"))
+
+
+async def SendChatStream(Client: httpx.AsyncClient, Messages):
+    Started = time.perf_counter()
+    FirstToken = None
+    Timings = {}
+    Status = None
+    Event = None
+    ToolErrors = 0
+    async with Client.stream("POST", "/chat/stream", json={"conversationHistory": Messages, "debug": True}) as Response:
+        Status = Response.status_code
+        async for Line in Response.aiter_lines():
+            if Line.startswith("event: "):
+                Event = Line[7:]
+                if Event == "delta" and FirstToken is None:
+                    FirstToken = (time.perf_counter() - Started) * 1000
+            elif Line.startswith("data: ") and Event == "trace":
+                Trace = json.loads(Line[6:])
+                Timings = dict(Trace["totals_ms"], total=Trace["duration_ms"])
+            elif Line.startswith("data: ") and Event == "tool_end":
+                Summary = json.loads(Line[6:])
+                ToolErrors += ("error" in Summary) + Summary.get("failed", 0)
+            elif Line.startswith("data: ") and Event == "error":
+                Status = json.loads(Line[6:]).get("status", 500)
+    Elapsed = (time.perf_counter() - Started) * 1000
+    if Status == 200 and ToolErrors:
+        # Answered, but around a failed tool call: not a timing of the query path
+        Status = "tool_error"
+    return Status, Elapsed, FirstToken, Timings
+
+
+async def Run(Arguments):
+    Scenarios = Arguments.scenario.split(",")
+    Send = SendChatStream if Arguments.stream else SendChat
+    Latencies = []
+    FirstTokens = []
+    Breakdown = defaultdict(list)
+    Statuses = Counter()
+    Next = 0
+    Deadline = None
+
+    def Claim():
+        nonlocal Next
+        if Arguments.duration:
+            if time.perf_counter() >= Deadline:
+                return None
+        elif Next >= Arguments.requests + Arguments.warmup:
+            return None
+        Next += 1
+        return Next - 1
+
+    async def Worker(Client):
+        while True:
+            Index = Claim()
+            if Index is None:
+                return
+            try:
+                Status, Elapsed, FirstToken, Timings = await Send(Client, BuildMessages(Index, Scenarios, Arguments.repeat_questions))
+            except httpx.HTTPError as E:
+                Statuses[type(E).__name__] += 1
+                continue
+            if Index < Arguments.warmup:
+                continue
+            Statuses[str(Status)] += 1
+            if Status != 200:
+                continue
+            Latencies.append(Elapsed)
+            if FirstToken is not None:
+                FirstTokens.append(FirstToken)
+            for Category, Milliseconds in Timings.items():
+                Breakdown[Category].append(Milliseconds)
+
+    Limits = httpx.Limits(max_connections=Arguments.concurrency, max_keepalive_connections=Arguments.concurrency)
+    async with httpx.AsyncClient(base_url=Arguments.url, timeout=Arguments.timeout, limits=Limits) as Client:
+        ErrorsBefore = await ReadToolErrors(Client)
+        Started = time.perf_counter()
+        Deadline = Started + (Arguments.duration or 0)
+        await asyncio.gather(*(Worker(Client) for _ in range(Arguments.concurrency)))
+        Wall = time.perf_counter() - Started
+        ToolErrors = await ReadToolErrors(Client)
+        ToolErrors.subtract(ErrorsBefore)
+
+    Results = {"chat_stream" if Arguments.stream else "chat": report.Summarize(Latencies, Wall)}
+    if FirstTokens:
+        Results["time_to_first_token"] = report.Summarize(FirstTokens)
+    for Category in sorted(Breakdown):
+        Results[f"server.{Category}"] = report.Summarize(Breakdown[Category])
+    return Results, dict(Statuses), {Tool: Count for Tool, Count in ToolErrors.items() if Count > 0}, Wall
+
+
+def Main():
+    Parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    Parser.add_argument("--url", default="http://127.0.0.1:8000")
+    Parser.add_argument("--concurrency", type=int, default=8)
+    Parser.add_argument("--requests", type=int, default=200)
+    Parser.add_argument("--duration", type=float, help="run for this many seconds instead of a request count")
+    Parser.add_argument("--warmup", type=int, default=10, help="requests sent first and left out of the report")
+    Parser.add_argument("--stream", action="store_true", help="drive /chat/stream and measure time to first token")
+    Parser.add_argument("--scenario", default="mixed", help="comma-separated mock scenarios, cycled per request")
+    Parser.add_argument("--repeat-questions", action="store_true", help="let the answer cache serve repeated questions")
+    Parser.add_argument("--allow-tool-errors", action="store_true", help="report failed tool calls without failing the run")
+    Parser.add_argument("--timeout", type=float, default=180)
+    Parser.add_argument("--output", help="report path (default: benchmarks/results/load_chat-<commit>.json)")
+    Arguments = Parser.parse_args()
+
+    Results, Statuses, ToolErrors, Wall = asyncio.run(Run(Arguments))
+    report.PrintTable(Results)
+    print(f"statuses: {Statuses}  tool errors: {ToolErrors}  wall: {Wall:.1f}s")
+
+    Settings = {Key: Value for Key, Value in vars(Arguments).items() if Key != "output"}
+    Settings["statuses"] = Statuses
+    Settings["tool_errors"] = ToolErrors
+    print("report:", report.WriteReport("load_chat_stream" if Arguments.stream else "load_chat", Settings, Results,
+                                        Arguments.output))
+    if ToolErrors and not Arguments.allow_tool_errors:
+        sys.exit(f"{sum(ToolErrors.values())} tool calls failed during the run: {ToolErrors}")
+
+
+if __name__ == "__main__":
+    Main()
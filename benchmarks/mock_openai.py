@@ -0,0 +1,202 @@
+"""
+Local stand-in for the OpenAI chat completions API, for offline load tests.
+
+Replies follow scripted scenarios: each step is either a round of tool calls or a final
+answer, and the step is picked from how many tool-call rounds the conversation already
+had since the last user message, so the server keeps no state. A user message containing
+"[scenario:<name>]" selects the scenario; otherwise --scenario applies.
+
+Run from the repository root, then point the app at it:
+    python benchmarks/mock_openai.py --port 8001 --latency-ms 300
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock fastapi run src/main.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from typing import Dict, Any, List
+
+from fastapi import FastAPI, Body
+from fastapi.responses import StreamingResponse
+
+Scenarios = {
+    "answer": [
+        {"content": "There are several accrual accounts in the database."}
+    ],
+    "select": [
+        {"tool_calls": [{"name": "selectSQL", "arguments": {"TableName": "{table}", "WhereClause": "\"Transaction Value\" > 1000"}}]},
+        {"content": "Here are the first accounts with a transaction value above 1000."}
+    ],
+    "query": [
+        {"tool_calls": [{"name": "querySQL", "arguments": {"Sql": "SELECT \"Currency\", COUNT(*) AS n, SUM(\"Transaction Value\") AS total FROM {table} GROUP BY \"Currency\" ORDER BY n DESC"}}]},
+        {"content": "The totals per currency are listed above."}
+    ],
+    "parallel": [
+        {"tool_calls": [
+            {"name": "selectSQL", "arguments": {"TableName": "{table}", "OrderBy": "\"Transaction Value\" DESC", "Limit": 10}},
+            {"name": "querySQL", "arguments": {"Sql": "SELECT COUNT(*) FROM {table} WHERE \"Transaction Value\" < 0"}}
+        ]},
+        {"content": "These are the largest transactions; the count of negative values is shown as well."}
+    ],
+    "multi": [
+        {"tool_calls": [{"name": "profileColumns", "arguments": {"TableName": "{table}", "Columns": ["Transaction Value", "Currency"]}}]},
+        {"tool_calls": [{"name": "selectSQL", "arguments": {"TableName": "{table}", "WhereClause": "\"Transaction Value\" > 5000", "Limit": 20}}]},
+        {"content": "The profile shows the distribution; the largest accounts are listed."}
+    ]
+}
+
+ScenarioTag = re.compile(r"\[scenario:([\w-]+)\]")
+
+Settings = {
+    "latency_ms": 300.0,
+    "jitter_ms": 50.0,
+    "token_ms": 5.0,
+    "scenario": "mixed",
+    "table": "accounts"
+}
+
+App = FastAPI()
+
+
+def ApproximateTokens(Text: str) -> int:
+    return max(1, len(Text or "") // 4)
+
+
+def PickScenario(Messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    Question = next((Message.get("content") or "" for Message in reversed(Messages) if Message.get("role") == "user"), "")
+    Match = ScenarioTag.search(Question)
+    Name = Match.group(1) if Match else Settings["scenario"]
+    if Name == "mixed":
+        # Stable per question, so retries of one question follow the same script
+        Names = sorted(Scenarios)
+        Name = Names[sum(map(ord, Question)) % len(Names)]
+    return Scenarios.get(Name, Scenarios["answer"])
+
+
+def NextStep(Messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    Rounds = 0
+    for Message in reversed(Messages):
+        if Message.get("role") == "user":
+            break
+        if Message.get("role") == "assistant" and Message.get("tool_calls"):
+            Rounds += 1
+    Script = PickScenario(Messages)
+    return Script[min(Rounds, len(Script) - 1)]
+
+
+def BuildToolCalls(Step: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{
+        "id": "call_" + uuid.uuid4().hex[:12],
+        "type": "function",
+        "function": {
+            "name": Call["name"],
+            "arguments": json.dumps(Call["arguments"]).replace("{table}", Settings["table"])
+        }
+    } for Call in Step.get("tool_calls", [])]
+
+
+def Usage(Messages: List[Dict[str, Any]], Content: str, ToolCalls: List[Dict[str, Any]]) -> Dict[str, int]:
+    Prompt = sum(ApproximateTokens(json.dumps(Message)) for Message in Messages)
+    Completion = ApproximateTokens(Content) + sum(ApproximateTokens(Call["function"]["arguments"]) for Call in ToolCalls)
+    return {"prompt_tokens": Prompt, "completion_tokens": Completion, "total_tokens": Prompt + Completion}
+
+
+async def Think():
+    Delay = Settings["latency_ms"] + random.uniform(-Settings["jitter_ms"], Settings["jitter_ms"])
+    await asyncio.sleep(max(Delay, 0) / 1000)
+
+
+def Chunk(CompletionId: str, Model: str, Delta: Dict[str, Any], FinishReason: str = None) -> str:
+    Payload = {
+        "id": CompletionId,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": Model,
+        "choices": [{"index": 0, "delta": Delta, "finish_reason": FinishReason}]
+    }
+    return f"data: {json.dumps(Payload)}\n\n"
+
+
+async def StreamCompletion(CompletionId: str, Model: str, Content: str, ToolCalls: List[Dict[str, Any]],
+                           UsageReport: Dict[str, int], IncludeUsage: bool):
+    await Think()
+    yield Chunk(CompletionId, Model, {"role": "assistant", "content": ""})
+    for Word in re.findall(r"\S+\s*", Content or ""):
+        yield Chunk(CompletionId, Model, {"content": Word})
+        await asyncio.sleep(Settings["token_ms"] / 1000)
+    for Index, Call in enumerate(ToolCalls):
+        Arguments = Call["function"]["arguments"]
+        yield Chunk(CompletionId, Model, {"tool_calls": [{"index": Index, "id": Call["id"], "type": "function",
+                                                          "function": {"name": Call["function"]["name"], "arguments": ""}}]})
+        for Start in range(0, len(Arguments), 32):
+            yield Chunk(CompletionId, Model, {"tool_calls": [{"index": Index, "function": {"arguments": Arguments[Start:Start + 32]}}]})
+            await asyncio.sleep(Settings["token_ms"] / 1000)
+    yield Chunk(CompletionId, Model, {}, "tool_calls" if ToolCalls else "stop")
+    if IncludeUsage:
+        yield f"data: {json.dumps({'id': CompletionId, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': Model, 'choices': [], 'usage': UsageReport})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@App.post("/v1/chat/completions")
+async def CreateChatCompletion(Request: dict = Body()):
+    Messages = Request.get("messages", [])
+    Model = Request.get("model", "mock")
+    Step = NextStep(Messages)
+    ToolCalls = BuildToolCalls(Step)
+    Content = Step.get("content")
+    UsageReport = Usage(Messages, Content, ToolCalls)
+    CompletionId = "chatcmpl-" + uuid.uuid4().hex[:16]
+
+    if Request.get("stream"):
+        IncludeUsage = bool((Request.get("stream_options") or {}).get("include_usage"))
+        return StreamingResponse(StreamCompletion(CompletionId, Model, Content, ToolCalls, UsageReport, IncludeUsage),
+                                 media_type="text/event-stream")
+
+    await Think()
+    # Non-streamed replies still pay for generating every token
+    await asyncio.sleep(Settings["token_ms"] * UsageReport["completion_tokens"] / 1000)
+    Message = {"role": "assistant", "content": Content}
+    if ToolCalls:
+        Message["tool_calls"] = ToolCalls
+    return {
+        "id": CompletionId,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": Model,
+        "choices": [{"index": 0, "message": Message, "finish_reason": "tool_calls" if ToolCalls else "stop"}],
+        "usage": UsageReport
+    }
+
+
+@App.get("/v1/models")
+def ListModels():
+    return {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "owned_by": "mock"}]}
+
+
+def Main():
+    Parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    Parser.add_argument("--host", default="127.0.0.1")
+    Parser.add_argument("--port", type=int, default=8001)
+    Parser.add_argument("--latency-ms", type=float, default=Settings["latency_ms"], help="time before the first token")
+    Parser.add_argument("--jitter-ms", type=float, default=Settings["jitter_ms"])
+    Parser.add_argument("--token-ms", type=float, default=Settings["token_ms"], help="time per generated chunk")
+    Parser.add_argument("--scenario", default=Settings["scenario"], help=f"mixed or one of {sorted(Scenarios)}")
+    Parser.add_argument("--table", default=Settings["table"])
+    Parser.add_argument("--scripts", help="JSON file of extra scenarios: {name: [step, ...]}")
+    Arguments = Parser.parse_args()
+
+    Settings.update(latency_ms=Arguments.latency_ms, jitter_ms=Arguments.jitter_ms, token_ms=Arguments.token_ms,
+                    scenario=Arguments.scenario, table=Arguments.table)
+    if Arguments.scripts:
+        with open(Arguments.scripts) as File:
+            Scenarios.update(json.load(File))
+
+    import uvicorn
+    uvicorn.run(App, host=Arguments.host, port=Arguments.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    Main()
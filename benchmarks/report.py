@@ -0,0 +1,90 @@
+"""
+Shared helpers for the benchmark scripts: latency percentiles and JSON reports that
+compare.py can diff across commits.
+"""
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+from typing import Dict, Any, List
+
+BenchmarkDirectory = os.path.dirname(os.path.abspath(__file__))
+ResultsDirectory = os.path.join(BenchmarkDirectory, "results")
+
+
+def Percentile(SortedSamples: List[float], Fraction: float) -> float:
+    """Linear interpolation between the closest ranks."""
+    if not SortedSamples:
+        return None
+    Position = (len(SortedSamples) - 1) * Fraction
+    Lower = int(Position)
+    Upper = min(Lower + 1, len(SortedSamples) - 1)
+    return SortedSamples[Lower] + (SortedSamples[Upper] - SortedSamples[Lower]) * (Position - Lower)
+
+
+def Summarize(SamplesMs: List[float], WallSeconds: float = None) -> Dict[str, Any]:
+    """p50/p95/p99/mean/max in milliseconds and, given the wall-clock time, operations per second."""
+    Sorted = sorted(SamplesMs)
+    Summary = {
+        "count": len(Sorted),
+        "p50_ms": Round(Percentile(Sorted, 0.50)),
+        "p95_ms": Round(Percentile(Sorted, 0.95)),
+        "p99_ms": Round(Percentile(Sorted, 0.99)),
+        "mean_ms": Round(sum(Sorted) / len(Sorted)) if Sorted else None,
+        "max_ms": Round(Sorted[-1]) if Sorted else None
+    }
+    if WallSeconds:
+        Summary["throughput_per_s"] = Round(len(Sorted) / WallSeconds)
+    return Summary
+
+
+def Round(Value: float) -> float:
+    return None if Value is None else round(Value, 4)
+
+
+def GitRevision() -> Dict[str, Any]:
+    try:
+        Commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True, cwd=BenchmarkDirectory).stdout.strip()
+        Dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                    text=True, check=True, cwd=BenchmarkDirectory).stdout.strip())
+        return {"commit": Commit, "dirty": Dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def WriteReport(Benchmark: str, Settings: Dict[str, Any], Results: Dict[str, Dict[str, Any]],
+                Path: str = None) -> str:
+    """Writes the report (default: results/<benchmark>-<commit>.json) and returns its path."""
+    Revision = GitRevision()
+    Report = {
+        "benchmark": Benchmark,
+        "git": Revision,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count()
+        },
+        "settings": Settings,
+        "results": Results
+    }
+    if Path is None:
+        os.makedirs(ResultsDirectory, exist_ok=True)
+        Suffix = (Revision["commit"] or "unknown") + ("-dirty" if Revision["dirty"] else "")
+        Path = os.path.join(ResultsDirectory, f"{Benchmark}-{Suffix}.json")
+    with open(Path, "w") as File:
+        json.dump(Report, File, indent=2)
+    return Path
+
+
+def PrintTable(Results: Dict[str, Dict[str, Any]]):
+    Columns = ["count", "p50_ms", "p95_ms", "p99_ms", "mean_ms", "throughput_per_s"]
+    Width = max([len(Case) for Case in Results] + [4])
+    print(f"{'case':<{Width}} " + " ".join(f"{Column:>16}" for Column in Columns))
+    for Case, Summary in Results.items():
+        Cells = [Summary.get(Column) for Column in Columns]
+        print(f"{Case:<{Width}} " + " ".join(f"{'-' if Cell is None else Cell:>16}" for Cell in Cells))
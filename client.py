@@ -2,6 +2,8 @@ import tkinter as tk
 from tkinter import scrolledtext, Entry, Button, END
 import requests
 import json
+import queue
+import threading
 
 class ChatApplication:
     def __init__(self, root):
@@ -9,8 +11,12 @@ class ChatApplication:
         self.root.title("SQL Data Science Assistant")
         self.root.geometry("800x600")
 
-        # Conversation history
-        self.conversation_history = []
+        # The server keeps the conversation; we only send the session id and the new message
+        self.session_id = None
+
+        # Events from the streaming worker thread, drained on the Tk main loop
+        self.stream_events = queue.Queue()
+        self.streaming_started = False
 
         # Create UI elements
         self.create_widgets()
@@ -66,12 +72,6 @@ class ChatApplication:
         if not user_message.strip():
             return
 
-        # Add user message to conversation history
-        self.conversation_history.append({
-            "role": "user",
-            "content": user_message
-        })
-
         # Display user message
         self.display_message("You: " + user_message, "#ffffff")
 
@@ -82,54 +82,104 @@ class ChatApplication:
         self.toggle_ui_state(False)
 
         # Send to server in a separate thread to prevent GUI freezing
-        self.root.after(100, self.process_server_response)
-
-    def process_server_response(self):
+        self.streaming_started = False
+        payload = self.build_payload(user_message, self.session_id)
+        threading.Thread(target=self.process_server_response, args=(payload,), daemon=True).start()
+        self.root.after(50, self.poll_stream_events)
+
+    def build_payload(self, user_message, session_id=None):
+        if session_id:
+            return {"sessionId": session_id, "message": user_message}
+        # The instruction about plaintext output is stored with the session, so it is sent once
+        return {
+            "message": user_message,
+            "system": "All responses must be in plaintext format only. Do not use any markdown, HTML, or other markup languages as the output will be displayed as plain text without any formatting."
+        }
+
+    def process_server_response(self, payload):
+        # Runs on a worker thread; the UI is only touched from poll_stream_events
         try:
-            # Prepare payload with instruction about plaintext output
-            payload = {
-                "conversationHistory": [
-                    {
-                        "role": "system",
-                        "content": "All responses must be in plaintext format only. Do not use any markdown, HTML, or other markup languages as the output will be displayed as plain text without any formatting."
-                    }
-                ] + self.conversation_history
-            }
-
-            # Send request to server
-            response = requests.post(
-                "http://localhost:8000/chat",
-                headers={"Content-Type": "application/json"},
-                data=json.dumps(payload)
-            )
-
-            if response.status_code == 200:
-                bot_response = response.text
-
-                # Add bot response to conversation history
-                self.conversation_history.append({
-                    "role": "assistant",
-                    "content": bot_response
-                })
-
-                # Display bot response
-                self.display_message("Assistant: " + bot_response, "#e0f7fa")
-            else:
-                error_msg = f"Error: {response.status_code} - {response.text}"
-                self.display_message("System: " + error_msg, "#ffebee")
-                print(error_msg)
+            while True:
+                # Send request to server and read the server-sent events as they arrive
+                with requests.post(
+                    "http://localhost:8000/chat/stream",
+                    headers={"Content-Type": "application/json", "Accept": "text/event-stream"},
+                    data=json.dumps(payload),
+                    stream=True
+                ) as response:
+                    if response.status_code == 404 and "sessionId" in payload:
+                        # The session expired on the server; start a new one with this message
+                        self.stream_events.put(("expired", {}))
+                        payload = self.build_payload(payload["message"])
+                        continue
+                    if response.status_code != 200:
+                        self.stream_events.put(("error", {"detail": f"{response.status_code} - {response.text}"}))
+                        return
+
+                    event_name = "message"
+                    for line in response.iter_lines(decode_unicode=True):
+                        if line.startswith("event: "):
+                            event_name = line[len("event: "):]
+                        elif line.startswith("data: "):
+                            self.stream_events.put((event_name, json.loads(line[len("data: "):])))
+                    return
 
         except requests.exceptions.ConnectionError:
-            error_msg = "Could not connect to server. Please make sure the server is running on http://localhost:8000"
-            self.display_message("System: " + error_msg, "#ffebee")
-            print(error_msg)
+            self.stream_events.put(("error", {"detail": "Could not connect to server. Please make sure the server is running on http://localhost:8000"}))
         except Exception as e:
-            error_msg = f"An error occurred: {str(e)}"
-            self.display_message("System: " + error_msg, "#ffebee")
-            print(error_msg)
+            self.stream_events.put(("error", {"detail": f"An error occurred: {str(e)}"}))
         finally:
-            # Re-enable UI
-            self.toggle_ui_state(True)
+            self.stream_events.put(("closed", {}))
+
+    def poll_stream_events(self):
+        while True:
+            try:
+                event_name, data = self.stream_events.get_nowait()
+            except queue.Empty:
+                self.root.after(50, self.poll_stream_events)
+                return
+
+            if event_name == "delta":
+                if not self.streaming_started:
+                    self.streaming_started = True
+                    self.append_text("Assistant: ", "#e0f7fa")
+                self.append_text(data["content"])
+            elif event_name == "session":
+                self.session_id = data["session_id"]
+            elif event_name == "expired":
+                self.session_id = None
+                self.display_message("System: the previous session expired on the server; starting a new one", "#fff8e1")
+            elif event_name == "tool_start":
+                self.display_message(f"System: running {data['name']} {data['arguments']}", "#fff8e1")
+            elif event_name == "tool_end":
+                if "error" in data:
+                    self.display_message(f"System: {data['name']} failed after {data['sql_ms']} ms", "#fff8e1")
+                else:
+                    self.display_message(f"System: {data['name']} returned {data.get('rows', 0)} rows in {data['sql_ms']} ms", "#fff8e1")
+            elif event_name == "message":
+                bot_response = data["content"] or ""
+
+                # Display bot response unless it was already streamed in
+                if self.streaming_started:
+                    self.append_text("\n\n")
+                else:
+                    self.display_message("Assistant: " + bot_response, "#e0f7fa")
+            elif event_name == "error":
+                error_msg = f"Error: {data.get('detail')}"
+                self.display_message("System: " + error_msg, "#ffebee")
+                print(error_msg)
+            elif event_name == "closed":
+                # Re-enable UI
+                self.toggle_ui_state(True)
+                return
+
+    def append_text(self, text, bg_color=None):
+        self.chat_display.config(state='normal')
+        if bg_color:
+            self.chat_display.config(bg=bg_color)
+        self.chat_display.insert(tk.END, text)
+        self.chat_display.config(state='disabled')
+        self.chat_display.yview(tk.END)  # Auto-scroll to bottom
 
     def display_message(self, message, bg_color):
         self.chat_display.config(state='normal', bg=bg_color)
@@ -149,11 +199,21 @@ class ChatApplication:
                         child.config(state=state)
 
     def clear_conversation(self):
-        self.conversation_history = []
+        # Forget the server-side session too; the next message starts a new one
+        if self.session_id:
+            threading.Thread(target=self.delete_session, args=(self.session_id,), daemon=True).start()
+        self.session_id = None
         self.chat_display.config(state='normal')
         self.chat_display.delete(1.0, END)
         self.chat_display.config(state='disabled')
 
+    def delete_session(self, session_id):
+        try:
+            requests.delete(f"http://localhost:8000/sessions/{session_id}")
+        except requests.exceptions.RequestException:
+            # Unreachable server: the session expires there on its own
+            pass
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = ChatApplication(root)
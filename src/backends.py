@@ -0,0 +1,448 @@
+import os
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Dict, Any, List
+from urllib.parse import quote
+import numpy
+import pool
+
+# Engine behind the catalog and selectSQL: "sqlite", "duckdb" or "odbc"
+BackendName = os.environ.get("DB_BACKEND", "sqlite").lower()
+# Engine for the full-table profiling scans; DuckDB runs them vectorized over a columnar copy
+ProfileBackendName = os.environ.get("PROFILE_BACKEND", BackendName).lower()
+
+# ":memory:" keeps the DuckDB copy in memory; a file path keeps it across restarts
+DuckDbPath = os.environ.get("DUCKDB_PATH", ":memory:")
+DuckDbThreads = int(os.environ.get("DUCKDB_THREADS", "0"))
+DuckDbCopyChunkRows = int(os.environ.get("DUCKDB_COPY_CHUNK_ROWS", "100000"))
+
+OdbcConnectionString = os.environ.get("DB_ODBC_CONNECTION_STRING", "")
+# Serve the odbc backend from the SQLite file through OdbcStandIn instead of pyodbc (local testing)
+OdbcUseStandIn = os.environ.get("DB_ODBC_STANDIN", "0") == "1"
+
+
+class Backend:
+    """
+    One database engine: its connection pool, catalog introspection, identifier quoting
+    and row-limit syntax. Subclasses override what their dialect does differently.
+    """
+
+    Name = None
+    # Keyset pagination and the index advisor rely on SQLite's rowid
+    SupportsRowid = False
+    # querySQL relies on SQLite's authorizer to stay read-only
+    SupportsReadOnlyQueries = False
+
+    def GetPool(self) -> pool.ConnectionPool:
+        raise NotImplementedError
+
+    @contextmanager
+    def Acquire(self):
+        with self.GetPool().Acquire() as Connection:
+            yield Connection
+
+    def QuoteIdentifier(self, Name: str) -> str:
+        return '"' + Name.replace('"', '""') + '"'
+
+    def LimitClause(self, Limit: int, Offset: int = 0, Ordered: bool = False) -> str:
+        Clause = f" LIMIT {int(Limit)}"
+        if Offset:
+            Clause += f" OFFSET {int(Offset)}"
+        return Clause
+
+    def ListTables(self, Connection) -> List[str]:
+        raise NotImplementedError
+
+    def TableColumns(self, Connection, TableName: str) -> List[str]:
+        raise NotImplementedError
+
+    def SchemaVersion(self, Connection) -> int:
+        return 0
+
+    def NumericValue(self, Quoted: str) -> str:
+        """Expression giving the column's value when it is a number and NULL otherwise."""
+        return f"CASE WHEN typeof({Quoted}) IN ('integer', 'real') THEN {Quoted} END"
+
+    def IsBlankText(self, Quoted: str) -> str:
+        """Expression that is 1 for empty or whitespace-only text and 0 otherwise."""
+        return f"CASE WHEN typeof({Quoted}) = 'text' AND trim({Quoted}) = '' THEN 1 ELSE 0 END"
+
+    def FetchMatrix(self, Cursor, Width: int) -> numpy.ndarray:
+        """The remaining rows of Cursor as a float matrix, NULLs as NaN."""
+        return numpy.array(Cursor.fetchall(), dtype=float).reshape(-1, Width)
+
+    def Stats(self) -> Dict[str, Any]:
+        return dict(self.GetPool().Stats(), backend=self.Name)
+
+    def Close(self):
+        pass
+
+
+class SqliteBackend(Backend):
+    """The ingested SQLite file, through the read-only pool of pool.py."""
+
+    Name = "sqlite"
+    SupportsRowid = True
+    SupportsReadOnlyQueries = True
+
+    def GetPool(self) -> pool.ConnectionPool:
+        return pool.GetPool()
+
+    def ListTables(self, Connection) -> List[str]:
+        return [Row[0] for Row in Connection.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()]
+
+    def TableColumns(self, Connection, TableName: str) -> List[str]:
+        return [Row[1] for Row in Connection.execute(f"PRAGMA table_info({self.QuoteIdentifier(TableName)})").fetchall()]
+
+    def SchemaVersion(self, Connection) -> int:
+        return Connection.execute("PRAGMA schema_version").fetchone()[0]
+
+    def Close(self):
+        pool.ClosePool()
+
+
+class DuckDbPool(pool.ConnectionPool):
+    """Cursors of one DuckDB database; each cursor is an independent connection to it."""
+
+    def __init__(self, Database, Path: str):
+        super().__init__(Path)
+        self.Database = Database
+
+    def Connect(self):
+        return self.Database.cursor()
+
+    def CheckReady(self):
+        pass
+
+    def Reset(self, Connection):
+        pass
+
+
+class DuckDbBackend(Backend):
+    """
+    Embedded DuckDB holding a columnar copy of the SQLite tables, refreshed whenever the
+    SQLite file changes. Needs the optional duckdb package.
+    """
+
+    Name = "duckdb"
+
+    def __init__(self, SourcePath: str = None, Path: str = DuckDbPath):
+        try:
+            import duckdb
+        except ImportError:
+            raise RuntimeError("The duckdb backend needs the duckdb package (pip install duckdb)")
+        self.SourcePath = SourcePath or pool.DatabasePath
+        self.Database = duckdb.connect(Path)
+        if DuckDbThreads:
+            self.Database.execute(f"SET threads = {DuckDbThreads}")
+        self.Pool = DuckDbPool(self.Database, Path)
+        self.CopiedVersion = None
+        self.CopyLock = threading.Lock()
+
+    def GetPool(self) -> pool.ConnectionPool:
+        return self.Pool
+
+    def SourceVersion(self):
+        import catalog
+        Stat = os.stat(self.SourcePath)
+        # Indexes aren't copied, so the advisor building one is no reason to copy again
+        return catalog.DataFileVersion((Stat.st_mtime_ns, Stat.st_size))
+
+    def Refresh(self):
+        """
+        Copies the user tables of the SQLite file into DuckDB when the file changed since the
+        last copy. Server bookkeeping (statistics, samples, ingest state) is never queried
+        through DuckDB and stays behind.
+        """
+        Version = self.SourceVersion()
+        if Version == self.CopiedVersion:
+            return
+        with self.CopyLock:
+            if Version == self.CopiedVersion:
+                return
+            import pandas
+            import catalog
+            Source = sqlite3.connect("file:" + quote(os.path.abspath(self.SourcePath)) + "?mode=ro", uri=True)
+            Writer = self.Database.cursor()
+            try:
+                Tables = [TableName for TableName in SqliteBackend().ListTables(Source) if not catalog.IsInternalTable(TableName)]
+                for TableName in Tables:
+                    Quoted = self.QuoteIdentifier(TableName)
+                    Staging = self.QuoteIdentifier(f"__copy_{TableName}")
+                    Writer.execute(f"DROP TABLE IF EXISTS {Staging}")
+                    Created = False
+                    for Chunk in pandas.read_sql_query(f"SELECT * FROM {Quoted}", Source, chunksize=DuckDbCopyChunkRows):
+                        Writer.register("__chunk", Chunk)
+                        Writer.execute(f"INSERT INTO {Staging} SELECT * FROM __chunk" if Created
+                                       else f"CREATE TABLE {Staging} AS SELECT * FROM __chunk")
+                        Writer.unregister("__chunk")
+                        Created = True
+                    if not Created:
+                        Writer.register("__chunk", pandas.read_sql_query(f"SELECT * FROM {Quoted} LIMIT 0", Source))
+                        Writer.execute(f"CREATE TABLE {Staging} AS SELECT * FROM __chunk")
+                        Writer.unregister("__chunk")
+                    # Readers see either the old or the new copy, never a half-filled one
+                    Writer.execute("BEGIN TRANSACTION")
+                    Writer.execute(f"DROP TABLE IF EXISTS {Quoted}")
+                    Writer.execute(f"ALTER TABLE {Staging} RENAME TO {Quoted}")
+                    Writer.execute("COMMIT")
+                for TableName in set(self.ListTables(Writer)) - set(Tables):
+                    Writer.execute(f"DROP TABLE IF EXISTS {self.QuoteIdentifier(TableName)}")
+            finally:
+                Writer.close()
+                Source.close()
+            self.CopiedVersion = Version
+
+    @contextmanager
+    def Acquire(self):
+        self.Refresh()
+        with self.Pool.Acquire() as Connection:
+            yield Connection
+
+    def ListTables(self, Connection) -> List[str]:
+        Rows = Connection.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = 'main' "
+                                  "ORDER BY table_name").fetchall()
+        return [Row[0] for Row in Rows if not Row[0].startswith("__copy_")]
+
+    def TableColumns(self, Connection, TableName: str) -> List[str]:
+        Rows = Connection.execute("SELECT column_name FROM information_schema.columns WHERE table_schema = 'main' "
+                                  "AND table_name = ? ORDER BY ordinal_position", [TableName]).fetchall()
+        return [Row[0] for Row in Rows]
+
+    def NumericValue(self, Quoted: str) -> str:
+        # Columns are typed here, so typeof() is constant per column
+        return (f"CASE WHEN typeof({Quoted}) IN ('TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'HUGEINT', 'FLOAT', "
+                f"'DOUBLE') OR typeof({Quoted}) LIKE 'DECIMAL%' THEN CAST({Quoted} AS DOUBLE) END")
+
+    def IsBlankText(self, Quoted: str) -> str:
+        return f"CASE WHEN typeof({Quoted}) = 'VARCHAR' AND trim(CAST({Quoted} AS VARCHAR)) = '' THEN 1 ELSE 0 END"
+
+    def FetchMatrix(self, Cursor, Width: int) -> numpy.ndarray:
+        # Columnar fetch: one array per column instead of a Python tuple per row
+        Columns = list(Cursor.fetchnumpy().values())
+        if not Columns:
+            return numpy.empty((0, Width))
+        return numpy.column_stack([numpy.ma.filled(numpy.ma.asarray(Column).astype(float), numpy.nan)
+                                   for Column in Columns])
+
+    def Stats(self) -> Dict[str, Any]:
+        return dict(super().Stats(), source=self.SourcePath, copied_version=self.CopiedVersion)
+
+    def Close(self):
+        self.Pool.Close()
+        self.Database.close()
+
+
+class OdbcPool(pool.ConnectionPool):
+    def __init__(self, Module, ConnectionString: str):
+        # The connection string may hold credentials; only the server part is shown in the stats
+        Server = re.search(r"(?i)(?:server|dsn)=([^;]*)", ConnectionString)
+        super().__init__(f"odbc:{Server.group(1) if Server else '?'}")
+        self.Module = Module
+        self.ConnectionString = ConnectionString
+
+    def Connect(self):
+        return self.Module.connect(self.ConnectionString, autocommit=True, readonly=True)
+
+    def CheckReady(self):
+        pass
+
+    def Reset(self, Connection):
+        pass
+
+
+class OdbcBackend(Backend):
+    """
+    A SQL Server (or any ODBC source) through pyodbc. Introspection uses the ODBC catalog
+    functions, so it works without access to INFORMATION_SCHEMA.
+    """
+
+    Name = "odbc"
+    ExcludedSchemas = ("sys", "INFORMATION_SCHEMA")
+
+    def __init__(self, ConnectionString: str = OdbcConnectionString, Module=None):
+        if Module is None:
+            if OdbcUseStandIn:
+                Module = OdbcStandIn
+            else:
+                try:
+                    import pyodbc as Module
+                except ImportError:
+                    raise RuntimeError("The odbc backend needs the pyodbc package and an ODBC driver")
+        if not ConnectionString and Module is not OdbcStandIn:
+            raise RuntimeError("DB_ODBC_CONNECTION_STRING is not set")
+        self.Pool = OdbcPool(Module, ConnectionString)
+
+    def GetPool(self) -> pool.ConnectionPool:
+        return self.Pool
+
+    def QuoteIdentifier(self, Name: str) -> str:
+        return "[" + Name.replace("]", "]]") + "]"
+
+    def LimitClause(self, Limit: int, Offset: int = 0, Ordered: bool = False) -> str:
+        # OFFSET/FETCH needs an ORDER BY; ordering by a constant keeps the server's order
+        Clause = "" if Ordered else " ORDER BY (SELECT NULL)"
+        return Clause + f" OFFSET {int(Offset or 0)} ROWS FETCH NEXT {int(Limit)} ROWS ONLY"
+
+    def ListTables(self, Connection) -> List[str]:
+        Cursor = Connection.cursor()
+        try:
+            return [Row.table_name for Row in Cursor.tables(tableType="TABLE").fetchall()
+                    if Row.table_schem not in self.ExcludedSchemas]
+        finally:
+            Cursor.close()
+
+    def TableColumns(self, Connection, TableName: str) -> List[str]:
+        Cursor = Connection.cursor()
+        try:
+            Rows = Cursor.columns(table=TableName).fetchall()
+            return [Row.column_name for Row in sorted(Rows, key=lambda Row: Row.ordinal_position)]
+        finally:
+            Cursor.close()
+
+    def NumericValue(self, Quoted: str) -> str:
+        return f"TRY_CAST({Quoted} AS FLOAT)"
+
+    def IsBlankText(self, Quoted: str) -> str:
+        return f"CASE WHEN LTRIM(RTRIM(CAST({Quoted} AS NVARCHAR(MAX)))) = '' THEN 1 ELSE 0 END"
+
+    def Close(self):
+        self.Pool.Close()
+
+
+TableRow = namedtuple("TableRow", "table_cat table_schem table_name table_type remarks")
+ColumnRow = namedtuple("ColumnRow", "table_name column_name type_name ordinal_position")
+
+
+class OdbcStandInCursor:
+    """The slice of the pyodbc cursor API the odbc backend uses, over sqlite3."""
+
+    # The T-SQL the odbc backend generates, in SQLite's dialect; SQLite reads [brackets] and
+    # ORDER BY (SELECT NULL) as they are
+    Rewrites = [
+        (re.compile(r"\s+OFFSET\s+(\d+)\s+ROWS\s+FETCH\s+NEXT\s+(\d+)\s+ROWS\s+ONLY", re.IGNORECASE), r" LIMIT \2 OFFSET \1"),
+        (re.compile(r"TRY_CAST\((\[[^\]]*(?:\]\][^\]]*)*\]) AS FLOAT\)"), r"CASE WHEN typeof(\1) IN ('integer', 'real') THEN \1 END"),
+        (re.compile(r"AS NVARCHAR\(MAX\)\)"), "AS TEXT)")
+    ]
+
+    def __init__(self, Connection: sqlite3.Connection):
+        self.Connection = Connection
+        self.Cursor = Connection.cursor()
+        self.Rows = None
+
+    @property
+    def description(self):
+        return self.Cursor.description if self.Rows is None else None
+
+    def execute(self, Sql: str, *Parameters):
+        if len(Parameters) == 1 and isinstance(Parameters[0], (list, tuple)):
+            Parameters = Parameters[0]
+        for Pattern, Replacement in self.Rewrites:
+            Sql = Pattern.sub(Replacement, Sql)
+        self.Rows = None
+        self.Cursor.execute(Sql, list(Parameters))
+        return self
+
+    def tables(self, tableType: str = None):
+        Names = SqliteBackend().ListTables(self.Connection)
+        self.Rows = [TableRow(None, "dbo", Name, "TABLE", None) for Name in Names]
+        return self
+
+    def columns(self, table: str = None):
+        Rows = self.Connection.execute(f'PRAGMA table_info("{table}")').fetchall()
+        self.Rows = [ColumnRow(table, Row[1], Row[2], Row[0] + 1) for Row in Rows]
+        return self
+
+    def fetchone(self):
+        if self.Rows is not None:
+            return self.Rows.pop(0) if self.Rows else None
+        return self.Cursor.fetchone()
+
+    def fetchmany(self, Size: int):
+        if self.Rows is not None:
+            Batch, self.Rows = self.Rows[:Size], self.Rows[Size:]
+            return Batch
+        return self.Cursor.fetchmany(Size)
+
+    def fetchall(self):
+        if self.Rows is not None:
+            Batch, self.Rows = self.Rows, []
+            return Batch
+        return self.Cursor.fetchall()
+
+    def close(self):
+        self.Cursor.close()
+
+
+class OdbcStandInConnection:
+    def __init__(self, Path: str):
+        self.Connection = sqlite3.connect("file:" + quote(os.path.abspath(Path)) + "?mode=ro", uri=True,
+                                          check_same_thread=False)
+        # pyodbc's query timeout in seconds; accepted and ignored here
+        self.timeout = 0
+
+    def cursor(self):
+        return OdbcStandInCursor(self.Connection)
+
+    def close(self):
+        self.Connection.close()
+
+
+class OdbcStandIn:
+    """
+    Stands in for the pyodbc module when DB_ODBC_STANDIN=1: "connects" to the SQLite file
+    named by Database= in the connection string (DATABASE_PATH by default), so the odbc
+    backend's pooling, introspection, quoting and OFFSET/FETCH paging run without a server.
+    """
+
+    @staticmethod
+    def connect(ConnectionString: str, autocommit: bool = False, readonly: bool = False):
+        Match = re.search(r"(?i)database=([^;]*)", ConnectionString or "")
+        return OdbcStandInConnection(Match.group(1) if Match else pool.DatabasePath)
+
+
+Backends = {
+    "sqlite": SqliteBackend,
+    "duckdb": DuckDbBackend,
+    "odbc": OdbcBackend
+}
+
+_Instances = {}
+_InstancesLock = threading.Lock()
+
+
+def GetBackend(Name: str = None) -> Backend:
+    Name = (Name or BackendName).lower()
+    Instance = _Instances.get(Name)
+    if Instance is None:
+        with _InstancesLock:
+            Instance = _Instances.get(Name)
+            if Instance is None:
+                if Name not in Backends:
+                    raise RuntimeError(f"Unknown database backend '{Name}'. Available: {sorted(Backends)}")
+                Instance = _Instances[Name] = Backends[Name]()
+    return Instance
+
+
+def GetProfileBackend() -> Backend:
+    return GetBackend(ProfileBackendName)
+
+
+def Stats() -> Dict[str, Any]:
+    Report = {"backend": BackendName, "profile_backend": ProfileBackendName, "pools": {}}
+    for Name, Instance in list(_Instances.items()):
+        try:
+            Report["pools"][Name] = Instance.Stats()
+        except RuntimeError as E:
+            Report["pools"][Name] = {"error": str(E)}
+    return Report
+
+
+def CloseBackends():
+    with _InstancesLock:
+        for Instance in _Instances.values():
+            Instance.Close()
+        _Instances.clear()
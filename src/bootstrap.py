@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any
+import tools
+
+Logger = logging.getLogger(__name__)
+
+# How long a request waits for the initial load before it is answered with 503
+ReadyWaitTimeout = float(os.environ.get("BOOTSTRAP_WAIT", "5"))
+
+State = {
+    "status": "pending",
+    "error": None,
+    "started_at": None,
+    "finished_at": None,
+    "seconds": None,
+    "report": None
+}
+
+_RunLock = threading.Lock()
+_Ready = threading.Event()
+
+
+def Start(Rebuild: bool = False, Full: bool = False) -> bool:
+    """
+    Loads (or with Rebuild, re-ingests; from scratch with Full) the database on a background
+    thread. Only one load runs at a time; returns False when one is already in progress.
+    """
+    if not _RunLock.acquire(blocking=False):
+        return False
+
+    State.update({
+        "status": "reloading" if _Ready.is_set() else "loading",
+        "error": None,
+        "started_at": time.time(),
+        "finished_at": None,
+        "seconds": None,
+        "report": None
+    })
+    threading.Thread(target=Run, args=(Rebuild, Full), name="db-bootstrap", daemon=True).start()
+    return True
+
+
+def Run(Rebuild: bool, Full: bool = False):
+    Started = time.perf_counter()
+    try:
+        State["report"] = tools.InitializeDatabase(Rebuild, Full)
+        _Ready.set()
+        State["status"] = "ready"
+    except Exception as E:
+        Logger.exception("Database bootstrap failed")
+        State["error"] = str(E)
+        # A failed re-ingest leaves the previous database in place
+        State["status"] = "ready" if _Ready.is_set() else "failed"
+    finally:
+        State["finished_at"] = time.time()
+        State["seconds"] = round(time.perf_counter() - Started, 3)
+        _RunLock.release()
+
+
+def IsReady() -> bool:
+    return _Ready.is_set()
+
+
+async def WaitUntilReady(Timeout: float = ReadyWaitTimeout) -> bool:
+    if _Ready.is_set():
+        return True
+    # Poll rather than park a thread per waiting request
+    Deadline = time.monotonic() + Timeout
+    while not _Ready.is_set() and State["status"] != "failed" and time.monotonic() < Deadline:
+        await asyncio.sleep(0.05)
+    return _Ready.is_set()
+
+
+def Status() -> Dict[str, Any]:
+    return dict(State, ready=_Ready.is_set())
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL and a bound on the total (JSON-encoded)
+    size of the stored values.
+    """
+
+    def __init__(self, Name: str, MaxEntries: int, MaxBytes: int, TtlSeconds: float):
+        self.Name = Name
+        self.MaxEntries = MaxEntries
+        self.MaxBytes = MaxBytes
+        self.TtlSeconds = TtlSeconds
+        self.Entries = OrderedDict()
+        self.Lock = threading.Lock()
+        self.Bytes = 0
+        self.Hits = 0
+        self.Misses = 0
+        self.Evictions = 0
+        self.Expirations = 0
+
+    def Get(self, Key: Any) -> Tuple[bool, Any]:
+        with self.Lock:
+            Entry = self.Entries.get(Key)
+            if Entry is None:
+                self.Misses += 1
+                return False, None
+
+            Value, Size, ExpiresAt = Entry
+            if ExpiresAt < time.monotonic():
+                self.Remove(Key)
+                self.Expirations += 1
+                self.Misses += 1
+                return False, None
+
+            self.Entries.move_to_end(Key)
+            self.Hits += 1
+            return True, Value
+
+    def Put(self, Key: Any, Value: Any):
+        Size = len(json.dumps(Value, default=str))
+        if Size > self.MaxBytes:
+            return
+
+        with self.Lock:
+            if Key in self.Entries:
+                self.Remove(Key)
+            self.Entries[Key] = (Value, Size, time.monotonic() + self.TtlSeconds)
+            self.Bytes += Size
+
+            while len(self.Entries) > self.MaxEntries or self.Bytes > self.MaxBytes:
+                OldestKey = next(iter(self.Entries))
+                self.Remove(OldestKey)
+                self.Evictions += 1
+
+    def Remove(self, Key: Any):
+        # Caller holds the lock
+        _, Size, _ = self.Entries.pop(Key)
+        self.Bytes -= Size
+
+    def Clear(self):
+        with self.Lock:
+            self.Entries.clear()
+            self.Bytes = 0
+
+    def Stats(self) -> Dict[str, Any]:
+        with self.Lock:
+            Lookups = self.Hits + self.Misses
+            return {
+                "entries": len(self.Entries),
+                "bytes": self.Bytes,
+                "max_entries": self.MaxEntries,
+                "max_bytes": self.MaxBytes,
+                "ttl_seconds": self.TtlSeconds,
+                "hits": self.Hits,
+                "misses": self.Misses,
+                "hit_ratio": round(self.Hits / Lookups, 4) if Lookups else 0.0,
+                "evictions": self.Evictions,
+                "expirations": self.Expirations
+            }
+
+
+# Level 1: ExecuteSQL results keyed on the normalized query and the database version
+QueryCache = ResultCache(
+    "query",
+    MaxEntries=int(os.environ.get("QUERY_CACHE_ENTRIES", "1024")),
+    MaxBytes=int(os.environ.get("QUERY_CACHE_BYTES", str(16 * 1024 * 1024))),
+    TtlSeconds=float(os.environ.get("QUERY_CACHE_TTL", "3600"))
+)
+
+# Level 2: final chat answers keyed on the normalized conversation suffix
+AnswerCache = ResultCache(
+    "answer",
+    MaxEntries=int(os.environ.get("ANSWER_CACHE_ENTRIES", "256")),
+    MaxBytes=int(os.environ.get("ANSWER_CACHE_BYTES", str(4 * 1024 * 1024))),
+    TtlSeconds=float(os.environ.get("ANSWER_CACHE_TTL", "900"))
+)
+
+# Pagination state behind the opaque next_cursor tokens of selectSQL results
+CursorStore = ResultCache(
+    "cursor",
+    MaxEntries=int(os.environ.get("CURSOR_STORE_ENTRIES", "4096")),
+    MaxBytes=int(os.environ.get("CURSOR_STORE_BYTES", str(4 * 1024 * 1024))),
+    TtlSeconds=float(os.environ.get("CURSOR_STORE_TTL", "900"))
+)
+
+AnswerSuffixMessages = int(os.environ.get("ANSWER_CACHE_SUFFIX_MESSAGES", "3"))
+
+Caches = [QueryCache, AnswerCache, CursorStore]
+
+
+def NormalizeText(Text: str) -> str:
+    # Only whitespace is collapsed: case can matter ('Status = "Open"' vs 'status = "open"')
+    return " ".join((Text or "").split())
+
+
+def ConversationKey(Messages, DataVersion) -> str:
+    """
+    Hashes the system instructions plus the last few user/assistant turns; earlier
+    turns rarely change the answer to the latest question.
+    """
+    System = [NormalizeText(Message.get("content")) for Message in Messages if Message.get("role") == "system"]
+    Dialogue = [(Message["role"], NormalizeText(Message.get("content"))) for Message in Messages
+                if Message.get("role") in ("user", "assistant") and Message.get("content")]
+    Payload = json.dumps([System, Dialogue[-AnswerSuffixMessages:], list(DataVersion)], default=str)
+    return hashlib.sha256(Payload.encode("utf-8")).hexdigest()
+
+
+def InvalidateAll():
+    for Cache in Caches:
+        Cache.Clear()
+
+
+def Stats() -> Dict[str, Any]:
+    return {Cache.Name: Cache.Stats() for Cache in Caches}
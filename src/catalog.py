@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+from typing import Dict, List, Any, Callable, Tuple
+import pool
+import backends
+import tracing
+
+SchemaPath = os.environ.get("SCHEMA_PATH", "db_schema.json")
+
+
+class SchemaCatalog:
+    """
+    In-memory snapshot of the database tables and columns, built once and shared by
+    every tool call until the database file or db_schema.json changes.
+    """
+
+    def __init__(self, Tables: Dict[str, List[str]], SchemaDocument: Dict[str, Any], Version: Tuple):
+        self.Tables = Tables
+        self.SchemaDocument = SchemaDocument
+        self.Version = Version
+
+        self.TableNames = list(Tables.keys())
+        self.ColumnsLower = {Table: {Column.lower() for Column in Columns} for Table, Columns in Tables.items()}
+        self.ColumnsByLower = {Table: {Column.lower(): Column for Column in Columns} for Table, Columns in Tables.items()}
+
+        UniqueColumns = list(dict.fromkeys(Column for Columns in Tables.values() for Column in Columns))
+        # Longest names first so "Clearing Date" wins over a shorter "Date"
+        self.SortedColumns = sorted(UniqueColumns, key=len, reverse=True)
+
+        self.Memo = {}
+        # Re-entrant: memoized values may be built from other memoized values
+        self.MemoLock = threading.RLock()
+
+    def HasTable(self, TableName: str) -> bool:
+        return TableName in self.Tables
+
+    def Memoize(self, Key: str, Factory: Callable[[], Any]) -> Any:
+        """Caches values derived from this catalog, e.g. the tool schema or column lexicons."""
+        if Key in self.Memo:
+            return self.Memo[Key]
+        with self.MemoLock:
+            if Key not in self.Memo:
+                self.Memo[Key] = Factory()
+            return self.Memo[Key]
+
+
+def IsInternalTable(TableName: str) -> bool:
+    # Server bookkeeping (column statistics etc.) is prefixed with "_" and hidden from the model
+    return TableName.startswith("_") or TableName.startswith("sqlite_")
+
+
+def FileVersion(Path: str) -> Tuple:
+    try:
+        Stat = os.stat(Path)
+        return (Stat.st_mtime_ns, Stat.st_size)
+    except FileNotFoundError:
+        return (None, None)
+
+
+def LoadSchemaDocument() -> Dict[str, Any]:
+    try:
+        with open(SchemaPath, 'r') as File:
+            return json.load(File)
+    except FileNotFoundError:
+        return {
+            "description": "Database schema information",
+            "tables": {}
+        }
+
+
+def BuildCatalog(Connection, Version: Tuple) -> SchemaCatalog:
+    Backend = backends.GetBackend()
+    SchemaVersion = Backend.SchemaVersion(Connection)
+    TableNames = [TableName for TableName in Backend.ListTables(Connection) if not IsInternalTable(TableName)]
+    Tables = {TableName: Backend.TableColumns(Connection, TableName) for TableName in TableNames}
+    return SchemaCatalog(Tables, LoadSchemaDocument(), Version + (SchemaVersion,))
+
+
+_Catalog = None
+_CatalogLock = threading.Lock()
+# Database file versions left by the index advisor, mapped to the version before its write: an
+# index changes no rows, so the catalog and the caches and cursors keyed on its Version stay valid
+_IndexWrites = {}
+
+
+def NoteIndexWrite(Before: Tuple, After: Tuple):
+    _IndexWrites[After] = _IndexWrites.get(Before, Before)
+
+
+def DataFileVersion(Version: Tuple) -> Tuple:
+    """The database file version, ignoring the index advisor's own writes."""
+    return _IndexWrites.get(Version, Version)
+
+
+def CurrentFileVersion() -> Tuple:
+    return DataFileVersion(FileVersion(pool.DatabasePath)) + FileVersion(SchemaPath)
+
+
+def GetCatalog(Connection=None) -> SchemaCatalog:
+    global _Catalog
+    Version = CurrentFileVersion()
+    Catalog = _Catalog
+    if Catalog is not None and Catalog.Version[:-1] == Version:
+        return Catalog
+
+    with _CatalogLock:
+        Catalog = _Catalog
+        if Catalog is not None and Catalog.Version[:-1] == Version:
+            return Catalog
+
+        with tracing.Span("catalog.load"):
+            if Connection is None:
+                with backends.GetBackend().Acquire() as PooledConnection:
+                    Catalog = BuildCatalog(PooledConnection, Version)
+            else:
+                Catalog = BuildCatalog(Connection, Version)
+
+        _Catalog = Catalog
+        return Catalog
+
+
+def InvalidateCatalog():
+    global _Catalog
+    with _CatalogLock:
+        _Catalog = None
+
+
+def ReloadCatalog() -> SchemaCatalog:
+    InvalidateCatalog()
+    return GetCatalog()
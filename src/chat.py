@@ -0,0 +1,349 @@
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any
+import tools
+import catalog
+import cache
+import profiling
+import prompt
+import encoding
+import guards
+import tracing
+
+ChatModel = "gpt-4o-mini"
+
+# Tool calls are SQLite work; keep them off the event loop on a bounded pool
+ToolWorkers = int(os.environ.get("CHAT_TOOL_WORKERS", "8"))
+MaxConcurrentChats = int(os.environ.get("CHAT_MAX_CONCURRENT", "32"))
+ChatQueueTimeout = float(os.environ.get("CHAT_QUEUE_TIMEOUT", "10"))
+ChatTimeout = float(os.environ.get("CHAT_TIMEOUT", "120"))
+
+# batchSQL fans out on its own pool: sub-queries waiting on ToolExecutor could deadlock the batch holding it
+BatchWorkers = int(os.environ.get("BATCH_WORKERS", "4"))
+
+ToolExecutor = ThreadPoolExecutor(max_workers=ToolWorkers, thread_name_prefix="sql-tool")
+BatchExecutor = ThreadPoolExecutor(max_workers=BatchWorkers, thread_name_prefix="sql-batch")
+ChatSlots = asyncio.Semaphore(MaxConcurrentChats)
+
+
+class ChatBusyError(Exception):
+    pass
+
+
+@asynccontextmanager
+async def ConversationSlot():
+    try:
+        await asyncio.wait_for(ChatSlots.acquire(), ChatQueueTimeout)
+    except asyncio.TimeoutError:
+        raise ChatBusyError(f"Too many concurrent conversations (limit {MaxConcurrentChats})")
+    try:
+        yield
+    finally:
+        ChatSlots.release()
+
+
+def RunToolCall(FunctionName: str, Arguments: Dict[str, Any]) -> Any:
+    if FunctionName == "selectSQL":
+        try:
+            TableName = Arguments.get("TableName")
+            Columns = Arguments.get("Columns")
+            WhereClause = Arguments.get("WhereClause")
+            OrderBy = Arguments.get("OrderBy")
+
+            return tools.ExecuteSQL(
+                TableName=TableName,
+                Columns=Columns,
+                WhereClause=WhereClause,
+                OrderBy=OrderBy,
+                Limit=Arguments.get("Limit"),
+                Offset=Arguments.get("Offset"),
+                Cursor=Arguments.get("Cursor")
+            )
+        except guards.QueryCancelled as e:
+            # Structured, so the model can retry with a cheaper query instead of giving up
+            return e.ToError()
+        except ValueError as e:
+            # Return the error to the agent so it can correct itself
+            return {"error": f"Validation Error: {str(e)}. Please check your column names and make sure they exactly match the available columns in the database schema."}
+        except Exception as e:
+            # Return general error to the agent
+            return {"error": f"Error executing query: {str(e)}. Please verify your SQL syntax and make sure you're using valid column names from the schema."}
+
+    if FunctionName == "querySQL":
+        try:
+            return tools.ExecuteQuery(
+                Sql=Arguments.get("Sql"),
+                Limit=Arguments.get("Limit"),
+                Offset=Arguments.get("Offset"),
+                Cursor=Arguments.get("Cursor"),
+                Exact=bool(Arguments.get("Exact", False))
+            )
+        except guards.QueryCancelled as e:
+            return e.ToError()
+        except ValueError as e:
+            return {"error": f"Validation Error: {str(e)}."}
+        except Exception as e:
+            return {"error": f"Error executing query: {str(e)}."}
+
+    if FunctionName == "profileColumns":
+        try:
+            return profiling.ProfileColumns(
+                TableName=Arguments.get("TableName"),
+                Columns=Arguments.get("Columns"),
+                Exact=bool(Arguments.get("Exact", False))
+            )
+        except guards.QueryCancelled as e:
+            return e.ToError()
+        except ValueError as e:
+            return {"error": f"Validation Error: {str(e)}. Please check your column names and make sure they exactly match the available columns in the database schema."}
+        except Exception as e:
+            return {"error": f"Error profiling columns: {str(e)}."}
+
+    if FunctionName == "batchSQL":
+        try:
+            return RunBatch(Arguments.get("Queries"))
+        except ValueError as e:
+            return {"error": f"Validation Error: {str(e)}."}
+
+    return {"error": f"Unknown tool: {FunctionName}"}
+
+
+def RunBatchQuery(Index: int, Query: Dict[str, Any]) -> Any:
+    Tool = Query.get("Tool")
+    with tracing.Span("batch." + str(Tool), index=Index) as Span:
+        if Tool == "batchSQL" or not isinstance(Query.get("Arguments", {}), dict):
+            Result = {"error": "Validation Error: each sub-query needs a Tool other than batchSQL and an Arguments object."}
+        else:
+            Result = RunToolCall(Tool, Query.get("Arguments") or {})
+        Span.update(SummarizeToolResult(Result))
+    return Result
+
+
+def RunBatch(Queries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Runs the sub-queries in parallel, each on its own pooled read connection, and returns
+    their results in the order they were given. Every sub-query runs under a copy of the
+    caller's context, so the budget, the cancel event and the trace apply to all of them.
+    """
+    if not isinstance(Queries, list) or not Queries or not all(isinstance(Query, dict) for Query in Queries):
+        raise ValueError("Queries must be a non-empty list of {Tool, Arguments} objects")
+    if len(Queries) > tools.MaxBatchQueries:
+        raise ValueError(f"A batch holds at most {tools.MaxBatchQueries} queries, got {len(Queries)}; split it")
+
+    Started = time.perf_counter()
+    Futures = [BatchExecutor.submit(contextvars.copy_context().run, RunBatchQuery, Index, Query)
+               for Index, Query in enumerate(Queries)]
+    Results = []
+    for Index, (Query, Future) in enumerate(zip(Queries, Futures)):
+        Tool = Query.get("Tool")
+        Results.append({"label": Query.get("Label") or f"{Tool} #{Index + 1}", "tool": Tool, "result": Future.result()})
+    return {"batch": Results, "elapsed_ms": round((time.perf_counter() - Started) * 1000, 3)}
+
+
+def SummarizeToolResult(ToolResult: Any) -> Dict[str, Any]:
+    if isinstance(ToolResult, dict) and "error" in ToolResult:
+        return {"error": ToolResult["error"]}
+    if encoding.IsResultSet(ToolResult):
+        return {"rows": ToolResult["row_count"], "truncated": ToolResult["truncated"]}
+    if encoding.IsBatchResult(ToolResult):
+        Results = [Entry["result"] for Entry in ToolResult["batch"]]
+        return {"queries": len(Results),
+                "failed": sum(1 for Result in Results if isinstance(Result, dict) and "error" in Result)}
+    return {}
+
+
+async def RunToolCallAsync(ToolCall: Dict[str, Any], Cancel: threading.Event = None):
+    FunctionName = ToolCall["function"]["name"]
+    try:
+        Arguments = json.loads(ToolCall["function"]["arguments"] or "{}")
+    except json.JSONDecodeError as e:
+        Arguments = None
+        ToolResult = {"error": f"Invalid tool arguments: {str(e)}"}
+
+    Started = time.perf_counter()
+    with tracing.Span("tool." + FunctionName) as Span:
+        if Arguments is not None:
+            Loop = asyncio.get_running_loop()
+            # A copy of the context carries the current trace into the worker thread
+            Context = contextvars.copy_context()
+            try:
+                ToolResult = await Loop.run_in_executor(ToolExecutor, Context.run, guards.RunWithBudget, "chat",
+                                                        Cancel, RunToolCall, FunctionName, Arguments)
+            except asyncio.CancelledError:
+                # The worker thread keeps running; the progress handler stops its query
+                if Cancel is not None:
+                    Cancel.set()
+                raise
+        Span.update(SummarizeToolResult(ToolResult))
+    ElapsedMs = (time.perf_counter() - Started) * 1000
+
+    ToolResponse = {
+        "tool_call_id": ToolCall["id"],
+        "role": "tool",
+        "name": FunctionName,
+        "content": encoding.EncodeToolResult(ToolResult)
+    }
+    Summary = {"id": ToolCall["id"], "name": FunctionName, "sql_ms": round(ElapsedMs, 3)}
+    Summary.update(SummarizeToolResult(ToolResult))
+    tracing.ToolCallCount.Increment(tool=FunctionName, outcome="error" if "error" in Summary else "ok")
+    if "rows" in Summary:
+        tracing.ToolRows.Observe(Summary["rows"], tool=FunctionName)
+    return ToolResponse, Summary
+
+
+async def CreateCompletion(Client, Messages: List[Dict[str, Any]], Stream: bool):
+    """
+    Yields ("delta", text) events while the completion streams in, ("usage", usage) when
+    the API reports token counts, then one ("completion", (FinishReason, AssistantMessage))
+    event with the assembled message.
+    """
+    if not Stream:
+        Completion = await Client.chat.completions.create(
+            model=ChatModel,
+            messages=Messages,
+            tools=tools.GetToolSchemas()
+        )
+        if getattr(Completion, "usage", None):
+            yield "usage", Completion.usage
+        Choice = Completion.choices[0]
+        yield "completion", (Choice.finish_reason, Choice.message.model_dump(exclude_none=True))
+        return
+
+    Chunks = await Client.chat.completions.create(
+        model=ChatModel,
+        messages=Messages,
+        tools=tools.GetToolSchemas(),
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+
+    Content = []
+    ToolCalls = {}
+    FinishReason = None
+    async for Chunk in Chunks:
+        if getattr(Chunk, "usage", None):
+            yield "usage", Chunk.usage
+        if not Chunk.choices:
+            continue
+        Choice = Chunk.choices[0]
+        Delta = Choice.delta
+        if Delta.content:
+            Content.append(Delta.content)
+            yield "delta", Delta.content
+        for ToolCallDelta in Delta.tool_calls or []:
+            Entry = ToolCalls.setdefault(ToolCallDelta.index, {
+                "id": None,
+                "type": "function",
+                "function": {"name": "", "arguments": ""}
+            })
+            if ToolCallDelta.id:
+                Entry["id"] = ToolCallDelta.id
+            if ToolCallDelta.function:
+                Entry["function"]["name"] += ToolCallDelta.function.name or ""
+                Entry["function"]["arguments"] += ToolCallDelta.function.arguments or ""
+        if Choice.finish_reason:
+            FinishReason = Choice.finish_reason
+
+    AssistantMessage = {"role": "assistant", "content": "".join(Content) or None}
+    if ToolCalls:
+        AssistantMessage["tool_calls"] = [ToolCalls[Index] for Index in sorted(ToolCalls)]
+    yield "completion", (FinishReason, AssistantMessage)
+
+
+async def ConversationEvents(Client, Messages: List[Dict[str, Any]], Stream: bool = False,
+                             Transcript: List[Dict[str, Any]] = None):
+    """
+    Runs the model/tool loop and yields (Event, Data) pairs:
+    "delta" (streamed text), "tool_start", "tool_end" and finally "message", which
+    carries the token report of the request. Given a Transcript list, the assistant and
+    tool messages of the turn are appended to it (for server-side sessions).
+    """
+    if Transcript is None:
+        Transcript = []
+    AnswerKey = cache.ConversationKey(Messages, catalog.GetCatalog().Version)
+    Found, CachedAnswer = cache.AnswerCache.Get(AnswerKey)
+    if Found:
+        Transcript.append({"role": "assistant", "content": CachedAnswer})
+        yield "message", {"content": CachedAnswer, "cached": True}
+        return
+
+    with tracing.Span("prompt.build") as Span:
+        Messages, TokenReport = prompt.PrepareMessages(Messages)
+        Span.update(prompt_tokens=TokenReport["prompt_tokens"], tables=len(TokenReport["tables"]))
+    TokenReport.update({"model_calls": 0, "api_prompt_tokens": 0, "api_completion_tokens": 0})
+    # Set when this conversation is cancelled (client gone, deadline) to stop its running queries
+    Cancel = threading.Event()
+
+    while True:
+        TokenReport["model_calls"] += 1
+        with tracing.Span("llm.completion", call=TokenReport["model_calls"], stream=Stream) as Span:
+            Started = time.perf_counter()
+            async for Event, Data in CreateCompletion(Client, Messages, Stream):
+                if Event == "delta":
+                    Span.setdefault("first_token_ms", round((time.perf_counter() - Started) * 1000, 3))
+                    yield "delta", {"content": Data}
+                elif Event == "usage":
+                    TokenReport["api_prompt_tokens"] += Data.prompt_tokens or 0
+                    TokenReport["api_completion_tokens"] += Data.completion_tokens or 0
+                    Span.update(prompt_tokens=Data.prompt_tokens, completion_tokens=Data.completion_tokens)
+                    tracing.TokenCount.Increment(Data.prompt_tokens or 0, kind="prompt")
+                    tracing.TokenCount.Increment(Data.completion_tokens or 0, kind="completion")
+                else:
+                    FinishReason, AssistantMessage = Data
+                    Span["finish_reason"] = FinishReason
+
+        if FinishReason != "tool_calls":
+            break
+
+        Messages.append(AssistantMessage)
+        Transcript.append(AssistantMessage)
+        ToolCalls = AssistantMessage["tool_calls"]
+        for ToolCall in ToolCalls:
+            yield "tool_start", {
+                "id": ToolCall["id"],
+                "name": ToolCall["function"]["name"],
+                "arguments": ToolCall["function"]["arguments"]
+            }
+
+        # Independent tool calls of one assistant turn run concurrently; gather keeps their order
+        Results = await asyncio.gather(*(RunToolCallAsync(ToolCall, Cancel) for ToolCall in ToolCalls))
+        for ToolResponse, Summary in Results:
+            Messages.append(ToolResponse)
+            Transcript.append(ToolResponse)
+            yield "tool_end", Summary
+
+    if FinishReason == "stop" and AssistantMessage.get("content"):
+        cache.AnswerCache.Put(AnswerKey, AssistantMessage["content"])
+
+    tracing.ToolRounds.Observe(TokenReport["model_calls"] - 1)
+    Transcript.append({"role": "assistant", "content": AssistantMessage.get("content")})
+
+    yield "message", {"content": AssistantMessage.get("content"), "tokens": TokenReport}
+
+
+async def WithDeadline(Events, Timeout: float):
+    Loop = asyncio.get_running_loop()
+    Deadline = Loop.time() + Timeout
+    try:
+        while True:
+            try:
+                Item = await asyncio.wait_for(Events.__anext__(), max(Deadline - Loop.time(), 0))
+            except StopAsyncIteration:
+                return
+            yield Item
+    finally:
+        await Events.aclose()
+
+
+async def RunConversation(Client, Messages: List[Dict[str, Any]], Transcript: List[Dict[str, Any]] = None) -> str:
+    Result = None
+    async for Event, Data in ConversationEvents(Client, Messages, Transcript=Transcript):
+        if Event == "message":
+            Result = Data["content"]
+    return Result
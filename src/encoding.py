@@ -0,0 +1,115 @@
+import json
+import math
+import os
+import re
+from typing import Dict, Any, List, Sequence
+
+# "csv", "markdown" or "json" (header once, rows as arrays)
+ToolResultFormat = os.environ.get("TOOL_RESULT_FORMAT", "csv").lower()
+# Significant digits kept for REAL values; integers are never rounded
+FloatDigits = int(os.environ.get("TOOL_RESULT_FLOAT_DIGITS", "10"))
+
+CsvNeedsQuotes = re.compile(r'[,"\r\n]|^\s|\s$|^$')
+
+
+def FormatValue(Value: Any) -> Any:
+    """Type-aware formatting: REALs lose binary noise (0.30000000000000004 -> 0.3), integral REALs lose ".0"."""
+    if isinstance(Value, float):
+        if not math.isfinite(Value):
+            return None
+        if Value.is_integer() and abs(Value) < 1e15:
+            return int(Value)
+        # The shortest round-trip repr is usually short already; only long ones carry noise
+        if len(repr(Value)) <= FloatDigits + 2:
+            return Value
+        return float(f"{Value:.{FloatDigits}g}")
+    if isinstance(Value, bytes):
+        return Value.hex()
+    return Value
+
+
+def ResultSet(Columns: List[str], Rows: Sequence[Sequence[Any]], Limit: int, **Extra) -> Dict[str, Any]:
+    """The columnar result of a query; Rows may hold one row more than Limit to signal truncation."""
+    Truncated = len(Rows) > Limit
+    Result = {
+        "columns": Columns,
+        # Only REAL and BLOB values need reformatting; TEXT and INTEGER pass through untouched
+        "rows": [[Value if Value is None or type(Value) in (int, str) else FormatValue(Value) for Value in Row]
+                 for Row in Rows[:Limit]],
+        "row_count": min(len(Rows), Limit),
+        "truncated": Truncated,
+        "limit": Limit
+    }
+    Result.update(Extra)
+    return Result
+
+
+def IsResultSet(Value: Any) -> bool:
+    return isinstance(Value, dict) and "columns" in Value and "rows" in Value
+
+
+def Header(Result: Dict[str, Any]) -> str:
+    Line = f"{Result['row_count']} rows"
+    if Result["truncated"]:
+        Line += f" (truncated at limit {Result['limit']})"
+    for Key, Value in Result.items():
+        if Key not in ("columns", "rows", "row_count", "truncated", "limit") and Value not in (None, 0, ""):
+            Line += f"; {Key}={Value}"
+    return Line
+
+
+def CsvCell(Value: Any) -> str:
+    # NULL is an empty field and the empty string is "", so the two stay distinguishable
+    if Value is None:
+        return ""
+    if type(Value) is not str:
+        return str(Value)
+    if CsvNeedsQuotes.search(Value):
+        return '"' + Value.replace('"', '""') + '"'
+    return Value
+
+
+def EncodeCsv(Result: Dict[str, Any]) -> str:
+    Lines = [f"# {Header(Result)}", ",".join(map(CsvCell, Result["columns"]))]
+    Lines += [",".join(map(CsvCell, Row)) for Row in Result["rows"]]
+    return "\n".join(Lines) + "\n"
+
+
+def MarkdownCell(Value: Any) -> str:
+    if Value is None:
+        return "NULL"
+    return str(Value).replace("|", "\\|").replace("\n", " ")
+
+
+def EncodeMarkdown(Result: Dict[str, Any]) -> str:
+    Lines = [Header(Result),
+             "| " + " | ".join(MarkdownCell(Column) for Column in Result["columns"]) + " |",
+             "|" + "---|" * len(Result["columns"])]
+    Lines += ["| " + " | ".join(MarkdownCell(Value) for Value in Row) + " |" for Row in Result["rows"]]
+    return "\n".join(Lines) + "\n"
+
+
+def EncodeJson(Result: Dict[str, Any]) -> str:
+    return json.dumps(Result, separators=(",", ":"), default=str)
+
+
+Encoders = {
+    "csv": EncodeCsv,
+    "markdown": EncodeMarkdown,
+    "json": EncodeJson
+}
+
+
+def IsBatchResult(Value: Any) -> bool:
+    return isinstance(Value, dict) and isinstance(Value.get("batch"), list)
+
+
+def EncodeToolResult(ToolResult: Any, Format: str = None) -> str:
+    """Text for the tool message: query results in the compact format, anything else as JSON."""
+    if IsResultSet(ToolResult):
+        return Encoders.get(Format or ToolResultFormat, EncodeCsv)(ToolResult)
+    if IsBatchResult(ToolResult):
+        # One section per sub-query, each in the format it would have had on its own
+        return "\n\n".join(f"## {Entry['label']} ({Entry['tool']})\n{EncodeToolResult(Entry['result'], Format)}"
+                           for Entry in ToolResult["batch"])
+    return json.dumps(ToolResult, default=str)
@@ -0,0 +1,275 @@
+import csv
+import io
+import os
+import re
+import threading
+from contextlib import ExitStack
+from typing import List, Any, Iterator, Optional
+import backends
+import catalog
+import guards
+import lexer
+import tools
+import tracing
+
+# Rows fetched, encoded and sent per chunk; bounds the memory an export holds at once
+ChunkRows = int(os.environ.get("EXPORT_CHUNK_ROWS", "10000"))
+# Exports hold a pooled connection for as long as the download runs
+MaxConcurrentExports = int(os.environ.get("EXPORT_MAX_CONCURRENT", "2"))
+# Rows per export when the request sets no limit (0 exports everything)
+MaxExportRows = int(os.environ.get("EXPORT_MAX_ROWS", "0"))
+
+Formats = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet")
+}
+
+Slots = threading.BoundedSemaphore(MaxConcurrentExports)
+
+
+class ExportBusyError(Exception):
+    pass
+
+
+class ChunkSink:
+    """Write-only file the Arrow writers encode into; Drain hands over what was written since the last call."""
+
+    def __init__(self):
+        self.Chunks = []
+        self.Position = 0
+        self.closed = False
+
+    def write(self, Data) -> int:
+        self.Chunks.append(bytes(Data))
+        self.Position += len(Data)
+        return len(Data)
+
+    def tell(self) -> int:
+        # Parquet records file offsets in its footer, so the position keeps counting across drains
+        return self.Position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def Drain(self) -> bytes:
+        Data = b"".join(self.Chunks)
+        self.Chunks = []
+        return Data
+
+
+def ImportArrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError("Arrow and Parquet exports require the pyarrow package; use format=csv")
+    return pyarrow
+
+
+def ValueKind(Value: Any) -> Optional[str]:
+    if Value is None:
+        return None
+    if isinstance(Value, bool) or isinstance(Value, int):
+        return "integer"
+    if isinstance(Value, float):
+        return "real"
+    if isinstance(Value, (bytes, bytearray, memoryview)):
+        return "blob"
+    return "text"
+
+
+def DeclaredKind(DeclaredType: str) -> Optional[str]:
+    """
+    The storage class SQLite's type affinity rules give a column declared as DeclaredType
+    ("integer", "real" or "text"), None when its values decide (NUMERIC, BLOB, no type).
+    """
+    DeclaredType = (DeclaredType or "").upper()
+    if "INT" in DeclaredType:
+        return "integer"
+    if any(Name in DeclaredType for Name in ("CHAR", "CLOB", "TEXT")):
+        return "text"
+    if any(Name in DeclaredType for Name in ("REAL", "FLOA", "DOUB")):
+        return "real"
+    return None
+
+
+def ArrowType(pyarrow, Kinds: set):
+    """The narrowest Arrow type holding every storage class a column showed."""
+    if Kinds == {"blob"}:
+        return pyarrow.binary()
+    if not Kinds or "text" in Kinds or "blob" in Kinds:
+        # Nothing seen yet (only NULLs): text holds whatever comes later
+        return pyarrow.string()
+    if "real" in Kinds:
+        return pyarrow.float64()
+    return pyarrow.int64()
+
+
+def ArrowValue(Value: Any, Type) -> Any:
+    # SQLite columns can mix storage classes; the column's Arrow type decides how each value is written
+    if Value is None:
+        return None
+    Name = str(Type)
+    if Name == "string" and not isinstance(Value, str):
+        return Value.hex() if isinstance(Value, (bytes, bytearray, memoryview)) else str(Value)
+    if Name == "int64" and isinstance(Value, float):
+        # pyarrow would truncate 2.5 to 2 without a word
+        if not Value.is_integer():
+            raise TypeError(Value)
+        return int(Value)
+    return Value
+
+
+class Export:
+    """
+    One export: the validated query already running on a pooled connection under the "export"
+    budget. Body() streams it encoded batch by batch; the connection goes back to the pool when
+    the stream ends or is abandoned.
+    """
+
+    def __init__(self, TableName: str, Columns: List[str] = None, WhereClause: str = None,
+                 OrderBy: str = None, Limit: int = None, Format: str = "csv"):
+        Format = (Format or "csv").lower()
+        if Format not in Formats:
+            raise ValueError(f"Unknown export format '{Format}'. Use one of: {list(Formats)}")
+        self.Format = Format
+        self.MediaType, Extension = Formats[Format]
+        self.FileName = re.sub(r"[^\w.-]", "_", TableName or "export") + "." + Extension
+        self.pyarrow = ImportArrow() if Format != "csv" else None
+
+        Catalog = catalog.GetCatalog()
+        if not Catalog.HasTable(TableName):
+            raise ValueError(f"Table '{TableName}' does not exist in the database. Available tables: {Catalog.TableNames}")
+        ValidColumns = Catalog.Tables[TableName]
+        for Column in Columns or []:
+            if Column.strip() not in ValidColumns:
+                Similar = lexer.SimilarColumns(Column.strip(), ValidColumns)
+                Hint = f" Did you mean one of these: {Similar}?" if Similar else ""
+                raise ValueError(f"Column '{Column}' not found in table '{TableName}'.{Hint} Valid columns are: {ValidColumns}")
+        with tracing.Span("sql.validate", table=TableName):
+            if WhereClause:
+                tools.ValidateWhereClause(WhereClause, TableName)
+            if OrderBy:
+                tools.ValidateWhereClause(OrderBy, TableName)
+
+        if Limit is None and MaxExportRows:
+            Limit = MaxExportRows
+        self.Query = tools.BuildSelectQuery(TableName, Columns, WhereClause, OrderBy,
+                                            Limit=max(int(Limit), 0) if Limit is not None else None)
+        self.Backend = backends.GetBackend()
+
+        if not Slots.acquire(blocking=False):
+            raise ExportBusyError(f"{MaxConcurrentExports} exports are already running; try again shortly")
+        self.Resources = ExitStack()
+        self.Resources.callback(Slots.release)
+        try:
+            with tracing.Span("sql.execute", table=TableName, backend=self.Backend.Name, export=Format):
+                self.Connection = self.Resources.enter_context(self.Backend.Acquire())
+                self.Guard = self.Resources.enter_context(guards.Guard(self.Connection, guards.Budgets["export"]))
+                self.Declared = {}
+                if Format != "csv" and self.Backend.Name == "sqlite":
+                    self.Declared = {Row[1]: DeclaredKind(Row[2]) for Row in self.Connection.execute(
+                        f"PRAGMA table_info({self.Backend.QuoteIdentifier(TableName)})").fetchall()}
+                self.Cursor = self.Connection.cursor()
+                self.Cursor.execute(self.Query)
+                self.Columns = [Column[0] for Column in self.Cursor.description]
+        except BaseException as Error:
+            self.Resources.__exit__(type(Error), Error, Error.__traceback__)
+            raise
+        # Started here so that failures before the first byte still get a status code, and so that
+        # dropping an export the client never read closes the generator and releases the connection
+        self.Stream = self.Chunks()
+        self.Head = next(self.Stream)
+
+    def Body(self) -> Iterator[bytes]:
+        yield self.Head
+        try:
+            yield from self.Stream
+        except guards.QueryCancelled as Error:
+            # The status line is long gone; cutting the chunked body short tells the client the file is incomplete
+            raise RuntimeError(f"Export of {self.FileName} stopped: {Error}") from Error
+
+    def Batches(self) -> Iterator[list]:
+        while True:
+            Rows = self.Cursor.fetchmany(ChunkRows)
+            if not Rows:
+                return
+            self.Guard.CheckRows(Rows)
+            yield Rows
+
+    def Chunks(self) -> Iterator[bytes]:
+        with self.Resources:
+            if self.Format == "csv":
+                yield from self.CsvChunks()
+            else:
+                yield from self.ArrowChunks()
+
+    def CsvChunks(self) -> Iterator[bytes]:
+        Buffer = io.StringIO()
+        Writer = csv.writer(Buffer, lineterminator="\n")
+        Writer.writerow(self.Columns)
+        yield Buffer.getvalue().encode("utf-8")
+        for Rows in self.Batches():
+            Buffer.seek(0)
+            Buffer.truncate()
+            Writer.writerows(Rows)
+            yield Buffer.getvalue().encode("utf-8")
+
+    def ArrowChunks(self) -> Iterator[bytes]:
+        pyarrow = self.pyarrow
+        Sink = ChunkSink()
+
+        if self.Backend.Name == "duckdb":
+            # DuckDB hands out Arrow record batches itself, with no per-value conversion in Python
+            Reader = self.Cursor.fetch_record_batch(ChunkRows)
+            Source = iter(Reader)
+            Schema = Reader.schema
+        else:
+            # The declared type and the first batch decide each column's type; the stream's schema
+            # is written before the rest of the rows are read
+            Pending = next(self.Batches(), [])
+            Kinds = []
+            for Index, Name in enumerate(self.Columns):
+                Seen = {Kind for Kind in (ValueKind(Row[Index]) for Row in Pending) if Kind}
+                if self.Declared.get(Name):
+                    Seen.add(self.Declared[Name])
+                Kinds.append(Seen)
+            Schema = pyarrow.schema([(Name, ArrowType(pyarrow, Seen)) for Name, Seen in zip(self.Columns, Kinds)])
+            Source = self.RecordBatches(Schema, Pending)
+
+        if self.Format == "arrow":
+            Writer = pyarrow.ipc.new_stream(pyarrow.PythonFile(Sink, mode="w"), Schema)
+        else:
+            Writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(Sink, mode="w"), Schema)
+        try:
+            yield Sink.Drain()
+            for Batch in Source:
+                if self.Format == "arrow":
+                    Writer.write_batch(Batch)
+                else:
+                    # One row group per batch, so each batch leaves the writer whole
+                    Writer.write_table(pyarrow.Table.from_batches([Batch]))
+                yield Sink.Drain()
+        finally:
+            Writer.close()
+        yield Sink.Drain()
+
+    def RecordBatches(self, Schema, Pending: list) -> Iterator[Any]:
+        pyarrow = self.pyarrow
+        Batches = self.Batches()
+        Rows = Pending
+        while Rows:
+            Arrays = []
+            for Index, Field in enumerate(Schema):
+                try:
+                    Arrays.append(pyarrow.array([ArrowValue(Row[Index], Field.type) for Row in Rows], type=Field.type))
+                except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, TypeError, OverflowError):
+                    raise ValueError(f"Column '{Field.name}' holds values that don't fit its {Field.type} type "
+                                     f"taken from its declared type and the first rows; export it as csv")
+            yield pyarrow.RecordBatch.from_arrays(Arrays, schema=Schema)
+            Rows = next(Batches, None)
@@ -0,0 +1,176 @@
+import contextvars
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Callable
+
+# SQLite calls the progress handler every ProgressInterval virtual-machine instructions
+ProgressInterval = 1000
+# How often the watcher of engines without a progress handler checks the deadline and cancellation
+WatchInterval = 0.05
+
+
+class QueryBudget:
+    """Limits for one query: wall-clock seconds, SQLite VM steps and bytes of returned rows (0 disables a limit)."""
+
+    def __init__(self, Seconds: float, VmSteps: int, ResultBytes: int):
+        self.Seconds = Seconds
+        self.VmSteps = VmSteps
+        self.ResultBytes = ResultBytes
+
+    def AsDict(self) -> Dict[str, Any]:
+        return {"seconds": self.Seconds, "vm_steps": self.VmSteps, "result_bytes": self.ResultBytes}
+
+
+def LoadBudget(Endpoint: str, Defaults: Dict[str, str] = None) -> QueryBudget:
+    """
+    QUERY_TIMEOUT / QUERY_MAX_VM_STEPS / QUERY_MAX_RESULT_BYTES, each overridable per endpoint with
+    a _<ENDPOINT> suffix. Defaults holds an endpoint's own defaults, which win over the shared settings.
+    """
+    def Setting(Name: str, Default: str) -> str:
+        Fallback = (Defaults or {}).get(Name) or os.environ.get(Name, Default)
+        return os.environ.get(f"{Name}_{Endpoint.upper()}", Fallback)
+
+    return QueryBudget(
+        Seconds=float(Setting("QUERY_TIMEOUT", "10")),
+        VmSteps=int(Setting("QUERY_MAX_VM_STEPS", "200000000")),
+        ResultBytes=int(Setting("QUERY_MAX_RESULT_BYTES", str(1024 * 1024)))
+    )
+
+
+Budgets = {Endpoint: LoadBudget(Endpoint) for Endpoint in ("default", "chat", "api")}
+# Exports stream whole tables, so the per-query defaults sized for tool results would cut them short
+Budgets["export"] = LoadBudget("export", {"QUERY_TIMEOUT": "300", "QUERY_MAX_VM_STEPS": "0",
+                                          "QUERY_MAX_RESULT_BYTES": str(1024 * 1024 * 1024)})
+
+_Budget = contextvars.ContextVar("query_budget", default=None)
+_Cancel = contextvars.ContextVar("query_cancel", default=None)
+
+
+class QueryCancelled(Exception):
+    """A query stopped by its budget or by the client going away."""
+
+    Hints = {
+        "timeout": "Add a more selective WHERE clause, aggregate in SQL or use a smaller Limit.",
+        "vm_steps": "The query does too much work; filter earlier or avoid sorting the whole table.",
+        "result_bytes": "Select fewer columns or use a smaller Limit.",
+        "cancelled": "The request was cancelled."
+    }
+
+    def __init__(self, Reason: str, Limit: Any = None, ElapsedMs: float = None):
+        self.Reason = Reason
+        self.Limit = Limit
+        self.ElapsedMs = ElapsedMs
+        super().__init__(f"Query stopped: {Reason}" + (f" (limit {Limit})" if Limit is not None else ""))
+
+    def ToError(self) -> Dict[str, Any]:
+        return {
+            "error": str(self),
+            "reason": self.Reason,
+            "limit": self.Limit,
+            "elapsed_ms": self.ElapsedMs,
+            "hint": self.Hints.get(self.Reason)
+        }
+
+
+@contextmanager
+def UseBudget(Endpoint: str = "default", Cancel: threading.Event = None):
+    """Budget (and cancellation event) for the queries run inside this block on this thread or task."""
+    BudgetToken = _Budget.set(Budgets.get(Endpoint, Budgets["default"]))
+    CancelToken = _Cancel.set(Cancel)
+    try:
+        yield
+    finally:
+        _Budget.reset(BudgetToken)
+        _Cancel.reset(CancelToken)
+
+
+def RunWithBudget(Endpoint: str, Cancel: threading.Event, Function: Callable, *Arguments):
+    # Executor threads don't inherit the caller's context; the budget is set per call instead
+    with UseBudget(Endpoint, Cancel):
+        return Function(*Arguments)
+
+
+class Guard:
+    """
+    Enforces the current budget on one connection while a query runs: the progress handler
+    aborts on the deadline, the VM-step limit or cancellation, and CheckRows enforces the
+    result-size limit. Use Check(Error) in sqlite3.Error handlers to surface the abort reason.
+    Engines without a progress handler get the deadline and cancellation through
+    interrupt() (DuckDB) or their query timeout (pyodbc); VM steps are SQLite-only.
+    """
+
+    def __init__(self, Connection: sqlite3.Connection, Budget: QueryBudget = None, CountBytes: bool = True):
+        self.Connection = Connection
+        self.Budget = Budget or _Budget.get() or Budgets["default"]
+        self.Cancel = _Cancel.get()
+        self.CountBytes = CountBytes
+        self.Steps = 0
+        self.Bytes = 0
+        self.Reason = None
+        self.Started = None
+        self.Done = None
+
+    def Progress(self) -> int:
+        self.Steps += ProgressInterval
+        if self.Cancel is not None and self.Cancel.is_set():
+            self.Reason = "cancelled"
+        elif self.Budget.Seconds and time.perf_counter() - self.Started > self.Budget.Seconds:
+            self.Reason = "timeout"
+        elif self.Budget.VmSteps and self.Steps > self.Budget.VmSteps:
+            self.Reason = "vm_steps"
+        return 1 if self.Reason else 0
+
+    def Watch(self):
+        """Watcher thread for engines that can only be stopped from outside the query."""
+        while not self.Done.wait(WatchInterval):
+            if self.Cancel is not None and self.Cancel.is_set():
+                self.Reason = "cancelled"
+            elif self.Budget.Seconds and time.perf_counter() - self.Started > self.Budget.Seconds:
+                self.Reason = "timeout"
+            if self.Reason:
+                self.Connection.interrupt()
+                return
+
+    def __enter__(self):
+        self.Started = time.perf_counter()
+        if hasattr(self.Connection, "set_progress_handler"):
+            self.Connection.set_progress_handler(self.Progress, ProgressInterval)
+        elif hasattr(self.Connection, "interrupt"):
+            self.Done = threading.Event()
+            threading.Thread(target=self.Watch, name="query-guard", daemon=True).start()
+        elif hasattr(self.Connection, "timeout") and self.Budget.Seconds:
+            self.Connection.timeout = max(1, math.ceil(self.Budget.Seconds))
+        return self
+
+    def __exit__(self, ExceptionType, Exception, Traceback):
+        if hasattr(self.Connection, "set_progress_handler"):
+            self.Connection.set_progress_handler(None, 0)
+        elif self.Done is not None:
+            self.Done.set()
+        if Exception is not None and not isinstance(Exception, QueryCancelled):
+            self.Check(Exception)
+        return False
+
+    def ElapsedMs(self) -> float:
+        return round((time.perf_counter() - self.Started) * 1000, 3)
+
+    def Check(self, Error: BaseException):
+        if not self.Reason and "HYT00" in str(Error):
+            # ODBC's "query timeout expired" SQLSTATE
+            self.Reason = "timeout"
+        if self.Reason:
+            Limits = {"timeout": self.Budget.Seconds, "vm_steps": self.Budget.VmSteps}
+            raise QueryCancelled(self.Reason, Limits.get(self.Reason), self.ElapsedMs()) from Error
+
+    def CheckRows(self, Rows):
+        if not self.CountBytes or not self.Budget.ResultBytes:
+            return
+        for Row in Rows:
+            for Value in Row:
+                self.Bytes += len(Value) if isinstance(Value, (str, bytes)) else 8
+        if self.Bytes > self.Budget.ResultBytes:
+            raise QueryCancelled("result_bytes", self.Budget.ResultBytes, self.ElapsedMs())
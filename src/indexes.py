@@ -0,0 +1,285 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import List, Dict, Any, Tuple
+import pool
+import catalog
+
+Logger = logging.getLogger(__name__)
+
+AdvisorEnabled = os.environ.get("INDEX_ADVISOR_ENABLED", "1") == "1"
+AdvisorInterval = float(os.environ.get("INDEX_ADVISOR_INTERVAL", "60"))
+# A column must appear in this many scanning queries before it is indexed
+MinimumHits = int(os.environ.get("INDEX_ADVISOR_MIN_HITS", "3"))
+MaxAutoIndexes = int(os.environ.get("INDEX_ADVISOR_MAX_INDEXES", "4"))
+# Wall-clock seconds one cycle may spend building indexes
+BuildBudgetSeconds = float(os.environ.get("INDEX_ADVISOR_BUILD_BUDGET", "30"))
+# An index must make its sample query at least this much faster to be kept
+MinimumSpeedup = float(os.environ.get("INDEX_ADVISOR_MIN_SPEEDUP", "1.2"))
+# Automatic indexes whose columns see no queries for this long are dropped
+IdleSeconds = float(os.environ.get("INDEX_ADVISOR_IDLE_SECONDS", "86400"))
+
+AutoIndexPrefix = "ix_auto_"
+TimingRuns = 3
+
+_Workload = deque(maxlen=int(os.environ.get("INDEX_ADVISOR_WORKLOAD_SIZE", "2048")))
+_Candidates = {}
+_PlanScans = {}
+_Decisions = deque(maxlen=100)
+_Lock = threading.Lock()
+_Stop = threading.Event()
+_Thread = None
+_CycleLock = threading.Lock()
+# Indexes built before a restart get a full idle period before they can be dropped
+_StartedAt = time.time()
+
+
+def RecordQuery(TableName: str, Query: str, WhereColumns: Tuple[str, ...], OrderColumns: Tuple[str, ...],
+                Seconds: float):
+    """Called on the request path after a query ran; the analysis happens on the advisor thread."""
+    if AdvisorEnabled:
+        _Workload.append((TableName, Query, tuple(WhereColumns), tuple(OrderColumns), Seconds, time.time()))
+
+
+def AutoIndexName(TableName: str, Column: str) -> str:
+    return AutoIndexPrefix + re.sub(r"\W+", "_", f"{TableName}_{Column}").strip("_").lower()
+
+
+def ScanDetails(Connection, Query: str) -> List[str]:
+    """The EXPLAIN QUERY PLAN lines that show a full scan or a sort without an index."""
+    Plan = Connection.execute("EXPLAIN QUERY PLAN " + Query.rstrip().rstrip(";")).fetchall()
+    Details = [Row[-1] for Row in Plan]
+    return [Detail for Detail in Details
+            if (Detail.startswith("SCAN") and "INDEX" not in Detail) or "TEMP B-TREE" in Detail]
+
+
+def TimeQuery(Connection, Query: str) -> float:
+    Best = None
+    for _ in range(TimingRuns):
+        Started = time.perf_counter()
+        Connection.execute(Query).fetchall()
+        Elapsed = time.perf_counter() - Started
+        Best = Elapsed if Best is None else min(Best, Elapsed)
+    return round(Best * 1000, 3)
+
+
+def LeadingIndexedColumns(Connection, TableName: str) -> Dict[str, str]:
+    """Maps each column that leads an existing index to that index's name."""
+    Leading = {}
+    for Row in Connection.execute(f"PRAGMA index_list(\"{TableName}\")").fetchall():
+        IndexName = Row[1]
+        Columns = Connection.execute(f"PRAGMA index_info(\"{IndexName}\")").fetchall()
+        if Columns and Columns[0][2] is not None:
+            Leading.setdefault(Columns[0][2], IndexName)
+    return Leading
+
+
+def AnalyzeWorkload(Connection):
+    """Drains the recorded queries and credits the columns of those that scan."""
+    Catalog = catalog.GetCatalog()
+    while _Workload:
+        TableName, Query, WhereColumns, OrderColumns, Seconds, RecordedAt = _Workload.popleft()
+        if not Catalog.HasTable(TableName):
+            continue
+
+        if Query not in _PlanScans:
+            try:
+                _PlanScans[Query] = ScanDetails(Connection, Query)
+            except sqlite3.Error:
+                _PlanScans[Query] = []
+        Scans = _PlanScans[Query]
+
+        # Every WHERE column is a candidate; for ORDER BY only the leading column can use an index
+        Columns = list(dict.fromkeys(WhereColumns + OrderColumns[:1]))
+        with _Lock:
+            for Column in Columns:
+                Candidate = _Candidates.setdefault((TableName, Column), {
+                    "table": TableName,
+                    "column": Column,
+                    "queries": 0,
+                    "scans": 0,
+                    "total_ms": 0.0,
+                    "last_seen": 0.0,
+                    "sample_query": Query,
+                    "plan": []
+                })
+                Candidate["queries"] += 1
+                Candidate["last_seen"] = max(Candidate["last_seen"], RecordedAt)
+                if Scans:
+                    Candidate["scans"] += 1
+                    Candidate["total_ms"] += Seconds * 1000
+                    # The slowest scanning query is the one the index has to help
+                    if Seconds * 1000 >= Candidate.get("sample_ms", 0.0):
+                        Candidate["sample_query"] = Query
+                        Candidate["sample_ms"] = Seconds * 1000
+                        Candidate["plan"] = Scans
+
+
+def RecordDecision(Decision: Dict[str, Any]):
+    Decision["at"] = time.time()
+    _Decisions.append(Decision)
+    Logger.info("Index advisor: %s", Decision)
+
+
+def WriteIndexes(Writer, Statements: List[str]):
+    """
+    Runs and commits index DDL. The file version it leaves behind stands for the same data
+    (see catalog.NoteIndexWrite), unless another connection committed in the meantime.
+    """
+    # data_version moves only for commits of other connections
+    DataVersion = Writer.execute("PRAGMA data_version").fetchone()[0]
+    Before = catalog.FileVersion(pool.DatabasePath)
+    for Statement in Statements:
+        Writer.execute(Statement)
+    Writer.commit()
+    After = catalog.FileVersion(pool.DatabasePath)
+    if Writer.execute("PRAGMA data_version").fetchone()[0] == DataVersion:
+        catalog.NoteIndexWrite(Before, After)
+
+
+def CreateIndex(Writer, Reader, Candidate: Dict[str, Any]) -> float:
+    TableName, Column, Query = Candidate["table"], Candidate["column"], Candidate["sample_query"]
+    IndexName = AutoIndexName(TableName, Column)
+
+    BeforeMs = TimeQuery(Reader, Query)
+    Started = time.perf_counter()
+    WriteIndexes(Writer, [f'CREATE INDEX IF NOT EXISTS "{IndexName}" ON "{TableName}" ("{Column}")',
+                          f'ANALYZE "{IndexName}"'])
+    BuildSeconds = time.perf_counter() - Started
+    AfterMs = TimeQuery(Reader, Query)
+
+    Decision = {
+        "action": "create",
+        "index": IndexName,
+        "table": TableName,
+        "column": Column,
+        "scans": Candidate["scans"],
+        "sample_query": Query,
+        "plan_before": Candidate["plan"],
+        "plan_after": ScanDetails(Writer, Query),
+        "before_ms": BeforeMs,
+        "after_ms": AfterMs,
+        "build_ms": round(BuildSeconds * 1000, 3)
+    }
+    if AfterMs * MinimumSpeedup > BeforeMs:
+        WriteIndexes(Writer, [f'DROP INDEX IF EXISTS "{IndexName}"'])
+        Decision["action"] = "rejected"
+        Decision["reason"] = f"speedup below {MinimumSpeedup}x"
+    RecordDecision(Decision)
+    return BuildSeconds
+
+
+def DropIdleIndexes(Writer, Reader, Now: float):
+    for TableName in catalog.GetCatalog().TableNames:
+        for Column, IndexName in LeadingIndexedColumns(Reader, TableName).items():
+            if not IndexName.startswith(AutoIndexPrefix):
+                continue
+            Candidate = _Candidates.get((TableName, Column))
+            LastSeen = Candidate["last_seen"] if Candidate else _StartedAt
+            if Now - LastSeen > IdleSeconds:
+                WriteIndexes(Writer, [f'DROP INDEX IF EXISTS "{IndexName}"'])
+                RecordDecision({"action": "drop", "index": IndexName, "table": TableName, "column": Column,
+                                "reason": f"no queries for {IdleSeconds:.0f} seconds"})
+
+
+def RunCycle() -> Dict[str, Any]:
+    """One advisor pass: analyze the recorded workload, drop idle indexes, build the most valuable new ones."""
+    if pool.GetPool().Immutable:
+        # Immutable readers assume the file never changes underneath them
+        return Report()
+
+    with _CycleLock:
+        Now = time.time()
+        with pool.GetPool().Acquire() as Reader:
+            # EXPLAIN output is fixed when the statement is prepared, so plans are read through
+            # this connection with statement caching off instead of the long-lived pooled ones
+            Writer = sqlite3.connect(pool.DatabasePath, timeout=30, cached_statements=0)
+            try:
+                AnalyzeWorkload(Writer)
+                DropIdleIndexes(Writer, Reader, Now)
+
+                with _Lock:
+                    Ranked = sorted((Candidate for Candidate in _Candidates.values()
+                                     if Candidate["scans"] >= MinimumHits and Now - Candidate["last_seen"] <= IdleSeconds),
+                                    key=lambda Candidate: Candidate["total_ms"], reverse=True)
+
+                Spent = 0.0
+                for Candidate in Ranked:
+                    AutoIndexes = [Row[0] for Row in Reader.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+                                   if Row[0].startswith(AutoIndexPrefix)]
+                    if len(AutoIndexes) >= MaxAutoIndexes or Spent >= BuildBudgetSeconds:
+                        break
+                    if Candidate["column"] in LeadingIndexedColumns(Reader, Candidate["table"]):
+                        continue
+                    # Rejected once for this sample query: don't rebuild it every cycle
+                    if any(Decision.get("index") == AutoIndexName(Candidate["table"], Candidate["column"])
+                           and Decision["action"] == "rejected" and Decision.get("sample_query") == Candidate["sample_query"]
+                           for Decision in _Decisions):
+                        continue
+                    Spent += CreateIndex(Writer, Reader, Candidate)
+            finally:
+                Writer.close()
+
+        # Plans change once indexes come and go
+        _PlanScans.clear()
+    return Report()
+
+
+def AdvisorLoop():
+    while not _Stop.wait(AdvisorInterval):
+        try:
+            RunCycle()
+        except Exception:
+            Logger.exception("Index advisor cycle failed")
+
+
+def StartAdvisor():
+    global _Thread
+    if not AdvisorEnabled or (_Thread is not None and _Thread.is_alive()):
+        return
+    _Stop.clear()
+    _Thread = threading.Thread(target=AdvisorLoop, name="index-advisor", daemon=True)
+    _Thread.start()
+
+
+def StopAdvisor():
+    _Stop.set()
+
+
+def Report() -> Dict[str, Any]:
+    with _Lock:
+        Candidates = sorted(({Key: Value for Key, Value in Candidate.items()} for Candidate in _Candidates.values()),
+                            key=lambda Candidate: Candidate["total_ms"], reverse=True)
+    for Candidate in Candidates:
+        Candidate["total_ms"] = round(Candidate["total_ms"], 3)
+        Candidate.pop("sample_ms", None)
+
+    Indexes = []
+    try:
+        with pool.GetPool().Acquire() as Connection:
+            for Name, TableName, Sql in Connection.execute(
+                    "SELECT name, tbl_name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall():
+                Indexes.append({"name": Name, "table": TableName, "automatic": Name.startswith(AutoIndexPrefix), "sql": Sql})
+    except (sqlite3.Error, RuntimeError):
+        pass
+
+    return {
+        "enabled": AdvisorEnabled,
+        "running": _Thread is not None and _Thread.is_alive(),
+        "settings": {
+            "interval_seconds": AdvisorInterval,
+            "min_hits": MinimumHits,
+            "max_indexes": MaxAutoIndexes,
+            "build_budget_seconds": BuildBudgetSeconds,
+            "min_speedup": MinimumSpeedup,
+            "idle_seconds": IdleSeconds
+        },
+        "pending_queries": len(_Workload),
+        "indexes": Indexes,
+        "candidates": Candidates,
+        "decisions": list(_Decisions)
+    }
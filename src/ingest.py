@@ -0,0 +1,297 @@
+import csv
+import datetime
+import hashlib
+import logging
+import os
+import time
+from typing import Iterator, List, Dict, Any, Callable, Optional, Tuple
+
+Logger = logging.getLogger(__name__)
+
+ChunkRows = int(os.environ.get("INGEST_CHUNK_ROWS", "50000"))
+RowsPerTransaction = int(os.environ.get("INGEST_ROWS_PER_TRANSACTION", "500000"))
+
+
+def DeduplicateHeaders(Headers: List[Any]) -> List[str]:
+    """Same naming as pandas: blank headers become "Unnamed: <i>", repeats get a ".<n>" suffix."""
+    Names = []
+    Seen = {}
+    for Index, Header in enumerate(Headers):
+        Name = str(Header).strip() if Header is not None and str(Header).strip() else f"Unnamed: {Index}"
+        if Name in Seen:
+            Seen[Name] += 1
+            Candidate = f"{Name}.{Seen[Name]}"
+            while Candidate in Seen:
+                Seen[Name] += 1
+                Candidate = f"{Name}.{Seen[Name]}"
+            Name = Candidate
+        Seen.setdefault(Name, 0)
+        Names.append(Name)
+    return Names
+
+
+def ReadExcelRows(Path: str) -> Tuple[List[str], Iterator[tuple]]:
+    import openpyxl
+
+    Workbook = openpyxl.load_workbook(Path, read_only=True, data_only=True)
+    Rows = Workbook.active.iter_rows(values_only=True)
+    Headers = DeduplicateHeaders(next(Rows, ()))
+
+    def Generate():
+        try:
+            for Row in Rows:
+                if Row and any(Value is not None for Value in Row):
+                    yield Row
+        finally:
+            Workbook.close()
+
+    return Headers, Generate()
+
+
+def ParseCsvValue(Value: str) -> Any:
+    if Value == "":
+        return None
+    try:
+        return int(Value)
+    except ValueError:
+        pass
+    try:
+        return float(Value)
+    except ValueError:
+        return Value
+
+
+def ReadCsvRows(Path: str) -> Tuple[List[str], Iterator[tuple]]:
+    File = open(Path, newline="", encoding="utf-8-sig")
+    Reader = csv.reader(File)
+    Headers = DeduplicateHeaders(next(Reader, []))
+
+    def Generate():
+        try:
+            for Row in Reader:
+                yield tuple(ParseCsvValue(Value) for Value in Row)
+        finally:
+            File.close()
+
+    return Headers, Generate()
+
+
+def ReadParquetRows(Path: str) -> Tuple[List[str], Iterator[tuple]]:
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError("Parquet ingestion requires the pyarrow package")
+
+    ParquetFile = pyarrow.parquet.ParquetFile(Path)
+    Headers = DeduplicateHeaders(ParquetFile.schema_arrow.names)
+
+    def Generate():
+        for Batch in ParquetFile.iter_batches(batch_size=ChunkRows):
+            Columns = [Column.to_pylist() for Column in Batch.columns]
+            yield from zip(*Columns)
+
+    return Headers, Generate()
+
+
+Readers = {
+    ".xlsx": ReadExcelRows,
+    ".xlsm": ReadExcelRows,
+    ".csv": ReadCsvRows,
+    ".parquet": ReadParquetRows
+}
+
+
+def OpenSource(Path: str) -> Tuple[List[str], Iterator[tuple]]:
+    Extension = os.path.splitext(Path)[1].lower()
+    if Extension not in Readers:
+        raise ValueError(f"Unsupported source file type '{Extension}'. Supported: {sorted(Readers)}")
+    return Readers[Extension](Path)
+
+
+def ValueType(Value: Any) -> Optional[str]:
+    if Value is None:
+        return None
+    if isinstance(Value, (bool, int)):
+        return "INTEGER"
+    if isinstance(Value, float):
+        return "REAL"
+    if isinstance(Value, (datetime.datetime, datetime.date, datetime.time)):
+        return "TIMESTAMP"
+    return "TEXT"
+
+
+def WidenType(Current: Optional[str], New: Optional[str]) -> Optional[str]:
+    if Current is None:
+        return New
+    if New is None or Current == New:
+        return Current
+    if {Current, New} == {"INTEGER", "REAL"}:
+        return "REAL"
+    return "TEXT"
+
+
+def ConvertValue(Value: Any) -> Any:
+    if isinstance(Value, bool):
+        return int(Value)
+    if isinstance(Value, datetime.datetime):
+        return Value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(Value, (datetime.date, datetime.time)):
+        return Value.isoformat()
+    if isinstance(Value, float) and Value != Value:
+        return None
+    return Value
+
+
+def Chunks(Rows: Iterator[tuple], Width: int, Size: int) -> Iterator[List[tuple]]:
+    Chunk = []
+    for Row in Rows:
+        # Pad/truncate ragged rows to the header width
+        if len(Row) != Width:
+            Row = tuple(Row[:Width]) + (None,) * (Width - len(Row))
+        Chunk.append(Row)
+        if len(Chunk) >= Size:
+            yield Chunk
+            Chunk = []
+    if Chunk:
+        yield Chunk
+
+
+def ChunkHash(Chunk: List[tuple]) -> str:
+    """Fingerprint of a chunk as read from the source, before any conversion."""
+    return hashlib.blake2b(repr(Chunk).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def ColumnDefinitions(Headers: List[str], Types: List[Optional[str]]) -> str:
+    return ", ".join(f'"{Header}" {Type or "TEXT"}' for Header, Type in zip(Headers, Types))
+
+
+def CreateTable(Cursor, TableName: str, Headers: List[str], Types: List[Optional[str]]):
+    Cursor.execute(f'DROP TABLE IF EXISTS "{TableName}"')
+    Cursor.execute(f'CREATE TABLE "{TableName}" ({ColumnDefinitions(Headers, Types)})')
+
+
+def RetypeTable(Cursor, TableName: str, Headers: List[str], Types: List[Optional[str]]):
+    """
+    Recreates TableName with wider declared types and copies the rows loaded so far (rowids
+    included). Those rows all fit the narrower types, so the copy stores them exactly as an
+    insert under the wider types would have.
+    """
+    Staging = f"{TableName}__retype"
+    QuotedColumns = ", ".join(f'"{Header}"' for Header in Headers)
+    Cursor.execute(f'DROP TABLE IF EXISTS "{Staging}"')
+    Cursor.execute(f'CREATE TABLE "{Staging}" ({ColumnDefinitions(Headers, Types)})')
+    Cursor.execute(f'INSERT INTO "{Staging}" (rowid, {QuotedColumns}) SELECT rowid, {QuotedColumns} FROM "{TableName}"')
+    Cursor.execute(f'DROP TABLE "{TableName}"')
+    Cursor.execute(f'ALTER TABLE "{Staging}" RENAME TO "{TableName}"')
+
+
+def LogProgress(Report: Dict[str, Any]):
+    Logger.info("Ingested %d rows into %s (%.0f rows/s)", Report["rows"], Report["table"], Report["rows_per_second"])
+
+
+def IngestFile(Connection, SourcePath: str, TableName: str, IndexColumns: List[str] = None,
+               Progress: Callable[[Dict[str, Any]], None] = LogProgress, HashChunks: bool = False) -> Dict[str, Any]:
+    """
+    Streams SourcePath (xlsx, csv or parquet) into TableName in bounded chunks with
+    executemany inside large transactions. Column types are inferred from the first chunk;
+    a later chunk with wider values (text in a numeric column, numbers in a column that was
+    empty so far) recreates the table with the wider types before it is inserted. Indexes are built after the load. HashChunks
+    adds the ChunkHash of every chunk to the report, for later incremental re-ingests.
+    """
+    Started = time.perf_counter()
+    Headers, Rows = OpenSource(SourcePath)
+    if not Headers:
+        raise ValueError(f"Source file '{SourcePath}' has no header row")
+
+    QuotedTable = f'"{TableName}"'
+    QuotedColumns = ", ".join(f'"{Header}"' for Header in Headers)
+    Insert = f"INSERT INTO {QuotedTable} ({QuotedColumns}) VALUES ({', '.join('?' * len(Headers))})"
+
+    Cursor = Connection.cursor()
+    PreviousJournal = Cursor.execute("PRAGMA journal_mode").fetchone()[0]
+    PreviousSynchronous = Cursor.execute("PRAGMA synchronous").fetchone()[0]
+    Cursor.execute("PRAGMA journal_mode = MEMORY")
+    Cursor.execute("PRAGMA synchronous = OFF")
+    Cursor.execute("PRAGMA temp_store = MEMORY")
+    Cursor.execute("PRAGMA cache_size = -262144")
+
+    Types = [None] * len(Headers)
+    ChunkHashes = []
+    Created = False
+    RowCount = 0
+    RowsInTransaction = 0
+    try:
+        for Chunk in Chunks(Rows, len(Headers), ChunkRows):
+            if HashChunks:
+                ChunkHashes.append(ChunkHash(Chunk))
+            for Row in Chunk:
+                for Index, Value in enumerate(Row):
+                    if Value is not None:
+                        Types[Index] = WidenType(Types[Index], ValueType(Value))
+
+            if not Created:
+                Cursor.execute("BEGIN")
+                CreateTable(Cursor, TableName, Headers, Types)
+                CreatedTypes = list(Types)
+                Created = True
+            else:
+                if not Connection.in_transaction:
+                    Cursor.execute("BEGIN")
+                if Types != CreatedTypes:
+                    # SQLite can't change a column's type; inserting under the old affinity would
+                    # store the new values converted (numbers as text, numeric-looking text as numbers)
+                    Widened = [Header for Header, Before, After in zip(Headers, CreatedTypes, Types) if Before != After]
+                    Logger.info("Recreating %s after %d rows with wider types for %s", TableName, RowCount, Widened)
+                    RetypeTable(Cursor, TableName, Headers, Types)
+                    CreatedTypes = list(Types)
+
+            Cursor.executemany(Insert, ([ConvertValue(Value) for Value in Row] for Row in Chunk))
+            RowCount += len(Chunk)
+            RowsInTransaction += len(Chunk)
+            if RowsInTransaction >= RowsPerTransaction:
+                Connection.commit()
+                RowsInTransaction = 0
+
+            if Progress:
+                Elapsed = time.perf_counter() - Started
+                Progress({"table": TableName, "rows": RowCount, "seconds": Elapsed,
+                          "rows_per_second": RowCount / Elapsed if Elapsed else 0.0})
+
+        if not Created:
+            CreateTable(Cursor, TableName, Headers, Types)
+        Connection.commit()
+
+        LoadSeconds = time.perf_counter() - Started
+        IndexStarted = time.perf_counter()
+        for Column in IndexColumns or []:
+            if Column not in Headers:
+                raise ValueError(f"Cannot index unknown column '{Column}'")
+            Cursor.execute(f'CREATE INDEX IF NOT EXISTS "ix_{TableName}_{Column}" ON {QuotedTable} ("{Column}")')
+        Cursor.execute(f"ANALYZE {QuotedTable}")
+        Connection.commit()
+        IndexSeconds = time.perf_counter() - IndexStarted
+    except Exception:
+        Connection.rollback()
+        raise
+    finally:
+        Cursor.execute(f"PRAGMA journal_mode = {PreviousJournal}")
+        Cursor.execute(f"PRAGMA synchronous = {PreviousSynchronous}")
+        Cursor.close()
+
+    TotalSeconds = time.perf_counter() - Started
+    SourceBytes = os.path.getsize(SourcePath)
+    Report = {
+        "table": TableName,
+        "source": SourcePath,
+        "rows": RowCount,
+        "columns": dict(zip(Headers, [Type or "TEXT" for Type in Types])),
+        "load_seconds": round(LoadSeconds, 3),
+        "index_seconds": round(IndexSeconds, 3),
+        "total_seconds": round(TotalSeconds, 3),
+        "rows_per_second": round(RowCount / TotalSeconds, 1) if TotalSeconds else 0.0,
+        "source_mb_per_second": round(SourceBytes / 1048576 / TotalSeconds, 2) if TotalSeconds else 0.0
+    }
+    if HashChunks:
+        Report["chunk_hashes"] = ChunkHashes
+    Logger.info("Ingest finished: %s", Report)
+    return Report
@@ -0,0 +1,200 @@
+import functools
+from collections import namedtuple
+from typing import List, Iterable
+
+# Kinds: "string", "column", "quoted", "table", "keyword", "function", "number", "word",
+#        "comment", "space", "symbol"
+Token = namedtuple("Token", ["Kind", "Text", "Value"])
+
+LexResult = namedtuple("LexResult", ["Tokens", "Text", "Columns", "Unknown"])
+
+SqlKeywords = frozenset({
+    'select', 'from', 'where', 'order', 'by', 'group', 'having', 'distinct', 'limit', 'offset',
+    'and', 'or', 'not', 'in', 'like', 'glob', 'between', 'is', 'null', 'true', 'false', 'escape',
+    'as', 'on', 'inner', 'outer', 'left', 'right', 'cross', 'join', 'using', 'natural',
+    'union', 'all', 'intersect', 'except', 'exists', 'case', 'when', 'then', 'else', 'end',
+    'asc', 'desc', 'nulls', 'first', 'last', 'collate', 'nocase', 'cast', 'with',
+    'avg', 'count', 'max', 'min', 'sum', 'total', 'abs', 'round', 'length', 'upper', 'lower',
+    'coalesce', 'ifnull', 'nullif', 'substr', 'trim', 'instr', 'strftime', 'julianday',
+    'datetime', 'date', 'time', 'timestamp', 'integer', 'text', 'real', 'numeric', 'varchar',
+    'int', 'bool', 'float', 'double', 'char', 'blob', 'recursive', 'over', 'partition', 'filter', 'values'
+})
+
+# Keywords that may be followed by "(" without being function calls ("AS (", "IN (", "EXISTS (")
+StructuralKeywords = frozenset({
+    'select', 'from', 'where', 'group', 'having', 'order', 'by', 'and', 'or', 'not', 'in', 'exists',
+    'as', 'on', 'using', 'join', 'union', 'all', 'intersect', 'except', 'with', 'recursive', 'distinct',
+    'between', 'like', 'glob', 'is', 'case', 'when', 'then', 'else', 'limit', 'offset', 'over',
+    'partition', 'filter', 'values'
+})
+
+QuoteClosers = {'"': '"', '[': ']', '`': '`'}
+
+
+def IsWordCharacter(Character: str) -> bool:
+    return Character.isalnum() or Character == '_'
+
+
+class Lexicon:
+    """
+    Column names of one table (or of the whole catalog) arranged in a character trie,
+    so a clause can be tokenized and its identifiers resolved in a single left-to-right pass.
+    """
+
+    def __init__(self, Columns: Iterable[str], TableNames: Iterable[str] = ()):
+        self.Columns = list(Columns)
+        self.ColumnsByLower = {Column.lower(): Column for Column in self.Columns}
+        self.TablesByLower = {Table.lower(): Table for Table in TableNames}
+        self.Trie = {}
+        for Column in self.Columns:
+            Node = self.Trie
+            for Character in Column.lower():
+                Node = Node.setdefault(Character, {})
+            Node[None] = Column
+
+        # Validation and query building run over the same clause; lex it once
+        self.Analyze = functools.lru_cache(maxsize=512)(self.Tokenize)
+
+    def MatchColumn(self, Clause: str, Lowered: str, Start: int):
+        """Returns (Column, End) for the longest column name starting at Start that ends on a word boundary."""
+        Node = self.Trie
+        Best = None
+        Index = Start
+        Length = len(Lowered)
+        while Index < Length:
+            Node = Node.get(Lowered[Index])
+            if Node is None:
+                break
+            Index += 1
+            if None in Node and (Index == Length or not IsWordCharacter(Clause[Index])):
+                Best = (Node[None], Index)
+        return Best
+
+    def Tokenize(self, Clause: str) -> LexResult:
+        Tokens = []
+        Columns = []
+        Unknown = []
+        Lowered = Clause.lower()
+        Length = len(Clause)
+        Index = 0
+
+        while Index < Length:
+            Character = Clause[Index]
+
+            if Character.isspace():
+                End = Index + 1
+                while End < Length and Clause[End].isspace():
+                    End += 1
+                Tokens.append(Token("space", Clause[Index:End], None))
+                Index = End
+
+            elif Character == "'":
+                End = Index + 1
+                while True:
+                    End = Clause.find("'", End)
+                    if End == -1:
+                        raise ValueError(f"Unterminated string literal starting at position {Index}")
+                    if End + 1 < Length and Clause[End + 1] == "'":
+                        End += 2
+                        continue
+                    break
+                Tokens.append(Token("string", Clause[Index:End + 1], None))
+                Index = End + 1
+
+            elif Character in QuoteClosers:
+                Closer = QuoteClosers[Character]
+                End = Clause.find(Closer, Index + 1)
+                if End == -1:
+                    raise ValueError(f"Unterminated quoted identifier starting at position {Index}")
+                Name = Clause[Index + 1:End]
+                Index = End + 1
+                if Index < Length and Clause[Index] == '.' and Name.lower() in self.TablesByLower:
+                    Tokens.append(Token("table", f'"{self.TablesByLower[Name.lower()]}"', Name))
+                    continue
+                Column = self.ColumnsByLower.get(Name.lower())
+                if Column is None:
+                    Unknown.append(Name)
+                    Tokens.append(Token("quoted", f'"{Name}"', Name))
+                else:
+                    Columns.append(Column)
+                    Tokens.append(Token("column", f'"{Column}"', Column))
+
+            elif Clause.startswith('--', Index) or Clause.startswith('/*', Index):
+                if Character == '-':
+                    End = Clause.find('\n', Index)
+                else:
+                    End = Clause.find('*/', Index + 2)
+                    End = End + 2 if End != -1 else -1
+                End = Length if End == -1 else End
+                Tokens.append(Token("comment", Clause[Index:End], None))
+                Index = End
+
+            elif IsWordCharacter(Character):
+                Match = self.MatchColumn(Clause, Lowered, Index)
+                WordEnd = Index
+                while WordEnd < Length and IsWordCharacter(Clause[WordEnd]):
+                    WordEnd += 1
+                Word = Clause[Index:WordEnd]
+                After = WordEnd
+                while After < Length and Clause[After] == ' ':
+                    After += 1
+                IsCall = After < Length and Clause[After] == '(' and Word.lower() not in StructuralKeywords
+
+                if Match is not None and not (IsCall and Match[1] == WordEnd):
+                    Column, End = Match
+                    Columns.append(Column)
+                    Tokens.append(Token("column", f'"{Column}"', Column))
+                    Index = End
+                elif Character.isdigit():
+                    End = Index
+                    while End < Length and (Clause[End].isalnum() or Clause[End] == '.'
+                                            or (Clause[End] in '+-' and Lowered[End - 1] == 'e')):
+                        End += 1
+                    Tokens.append(Token("number", Clause[Index:End], None))
+                    Index = End
+                elif IsCall:
+                    Tokens.append(Token("function", Word, Word.lower()))
+                    Index = WordEnd
+                elif Word.lower() in SqlKeywords:
+                    Tokens.append(Token("keyword", Word, Word.lower()))
+                    Index = WordEnd
+                elif WordEnd < Length and Clause[WordEnd] == '.' and Word.lower() in self.TablesByLower:
+                    Tokens.append(Token("table", f'"{self.TablesByLower[Word.lower()]}"', Word))
+                    Index = WordEnd
+                else:
+                    Unknown.append(Word)
+                    Tokens.append(Token("word", Word, Word.lower()))
+                    Index = WordEnd
+
+            else:
+                Tokens.append(Token("symbol", Character, None))
+                Index += 1
+
+        Text = "".join(Item.Text for Item in Tokens)
+        return LexResult(tuple(Tokens), Text, tuple(Columns), tuple(Unknown))
+
+
+def NormalizeClause(Result: LexResult) -> str:
+    """Canonical spelling of a clause (collapsed whitespace, upper-case keywords) for use as a cache key."""
+    Parts = []
+    for Item in Result.Tokens:
+        if Item.Kind == "space":
+            Parts.append(" ")
+        elif Item.Kind in ("keyword", "function"):
+            Parts.append(Item.Text.upper())
+        else:
+            Parts.append(Item.Text)
+    return "".join(Parts).strip()
+
+
+def SimilarColumns(Name: str, Columns: List[str]) -> List[str]:
+    NameLower = Name.lower()
+    return [Column for Column in Columns if NameLower in Column.lower()]
+
+
+def GetLexicon(Catalog, TableName: str = None) -> Lexicon:
+    """Per-table lexicons (or one over every column when TableName is None) are memoized on the catalog."""
+    if TableName is None or not Catalog.HasTable(TableName):
+        AllColumns = Catalog.SortedColumns
+        return Catalog.Memoize("lexicon:*", lambda: Lexicon(AllColumns, Catalog.TableNames))
+    return Catalog.Memoize(f"lexicon:{TableName}", lambda: Lexicon(Catalog.Tables[TableName], Catalog.TableNames))
@@ -1,114 +1,296 @@
 import os
 import json
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional, List
 from dotenv import load_dotenv
 import pandas
-from openai import OpenAI
-from fastapi import FastAPI, Body
-import tools
+from openai import AsyncOpenAI
+from fastapi import FastAPI, Body, HTTPException, Depends, Request, Response, Query
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 
-App = FastAPI()
+# Loaded before the local modules so their DB_* settings can come from .env
 LoadDotEnv = load_dotenv()
 
+import tools
+import pool
+import backends
+import catalog
+import chat
+import cache
+import bootstrap
+import indexes
+import prompt
+import guards
+import tracing
+import sessions
+import export
+
+@asynccontextmanager
+async def Lifespan(App: FastAPI):
+    # Load in the background; requests wait on RequireReady instead of paying for the ingest
+    bootstrap.Start()
+    indexes.StartAdvisor()
+    yield
+    indexes.StopAdvisor()
+    chat.ToolExecutor.shutdown(wait=False)
+    backends.CloseBackends()
+    pool.ClosePool()
+    sessions.Close()
+
+App = FastAPI(lifespan=Lifespan)
+App.add_middleware(tracing.RequestMetrics)
+
 OpenAIApiKey = os.environ.get("OPENAI_API_KEY")
 if not OpenAIApiKey:
     raise ValueError("Missing OPENAI_API_KEY environment variable")
 
-OpenAIClient = OpenAI(
+OpenAIClient = AsyncOpenAI(
     api_key=OpenAIApiKey,
     timeout=30.0
 )
 
+@App.exception_handler(guards.QueryCancelled)
+async def HandleQueryCancelled(Request: Request, Error: guards.QueryCancelled):
+    return JSONResponse(status_code=504 if Error.Reason == "timeout" else 422, content=Error.ToError())
+
+async def RequireReady():
+    if not await bootstrap.WaitUntilReady():
+        raise HTTPException(status_code=503, detail={"message": "Database is not ready yet", **bootstrap.Status()},
+                            headers={"Retry-After": "5"})
+
 @App.get("/")
 def ReadRoot():
     return {"Hello": "World"}
 
-@App.get("/test_db_query")
+@App.get("/ready")
+def ReadReady():
+    Status = bootstrap.Status()
+    if not Status["ready"]:
+        raise HTTPException(status_code=503, detail=Status, headers={"Retry-After": "5"})
+    return Status
+
+@App.post("/admin/reingest", status_code=202)
+def Reingest(full: bool = False):
+    # Applies only the changed rows unless full=true asks for a rebuild from scratch
+    if not bootstrap.Start(Rebuild=True, Full=full):
+        raise HTTPException(status_code=409, detail={"message": "A database load is already running", **bootstrap.Status()})
+    return bootstrap.Status()
+
+@App.get("/admin/indexes", dependencies=[Depends(RequireReady)])
+def ReadIndexAdvisor():
+    return indexes.Report()
+
+@App.post("/admin/indexes/run", dependencies=[Depends(RequireReady)])
+def RunIndexAdvisor():
+    return indexes.RunCycle()
+
+@App.get("/test_db_query", dependencies=[Depends(RequireReady)])
 def ReadTestDbQuery():
-    return tools.ExecuteSQL("accounts", None, "Transaction Value > 1000")
+    with guards.UseBudget("api"):
+        return tools.ExecuteSQL("accounts", None, "Transaction Value > 1000")
+
+@App.get("/query/page", dependencies=[Depends(RequireReady)])
+def ReadQueryPage(cursor: str):
+    # Lets a table view walk a selectSQL result with the same cursors the model gets
+    try:
+        with guards.UseBudget("api"):
+            return tools.FetchPage(cursor)
+    except ValueError as E:
+        raise HTTPException(status_code=410, detail=str(E))
+
+@App.get("/export", dependencies=[Depends(RequireReady)])
+def ExportQuery(table: str, columns: List[str] = Query(None), where: str = None, order_by: str = None,
+                limit: int = None, format: str = "csv"):
+    # The whole result, streamed in EXPORT_CHUNK_ROWS batches under the "export" query budget
+    try:
+        Export = export.Export(table, columns, where, order_by, limit, format)
+    except export.ExportBusyError as E:
+        raise HTTPException(status_code=503, detail=str(E), headers={"Retry-After": "5"})
+    except ValueError as E:
+        raise HTTPException(status_code=400, detail=str(E))
+    return StreamingResponse(Export.Body(), media_type=Export.MediaType,
+                             headers={"Content-Disposition": f'attachment; filename="{Export.FileName}"'})
+
+@App.get("/db_pool_stats", dependencies=[Depends(RequireReady)])
+def ReadDbPoolStats():
+    return pool.GetPool().Stats()
+
+@App.get("/db_backends", dependencies=[Depends(RequireReady)])
+def ReadDbBackends():
+    return backends.Stats()
+
+@App.get("/cache_stats")
+def ReadCacheStats():
+    return cache.Stats()
+
+@App.post("/cache/clear")
+def ClearCaches():
+    cache.InvalidateAll()
+    return cache.Stats()
+
+@App.get("/metrics")
+def ReadMetrics():
+    return PlainTextResponse(tracing.RenderMetrics(), media_type="text/plain; version=0.0.4")
+
+@App.get("/debug/traces")
+def ReadTraces(limit: int = 20):
+    return [{"trace_id": Trace.Id, "name": Trace.Name, "started_at": Trace.StartedAt,
+             "duration_ms": Trace.DurationMs, "totals_ms": Trace.Totals()}
+            for Trace in list(tracing.RecentTraces)[::-1][:limit]]
 
+@App.get("/debug/traces/{trace_id}")
+def ReadTrace(trace_id: str):
+    Trace = tracing.FindTrace(trace_id)
+    if Trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (only the most recent traces are kept)")
+    return Trace.AsDict()
 
-@App.post("/chat")
-def HandleChat(Body: dict = Body()):
+@App.post("/sessions")
+def CreateSession(Body: dict = Body(default={})):
+    return {"session_id": sessions.Create(Body.get("system")).Id}
+
+@App.get("/sessions/{session_id}")
+def ReadSession(session_id: str):
+    Session = sessions.Find(session_id)
+    if Session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    History = Session.History()
+    return {"session_id": Session.Id, "compacted_messages": Session.Compacted,
+            "history_tokens": sum(prompt.MessageTokens(Message) for Message in History), "messages": History}
+
+@App.delete("/sessions/{session_id}", status_code=204)
+def DeleteSession(session_id: str):
+    sessions.Delete(session_id)
+
+@App.get("/session_stats")
+def ReadSessionStats():
+    return sessions.Stats()
+
+@App.post("/schema/reload", dependencies=[Depends(RequireReady)])
+def ReloadSchema():
+    Catalog = catalog.ReloadCatalog()
+    return {"tables": {Table: len(Columns) for Table, Columns in Catalog.Tables.items()}}
+
+
+DisconnectPollSeconds = 0.5
+
+async def CancelOnDisconnect(HttpRequest: Request, Awaitable):
+    """Awaits Awaitable, cancelling it (and through it any running query) if the client goes away."""
+    Task = asyncio.ensure_future(Awaitable)
     try:
-        Messages = Body["conversationHistory"]
-
-        DbSchema = tools.GetTablesSchema()
-
-        schema_description = "DATABASE SCHEMA INFORMATION:\n\n"
-
-        for table_name, table_info in DbSchema.items():
-            if isinstance(table_info, dict) and "columns" in table_info:
-                schema_description += f"TABLE: {table_name}\n"
-                schema_description += f"Description: {table_info.get('description', 'No description')}\n"
-                schema_description += "COLUMNS:\n"
-
-                for col_info in table_info["columns"]:
-                    col_name = col_info["name"]
-                    col_type = col_info["type"]
-                    schema_description += f"  - {col_name} ({col_type})\n"
-
-                schema_description += "\n"
-
-        SystemMessage = {
-            "role": "system",
-            "content": f"You are a SQL Data Science Assistant. You can help users query databases using SQL. When appropriate, use the selectSQL tool to retrieve data from the database. Always follow safe practices and never attempt to modify the database.\n\n{schema_description}\n\nIMPORTANT: BEFORE FORMING ANY SQL QUERY, you MUST verify that every column name you intend to use exists in the schema above. The tool will reject any queries that reference non-existent columns.\n\nCRITICAL RULES FOR QUERYING:\n1. ONLY use the exact column names listed in the schema above - NO EXCEPTIONS\n2. Do not invent, guess, or hallucinate any column names that are not explicitly listed\n3. When using WHERE or ORDER BY clauses, use only the valid column names provided\n4. If uncertain, query without WHERE clause first to see sample data and confirm column names\n5. IMPORTANT: Some column names contain spaces (like \"Clearing Date\", \"Transaction Value\"). Use them exactly as shown, including spaces.\n\nFAILURE TO FOLLOW THESE RULES WILL RESULT IN QUERY ERRORS."
-        }
-
-        if not Messages or Messages[0]["role"] != "system":
-            Messages = [SystemMessage] + Messages
-
-        Completion = OpenAIClient.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=Messages,
-            tools=[tools.GetToolSchema()]
-        )
-
-        while Completion.choices[0].finish_reason == "tool_calls":
-            AssistantMessage = Completion.choices[0].message
-            Messages.append(AssistantMessage.model_dump())
-
-            for ToolCall in AssistantMessage.tool_calls:
-                FunctionName = ToolCall.function.name
-                Arguments = json.loads(ToolCall.function.arguments)
-
-                if FunctionName == "selectSQL":
-                    try:
-                        TableName = Arguments.get("TableName")
-                        Columns = Arguments.get("Columns")
-                        WhereClause = Arguments.get("WhereClause")
-                        OrderBy = Arguments.get("OrderBy")
-
-                        ToolResult = tools.ExecuteSQL(
-                            TableName=TableName,
-                            Columns=Columns,
-                            WhereClause=WhereClause,
-                            OrderBy=OrderBy
-                        )
-                    except ValueError as e:
-                        # Return the error to the agent so it can correct itself
-                        ToolResult = {"error": f"Validation Error: {str(e)}. Please check your column names and make sure they exactly match the available columns in the database schema."}
-                    except Exception as e:
-                        # Return general error to the agent
-                        ToolResult = {"error": f"Error executing query: {str(e)}. Please verify your SQL syntax and make sure you're using valid column names from the schema."}
-                else:
-                    ToolResult = {"error": f"Unknown tool: {FunctionName}"}
-
-                ToolResponse = {
-                    "tool_call_id": ToolCall.id,
-                    "role": "tool",
-                    "name": FunctionName,
-                    "content": json.dumps(ToolResult)
-                }
-                Messages.append(ToolResponse)
-
-            Completion = OpenAIClient.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=Messages,
-                tools=[tools.GetToolSchema()]
-            )
-
-        Result = Completion.choices[0].message.content
-        return Result
-
-    except Exception as E:
-        raise E
\ No newline at end of file
+        while True:
+            Done, _ = await asyncio.wait({Task}, timeout=DisconnectPollSeconds)
+            if Done:
+                return Task.result()
+            if await HttpRequest.is_disconnected():
+                Task.cancel()
+                # 499: client closed request; nobody reads this response
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not Task.done():
+            Task.cancel()
+
+async def OpenSession(Body: dict) -> Optional[sessions.Session]:
+    """
+    None for stateless bodies, which carry the whole conversationHistory. Otherwise the body
+    holds one new message and, after the first turn, the sessionId the server returned.
+    """
+    if "conversationHistory" in Body:
+        return None
+    if not isinstance(Body.get("message"), str) or not Body["message"].strip():
+        raise HTTPException(status_code=400, detail="Send a conversationHistory, or a message with an optional sessionId")
+    if not Body.get("sessionId"):
+        return await asyncio.to_thread(sessions.Create, Body.get("system"))
+    Session = await asyncio.to_thread(sessions.Find, Body["sessionId"])
+    if Session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired; start a new one")
+    return Session
+
+@asynccontextmanager
+async def ConversationTurn(Body: dict, Session: Optional[sessions.Session]):
+    """
+    Yields (Messages, Transcript). For a session the history comes from the store and the
+    turn (the new message plus everything the model and tools added) is saved once it completes.
+    """
+    if Session is None:
+        yield Body["conversationHistory"], None
+        return
+    with sessions.Claim(Session.Id):
+        # Reloaded under the claim, in case another turn finished since OpenSession
+        Session = await asyncio.to_thread(sessions.Find, Session.Id) or Session
+        Transcript = [{"role": "user", "content": Body["message"]}]
+        yield Session.History() + Transcript, Transcript
+        Session.Append(Transcript)
+        await asyncio.to_thread(sessions.Save, Session)
+
+@App.post("/chat", dependencies=[Depends(RequireReady)])
+async def HandleChat(HttpRequest: Request, HttpResponse: Response, Body: dict = Body()):
+    Session = await OpenSession(Body)
+
+    with tracing.StartTrace("chat") as Trace:
+        try:
+            async with chat.ConversationSlot(), ConversationTurn(Body, Session) as (Messages, Transcript):
+                Conversation = asyncio.wait_for(chat.RunConversation(OpenAIClient, Messages, Transcript),
+                                                chat.ChatTimeout)
+                Content = await CancelOnDisconnect(HttpRequest, Conversation)
+        except chat.ChatBusyError as E:
+            raise HTTPException(status_code=503, detail=str(E), headers={"X-Trace-Id": Trace.Id})
+        except sessions.SessionBusyError as E:
+            raise HTTPException(status_code=409, detail=str(E), headers={"X-Trace-Id": Trace.Id})
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail=f"Conversation did not finish within {chat.ChatTimeout} seconds",
+                                headers={"X-Trace-Id": Trace.Id})
+
+    # Per-category milliseconds (prompt, llm, tool, sql, catalog); see /debug/traces/{id} for the spans
+    HttpResponse.headers["Server-Timing"] = Trace.ServerTiming()
+    HttpResponse.headers["X-Trace-Id"] = Trace.Id
+    Result = {"content": Content}
+    if Session is not None:
+        HttpResponse.headers["X-Session-Id"] = Session.Id
+        Result["session_id"] = Session.Id
+    if Body.get("debug"):
+        Result["trace"] = Trace.AsDict()
+    return Result if len(Result) > 1 else Content
+
+
+@App.post("/chat/tokens", dependencies=[Depends(RequireReady)])
+def ReadChatTokens(Body: dict = Body()):
+    # What a /chat request with this history would send to the model, without calling it
+    _, Report = prompt.PrepareMessages(Body["conversationHistory"])
+    return Report
+
+
+def FormatServerSentEvent(Event: str, Data) -> str:
+    return f"event: {Event}\ndata: {json.dumps(Data)}\n\n"
+
+
+@App.post("/chat/stream", dependencies=[Depends(RequireReady)])
+async def HandleChatStream(Body: dict = Body()):
+    Session = await OpenSession(Body)
+
+    async def EventStream():
+        if Session is not None:
+            yield FormatServerSentEvent("session", {"session_id": Session.Id})
+        with tracing.StartTrace("chat_stream") as Trace:
+            try:
+                async with chat.ConversationSlot(), ConversationTurn(Body, Session) as (Messages, Transcript):
+                    Events = chat.ConversationEvents(OpenAIClient, Messages, Stream=True, Transcript=Transcript)
+                    async for Event, Data in chat.WithDeadline(Events, chat.ChatTimeout):
+                        yield FormatServerSentEvent(Event, Data)
+                Outcome = ("done", {})
+            except chat.ChatBusyError as E:
+                Outcome = ("error", {"status": 503, "detail": str(E)})
+            except sessions.SessionBusyError as E:
+                Outcome = ("error", {"status": 409, "detail": str(E)})
+            except asyncio.TimeoutError:
+                Outcome = ("error", {"status": 504, "detail": f"Conversation did not finish within {chat.ChatTimeout} seconds"})
+            except Exception as E:
+                Outcome = ("error", {"status": 500, "detail": str(E)})
+
+        if Body.get("debug"):
+            yield FormatServerSentEvent("trace", Trace.AsDict())
+        yield FormatServerSentEvent(*Outcome)
+
+    return StreamingResponse(EventStream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
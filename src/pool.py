@@ -0,0 +1,179 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any
+from urllib.parse import quote
+
+DatabasePath = os.environ.get("DATABASE_PATH", "demo.db")
+
+PoolSize = int(os.environ.get("DB_POOL_SIZE", "8"))
+PoolTimeout = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+# Only safe when nothing rewrites the database file while the server is running
+PoolImmutable = os.environ.get("DB_POOL_IMMUTABLE", "0") == "1"
+MmapSize = int(os.environ.get("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+CacheSizeKiB = int(os.environ.get("DB_CACHE_SIZE_KIB", str(64 * 1024)))
+
+
+class ConnectionPool:
+    """
+    Bounded pool of long-lived read-only SQLite connections.
+    Connections are created lazily up to Size and handed out through Acquire().
+    """
+
+    def __init__(self, Path: str, Size: int = PoolSize, Timeout: float = PoolTimeout,
+                 Immutable: bool = PoolImmutable):
+        self.Path = Path
+        self.Size = Size
+        self.Timeout = Timeout
+        self.Immutable = Immutable
+        self.Idle = queue.LifoQueue()
+        self.Lock = threading.Lock()
+        self.Created = 0
+        self.InUse = 0
+        self.Acquisitions = 0
+        self.Waits = 0
+        self.Timeouts = 0
+        self.TotalWaitSeconds = 0.0
+        self.MaxWaitSeconds = 0.0
+        self.Closed = False
+
+    def Connect(self) -> sqlite3.Connection:
+        Uri = "file:" + quote(os.path.abspath(self.Path)) + "?mode=ro"
+        if self.Immutable:
+            Uri += "&immutable=1"
+
+        Connection = sqlite3.connect(Uri, uri=True, check_same_thread=False)
+        Cursor = Connection.cursor()
+        Cursor.execute(f"PRAGMA mmap_size = {MmapSize}")
+        Cursor.execute(f"PRAGMA cache_size = -{CacheSizeKiB}")
+        Cursor.execute("PRAGMA temp_store = MEMORY")
+        Cursor.execute("PRAGMA query_only = ON")
+        Cursor.close()
+        if hasattr(Connection, "setconfig"):
+            # Python 3.12+: unknown "double-quoted" names are errors instead of string literals
+            Connection.setconfig(sqlite3.SQLITE_DBCONFIG_DQS_DML, False)
+        return Connection
+
+    def CheckReady(self):
+        # One readiness check at startup instead of a sqlite_master lookup per call
+        with self.Acquire() as Connection:
+            Tables = Connection.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()
+        if not Tables:
+            raise RuntimeError(f"Database '{self.Path}' contains no tables")
+
+    @contextmanager
+    def Acquire(self):
+        Connection = self.Take()
+        try:
+            yield Connection
+        finally:
+            self.Release(Connection)
+
+    def Take(self) -> sqlite3.Connection:
+        if self.Closed:
+            raise RuntimeError("Connection pool is closed")
+
+        try:
+            Connection = self.Idle.get_nowait()
+        except queue.Empty:
+            Connection = None
+
+        if Connection is None:
+            with self.Lock:
+                CanCreate = self.Created < self.Size
+                if CanCreate:
+                    self.Created += 1
+            if CanCreate:
+                try:
+                    Connection = self.Connect()
+                except Exception:
+                    with self.Lock:
+                        self.Created -= 1
+                    raise
+
+        if Connection is None:
+            Started = time.perf_counter()
+            try:
+                Connection = self.Idle.get(timeout=self.Timeout)
+            except queue.Empty:
+                with self.Lock:
+                    self.Timeouts += 1
+                raise TimeoutError(f"No database connection available after {self.Timeout} seconds")
+            finally:
+                Waited = time.perf_counter() - Started
+                with self.Lock:
+                    self.Waits += 1
+                    self.TotalWaitSeconds += Waited
+                    self.MaxWaitSeconds = max(self.MaxWaitSeconds, Waited)
+
+        with self.Lock:
+            self.InUse += 1
+            self.Acquisitions += 1
+        return Connection
+
+    def Release(self, Connection: sqlite3.Connection):
+        with self.Lock:
+            self.InUse -= 1
+        if self.Closed:
+            Connection.close()
+            return
+        self.Reset(Connection)
+        self.Idle.put(Connection)
+
+    def Reset(self, Connection: sqlite3.Connection):
+        """Returns a connection to a clean state before it goes back to the pool."""
+        if Connection.in_transaction:
+            Connection.rollback()
+
+    def Close(self):
+        self.Closed = True
+        while True:
+            try:
+                self.Idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self.Lock:
+            self.Created = self.InUse
+
+    def Stats(self) -> Dict[str, Any]:
+        with self.Lock:
+            return {
+                "path": self.Path,
+                "size": self.Size,
+                "created": self.Created,
+                "in_use": self.InUse,
+                "idle": self.Idle.qsize(),
+                "immutable": self.Immutable,
+                "acquisitions": self.Acquisitions,
+                "waits": self.Waits,
+                "timeouts": self.Timeouts,
+                "total_wait_ms": round(self.TotalWaitSeconds * 1000, 3),
+                "avg_wait_ms": round(self.TotalWaitSeconds * 1000 / self.Waits, 3) if self.Waits else 0.0,
+                "max_wait_ms": round(self.MaxWaitSeconds * 1000, 3)
+            }
+
+
+_Pool = None
+_PoolLock = threading.Lock()
+
+
+def GetPool() -> ConnectionPool:
+    global _Pool
+    if _Pool is None:
+        with _PoolLock:
+            if _Pool is None:
+                NewPool = ConnectionPool(DatabasePath)
+                NewPool.CheckReady()
+                _Pool = NewPool
+    return _Pool
+
+
+def ClosePool():
+    global _Pool
+    with _PoolLock:
+        if _Pool is not None:
+            _Pool.Close()
+            _Pool = None
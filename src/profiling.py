@@ -0,0 +1,243 @@
+import math
+from typing import List, Dict, Any
+import numpy
+import backends
+import catalog
+import cache
+import stats
+import guards
+import tracing
+import sampling
+
+ZScoreThreshold = 3.0
+IqrMultiplier = 1.5
+
+
+def RoundValue(Value: Any, Digits: int = 6) -> Any:
+    if isinstance(Value, float):
+        if math.isnan(Value) or math.isinf(Value):
+            return None
+        return float(f"{Value:.{Digits}g}")
+    return Value
+
+
+def ResolveColumns(Catalog, TableName: str, Columns: List[str] = None) -> List[str]:
+    if not Catalog.HasTable(TableName):
+        raise ValueError(f"Table '{TableName}' does not exist in the database. Available tables: {Catalog.TableNames}")
+
+    ValidColumns = Catalog.Tables[TableName]
+    if not Columns or Columns == ["*"]:
+        return list(ValidColumns)
+
+    Resolved = []
+    for Column in Columns:
+        Canonical = Catalog.ColumnsByLower[TableName].get(Column.strip().strip('"').lower())
+        if Canonical is None:
+            raise ValueError(f"Column '{Column}' not found in table '{TableName}'. Valid columns are: {ValidColumns}")
+        Resolved.append(Canonical)
+    return Resolved
+
+
+def BuildAggregateQuery(Backend, TableName: str, Columns: List[str]) -> str:
+    """One scan computing the counts and numeric moments of every requested column."""
+    Expressions = ["COUNT(*)"]
+    for Column in Columns:
+        Quoted = Backend.QuoteIdentifier(Column)
+        Numeric = Backend.NumericValue(Quoted)
+        Expressions += [
+            f"COUNT({Quoted})",
+            f"SUM({Backend.IsBlankText(Quoted)})",
+            f"COUNT(DISTINCT {Quoted})",
+            f"MIN({Quoted})",
+            f"MAX({Quoted})",
+            f"COUNT({Numeric})",
+            f"AVG({Numeric})",
+            f"AVG(({Numeric}) * ({Numeric}))"
+        ]
+    return f'SELECT {", ".join(Expressions)} FROM {Backend.QuoteIdentifier(TableName)}'
+
+
+def NumericDistribution(Values: numpy.ndarray, Mean: float, StdDev: float) -> Dict[str, Any]:
+    Values = Values[~numpy.isnan(Values)]
+    if Values.size == 0:
+        return {}
+
+    Q1, Median, Q3 = numpy.percentile(Values, [25, 50, 75])
+    Iqr = Q3 - Q1
+    Lower = Q1 - IqrMultiplier * Iqr
+    Upper = Q3 + IqrMultiplier * Iqr
+    Distribution = {
+        "p25": RoundValue(float(Q1)),
+        "median": RoundValue(float(Median)),
+        "p75": RoundValue(float(Q3)),
+        "iqr": RoundValue(float(Iqr)),
+        "iqr_outliers": int(numpy.count_nonzero((Values < Lower) | (Values > Upper)))
+    }
+    if StdDev:
+        Distribution["zscore_outliers"] = int(numpy.count_nonzero(numpy.abs(Values - Mean) > ZScoreThreshold * StdDev))
+    else:
+        Distribution["zscore_outliers"] = 0
+    return Distribution
+
+
+def ChooseSample(TableName: str):
+    """The smallest sample of at least SAMPLE_PROFILE_ROWS rows (else the largest), None without samples."""
+    Samples = sampling.GetSamples(TableName)
+    if not Samples:
+        return None
+    return next((Sample for Sample in Samples if Sample.Rows >= sampling.SampleProfileRows), Samples[-1])
+
+
+def ReadDistributions(Backend, Cursor, TableName: str, NumericColumns: List[tuple]) -> Dict[str, Dict[str, Any]]:
+    """Quartiles and outlier counts of (Column, Mean, StdDev) from one columnar read of their values."""
+    Selected = ", ".join(Backend.NumericValue(Backend.QuoteIdentifier(Column)) for Column, _, _ in NumericColumns)
+    Cursor.execute(f"SELECT {Selected} FROM {Backend.QuoteIdentifier(TableName)}")
+    Matrix = Backend.FetchMatrix(Cursor, len(NumericColumns))
+    return {Column: NumericDistribution(Matrix[:, Index], Mean, StdDev)
+            for Index, (Column, Mean, StdDev) in enumerate(NumericColumns)}
+
+
+def ProfileFromStats(TableName: str, Columns: List[str]) -> Dict[str, Any]:
+    """
+    Profile from the persisted column statistics. Quartiles and outlier counts come from the
+    values themselves: those of a sample on large tables (outlier counts scaled, with 95%
+    margins), otherwise those of the table.
+    """
+    ColumnStats = stats.GetColumnStats(TableName)
+    if not all(Column in ColumnStats for Column in Columns):
+        return None
+
+    Profiles = {}
+    NumericColumns = []
+    for Column in Columns:
+        Summary = stats.SummarizeColumn(ColumnStats[Column])
+        if Summary.get("numeric_values"):
+            NumericColumns.append((Column, Summary["mean"], Summary["stddev"]))
+        Profiles[Column] = {Key: RoundValue(Value) if Key not in ("min", "max") else RoundValue(Value, 12)
+                            for Key, Value in Summary.items()}
+    RowCount = ColumnStats[Columns[0]]["row_count"] if Columns else 0
+    Source = "column_stats"
+
+    if NumericColumns:
+        Chosen = ChooseSample(TableName)
+        Backend = backends.GetBackend("sqlite") if Chosen else backends.GetProfileBackend()
+        with tracing.Span("sql.profile", table=TableName, columns=len(NumericColumns), backend=Backend.Name,
+                          fraction=Chosen.Fraction if Chosen else 1.0), \
+                Backend.Acquire() as Connection, guards.Guard(Connection, CountBytes=False):
+            Distributions = ReadDistributions(Backend, Connection.cursor(), Chosen.Table if Chosen else TableName,
+                                              NumericColumns)
+        for Column, Distribution in Distributions.items():
+            if Chosen:
+                Scale = 1 / Chosen.Fraction
+                Margins = {}
+                for Key in ("iqr_outliers", "zscore_outliers"):
+                    Count = Distribution[Key]
+                    Distribution[Key] = round(Count * Scale)
+                    Margins[Key] = round(sampling.ConfidenceZ * math.sqrt(Count * (1 - Chosen.Fraction)) * Scale)
+                Distribution["margin_95"] = Margins
+            Profiles[Column].update(Distribution)
+        if Chosen:
+            Source += "; quartiles and outlier counts " + sampling.Describe(Chosen) + ", margin_95 holds the 95% margins of the outlier counts"
+    return {"table": TableName, "row_count": RowCount, "source": Source, "approximate": True, "columns": Profiles}
+
+
+def ScanProfile(Backend, Cursor, TableName: str, Columns: List[str]):
+    """(RowCount, per-column profiles) from one aggregate scan and one read of the numeric columns."""
+    Cursor.execute(BuildAggregateQuery(Backend, TableName, Columns))
+    Aggregates = Cursor.fetchone()
+
+    RowCount = Aggregates[0]
+    Profiles = {}
+    NumericColumns = []
+    for Index, Column in enumerate(Columns):
+        NonNull, Empty, Distinct, Minimum, Maximum, NumericCount, Mean, MeanSquare = Aggregates[1 + Index * 8:9 + Index * 8]
+        ColumnProfile = {
+            "nulls": RowCount - NonNull,
+            "empty_strings": Empty or 0,
+            "distinct": Distinct,
+            "min": RoundValue(Minimum, 12),
+            "max": RoundValue(Maximum, 12)
+        }
+        if NumericCount:
+            Variance = max((MeanSquare or 0.0) - Mean * Mean, 0.0)
+            # Sample standard deviation from the population moments
+            StdDev = math.sqrt(Variance * NumericCount / (NumericCount - 1)) if NumericCount > 1 else 0.0
+            ColumnProfile.update({
+                "numeric_values": NumericCount,
+                "mean": RoundValue(Mean),
+                "stddev": RoundValue(StdDev)
+            })
+            NumericColumns.append((Column, Mean, StdDev))
+        Profiles[Column] = ColumnProfile
+
+    if NumericColumns:
+        # Quantiles need the values themselves: one columnar read of the numeric columns only
+        for Column, Distribution in ReadDistributions(Backend, Cursor, TableName, NumericColumns).items():
+            Profiles[Column].update(Distribution)
+    return RowCount, Profiles
+
+
+# Counts that scale from a sample to the table; the rest (min/max, moments, quartiles) are read as is
+ScaledCounts = ("nulls", "empty_strings", "numeric_values", "iqr_outliers", "zscore_outliers")
+
+
+def ProfileFromSample(TableName: str, Columns: List[str]) -> Dict[str, Any]:
+    """Profile estimated from the smallest sample of at least SAMPLE_PROFILE_ROWS rows, with 95% margins on the counts."""
+    Chosen = ChooseSample(TableName)
+    if Chosen is None:
+        return None
+
+    Backend = backends.GetBackend("sqlite")
+    with tracing.Span("sql.profile", table=TableName, columns=len(Columns), backend=Backend.Name,
+                      fraction=Chosen.Fraction), Backend.Acquire() as Connection, guards.Guard(Connection, CountBytes=False):
+        _, Profiles = ScanProfile(Backend, Connection.cursor(), Chosen.Table, Columns)
+
+    Scale = 1 / Chosen.Fraction
+    for ColumnProfile in Profiles.values():
+        Margins = {}
+        for Key in ScaledCounts:
+            if Key in ColumnProfile:
+                Count = ColumnProfile[Key]
+                ColumnProfile[Key] = round(Count * Scale)
+                Margins[Key] = round(sampling.ConfidenceZ * math.sqrt(Count * (1 - Chosen.Fraction)) * Scale)
+        # Distinct values do not scale; the sample only bounds them from below
+        ColumnProfile["distinct_at_least"] = ColumnProfile.pop("distinct")
+        ColumnProfile["margin_95"] = Margins
+    return {"table": TableName, "row_count": Chosen.TableRows, "source": sampling.Describe(Chosen) + "; margin_95 holds the 95% margins of the counts; pass Exact=true for exact figures",
+            "approximate": True, "columns": Profiles}
+
+
+def ProfileColumns(TableName: str, Columns: List[str] = None, Exact: bool = False) -> Dict[str, Any]:
+    """
+    Null/empty/distinct counts, min/max, mean/stddev, quartiles and IQR/z-score outlier
+    counts for the requested columns. Answered from the precomputed column statistics
+    unless Exact is set or they are missing, then from a sample of a large table,
+    otherwise computed over the whole table.
+    """
+    Catalog = catalog.GetCatalog()
+    Columns = ResolveColumns(Catalog, TableName, Columns)
+
+    CacheKey = ("profile", Catalog.Version, TableName, tuple(Columns), Exact)
+    Found, Profile = cache.QueryCache.Get(CacheKey)
+    if Found:
+        return Profile
+
+    if not Exact:
+        Profile = ProfileFromStats(TableName, Columns)
+        if Profile is not None:
+            cache.QueryCache.Put(CacheKey, Profile)
+            return Profile
+        Profile = ProfileFromSample(TableName, Columns)
+        if Profile is not None:
+            cache.QueryCache.Put(CacheKey, Profile)
+            return Profile
+
+    # The value scan below is internal, so only the time and VM-step limits apply
+    Backend = backends.GetProfileBackend()
+    with tracing.Span("sql.profile", table=TableName, columns=len(Columns), backend=Backend.Name), \
+            Backend.Acquire() as Connection, guards.Guard(Connection, CountBytes=False):
+        RowCount, Profiles = ScanProfile(Backend, Connection.cursor(), TableName, Columns)
+
+    Profile = {"table": TableName, "row_count": RowCount, "source": "scan", "approximate": False, "columns": Profiles}
+    cache.QueryCache.Put(CacheKey, Profile)
+    return Profile
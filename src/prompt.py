@@ -0,0 +1,255 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import List, Dict, Any, Tuple
+import tools
+import catalog
+import stats
+
+# Schemas with at most this many tables are always sent whole
+MaxPromptTables = int(os.environ.get("PROMPT_MAX_TABLES", "4"))
+# Token budget for the conversation history (system prompt and tool schemas excluded)
+HistoryTokenBudget = int(os.environ.get("PROMPT_HISTORY_TOKENS", "4000"))
+SummaryTokenBudget = int(os.environ.get("PROMPT_SUMMARY_TOKENS", "200"))
+
+# Per-message framing the chat format adds on top of the content
+MessageOverheadTokens = 4
+
+_Encoding = None
+_EncodingLoaded = False
+
+
+def GetEncoding():
+    global _Encoding, _EncodingLoaded
+    if not _EncodingLoaded:
+        try:
+            import tiktoken
+            _Encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # No tiktoken (or no cached vocabulary): fall back to the ~4 characters per token rule
+            _Encoding = None
+        _EncodingLoaded = True
+    return _Encoding
+
+
+def CountTokens(Text: str) -> int:
+    if not Text:
+        return 0
+    Encoding = GetEncoding()
+    if Encoding is None:
+        return math.ceil(len(Text) / 4)
+    return len(Encoding.encode(Text))
+
+
+def MessageTokens(Message: Dict[str, Any]) -> int:
+    Tokens = MessageOverheadTokens + CountTokens(Message.get("content") or "")
+    for ToolCall in Message.get("tool_calls") or []:
+        Tokens += CountTokens(ToolCall["function"]["name"]) + CountTokens(ToolCall["function"]["arguments"])
+    return Tokens
+
+
+def Terms(Text: str) -> List[str]:
+    """Lower-case words of a name or question; a trailing plural "s" is dropped so "accounts" matches "account"."""
+    Words = re.findall(r"[a-z0-9]+", re.sub(r"([a-z])([A-Z])", r"\1 \2", Text or "").lower())
+    return [Word[:-1] if len(Word) > 3 and Word.endswith("s") else Word for Word in Words if len(Word) > 1]
+
+
+class TableIndex:
+    """
+    Keyword index over table names, descriptions and column names, used to pick the
+    tables worth describing in the prompt. Terms are weighted by inverse document frequency.
+    """
+
+    def __init__(self, SchemaDocument: Dict[str, Any]):
+        self.TableTerms = {}
+        for TableName, TableInfo in SchemaDocument.items():
+            if not (isinstance(TableInfo, dict) and "columns" in TableInfo):
+                continue
+            Weights = Counter()
+            for Term in Terms(TableName):
+                Weights[Term] += 3
+            for Column in TableInfo["columns"]:
+                for Term in Terms(Column["name"]):
+                    Weights[Term] += 2
+            for Term in Terms(TableInfo.get("description", "")):
+                Weights[Term] += 1
+            self.TableTerms[TableName] = Weights
+
+        DocumentFrequency = Counter(Term for Weights in self.TableTerms.values() for Term in Weights)
+        Count = len(self.TableTerms)
+        self.Idf = {Term: math.log(1 + Count / Frequency) for Term, Frequency in DocumentFrequency.items()}
+
+    def Rank(self, Question: str) -> List[Tuple[str, float]]:
+        QuestionTerms = set(Terms(Question))
+        Scores = []
+        for TableName, Weights in self.TableTerms.items():
+            Score = sum(Weights[Term] * self.Idf[Term] for Term in QuestionTerms if Term in Weights)
+            Scores.append((TableName, Score))
+        return sorted(Scores, key=lambda Item: Item[1], reverse=True)
+
+
+def DescribeColumnStats(Entry: Dict[str, Any]) -> str:
+    Description = f"nulls={Entry['null_count']}, ~{Entry['distinct_estimate']} distinct"
+    if Entry["min"] is not None:
+        Description += f", range {Entry['min']} .. {Entry['max']}"
+    return f"[{Description}]"
+
+
+def BuildTableSection(TableName: str, TableInfo: Dict[str, Any]) -> str:
+    column_stats = stats.GetColumnStats(TableName)
+    row_count = next(iter(column_stats.values()))["row_count"] if column_stats else None
+
+    section = f"TABLE: {TableName}\n"
+    section += f"Description: {TableInfo.get('description', 'No description')}\n"
+    if row_count is not None:
+        section += f"Rows: {row_count}\n"
+    section += "COLUMNS:\n"
+
+    for col_info in TableInfo["columns"]:
+        col_name = col_info["name"]
+        section += f"  - {col_name} ({col_info['type']})"
+        if col_name in column_stats:
+            section += f" {DescribeColumnStats(column_stats[col_name])}"
+        section += "\n"
+
+    return section + "\n"
+
+
+def GetTableIndex() -> TableIndex:
+    Catalog = catalog.GetCatalog()
+    return Catalog.Memoize("table_index", lambda: TableIndex(Catalog.SchemaDocument))
+
+
+def SelectTables(Question: str = None) -> List[str]:
+    """Every table for small schemas, otherwise the ones the question is most likely about."""
+    Index = GetTableIndex()
+    TableNames = list(Index.TableTerms)
+    if len(TableNames) <= MaxPromptTables:
+        return TableNames
+
+    Ranked = Index.Rank(Question or "")
+    Selected = [TableName for TableName, Score in Ranked[:MaxPromptTables] if Score > 0]
+    return Selected or [TableName for TableName, _ in Ranked[:MaxPromptTables]]
+
+
+def BuildSystemMessage(Tables: List[str] = None) -> Dict[str, Any]:
+    """The schema prompt for the given tables, built once per table set and catalog version."""
+    Catalog = catalog.GetCatalog()
+    DbSchema = tools.GetTablesSchema()
+    if Tables is None:
+        Tables = [Name for Name, Info in DbSchema.items() if isinstance(Info, dict) and "columns" in Info]
+
+    def Build():
+        schema_description = "DATABASE SCHEMA INFORMATION:\n\n"
+        for table_name in Tables:
+            schema_description += Catalog.Memoize(f"prompt_table:{table_name}",
+                                                  lambda: BuildTableSection(table_name, DbSchema[table_name]))
+
+        Omitted = [Name for Name, Info in DbSchema.items()
+                   if isinstance(Info, dict) and "columns" in Info and Name not in Tables]
+        if Omitted:
+            schema_description += f"OTHER TABLES (columns not listed, ask the tools for details): {', '.join(Omitted)}\n\n"
+
+        return {
+            "role": "system",
+            "content": f"You are a SQL Data Science Assistant. You can help users query databases using SQL. When appropriate, use the selectSQL tool to retrieve data from the database. For counts, sums, averages, grouping or joins use the querySQL tool with a single SELECT statement, so the arithmetic happens in the database in one call. For data-quality questions (empty fields, distinct values, value ranges, outliers) use the profileColumns tool, which computes the statistics over the whole table in one call. When several of these calls don't depend on each other (the same check on every table, profiling several tables), send them together in one batchSQL call, which runs them in parallel. On large tables querySQL and profileColumns may answer from a sample: such results are marked as estimates with a 95% margin of error, so present them as approximate, and repeat the call with Exact=true when the user asks for exact numbers. Always follow safe practices and never attempt to modify the database.\n\n{schema_description}\n\nIMPORTANT: BEFORE FORMING ANY SQL QUERY, you MUST verify that every column name you intend to use exists in the schema above. The tool will reject any queries that reference non-existent columns.\n\nCRITICAL RULES FOR QUERYING:\n1. ONLY use the exact column names listed in the schema above - NO EXCEPTIONS\n2. Do not invent, guess, or hallucinate any column names that are not explicitly listed\n3. When using WHERE or ORDER BY clauses, use only the valid column names provided\n4. If uncertain, query without WHERE clause first to see sample data and confirm column names\n5. IMPORTANT: Some column names contain spaces (like \"Clearing Date\", \"Transaction Value\"). Use them exactly as shown, including spaces, and wrap them in double quotes in querySQL statements.\n\nFAILURE TO FOLLOW THESE RULES WILL RESULT IN QUERY ERRORS."
+        }
+
+    Message = Catalog.Memoize("system_message:" + "\x1f".join(Tables), Build)
+    return dict(Message)
+
+
+def ToolSchemaTokens() -> int:
+    return catalog.GetCatalog().Memoize("tool_schema_tokens", lambda: CountTokens(json.dumps(tools.GetToolSchemas())))
+
+
+def GroupTurns(Messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Splits the history into units that must be kept or dropped together (tool results stay with their call)."""
+    Units = []
+    for Message in Messages:
+        if Message.get("role") == "tool" and Units:
+            Units[-1].append(Message)
+        else:
+            Units.append([Message])
+    return Units
+
+
+def SummarizeDropped(Dropped: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """A short note standing in for trimmed turns: the user's earlier questions, newest kept first."""
+    Questions = [" ".join((Message.get("content") or "").split())[:160]
+                 for Message in Dropped if Message.get("role") == "user" and Message.get("content")]
+    Kept = []
+    Tokens = 0
+    for Question in reversed(Questions):
+        Cost = CountTokens(Question) + 2
+        if Tokens + Cost > SummaryTokenBudget:
+            break
+        Kept.insert(0, Question)
+        Tokens += Cost
+
+    Content = f"{len(Dropped)} earlier messages were trimmed from this conversation."
+    if Kept:
+        Content += " Earlier the user asked: " + "; ".join(f'"{Question}"' for Question in Kept)
+    return {"role": "system", "content": Content}
+
+
+def TrimHistory(Messages: List[Dict[str, Any]], Budget: int = HistoryTokenBudget):
+    """
+    Keeps the newest turns that fit in Budget tokens (the latest one always) and replaces
+    the rest with a one-line summary. Returns (Messages, Dropped).
+    """
+    Units = GroupTurns(Messages)
+    if sum(MessageTokens(Message) for Message in Messages) > Budget:
+        # Leave room for the summary that replaces the trimmed turns
+        Budget -= SummaryTokenBudget
+    Kept = []
+    Tokens = 0
+    while Units:
+        Cost = sum(MessageTokens(Message) for Message in Units[-1])
+        if Kept and Tokens + Cost > Budget:
+            break
+        Kept = Units.pop() + Kept
+        Tokens += Cost
+
+    # A reply never opens the kept history without the request it answers
+    while Kept and Kept[0].get("role") == "tool":
+        Kept.pop(0)
+
+    Dropped = [Message for Unit in Units for Message in Unit]
+    if Dropped:
+        Kept = [SummarizeDropped(Dropped)] + Kept
+    return Kept, Dropped
+
+
+def PrepareMessages(Messages: List[Dict[str, Any]]):
+    """
+    Puts the schema prompt first (client system messages follow it), trims the history
+    to the token budget and returns (Messages, TokenReport).
+    """
+    SystemMessages = [Message for Message in Messages if Message.get("role") == "system"]
+    History = [Message for Message in Messages if Message.get("role") != "system"]
+    Question = next((Message.get("content") for Message in reversed(History) if Message.get("role") == "user"), "")
+
+    Tables = SelectTables(Question)
+    SchemaMessage = BuildSystemMessage(Tables)
+    Kept, Dropped = TrimHistory(History)
+    Prepared = [SchemaMessage] + SystemMessages + Kept
+
+    SystemTokens = sum(MessageTokens(Message) for Message in [SchemaMessage] + SystemMessages)
+    HistoryTokens = sum(MessageTokens(Message) for Message in Kept)
+    ToolTokens = ToolSchemaTokens()
+    Report = {
+        "encoding": "o200k_base" if GetEncoding() is not None else "approximate",
+        "system_tokens": SystemTokens,
+        "tool_schema_tokens": ToolTokens,
+        "history_tokens": HistoryTokens,
+        "history_budget": HistoryTokenBudget,
+        "dropped_messages": len(Dropped),
+        "dropped_tokens": sum(MessageTokens(Message) for Message in Dropped),
+        "prompt_tokens": SystemTokens + ToolTokens + HistoryTokens,
+        "tables": Tables,
+        "tables_total": len(GetTableIndex().TableTerms)
+    }
+    return Prepared, Report
@@ -0,0 +1,325 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import List, Dict, Any, Optional
+import ingest
+import pool
+import sampling
+import stats
+
+Logger = logging.getLogger(__name__)
+
+StateTable = "_ingest_state"
+# Re-ingest applies the row-level difference to the live table instead of rebuilding the file
+IncrementalReingest = os.environ.get("INGEST_INCREMENTAL", "1") == "1"
+# Columns that identify a row across extracts; without them rows are matched on their full content
+KeyColumns = [Column.strip() for Column in os.environ.get("INGEST_KEY_COLUMNS", "").split(",") if Column.strip()]
+# Readers are only locked out while the change commits; this is how long the commit waits for them
+BusyTimeoutMs = 30000
+FileHashBlock = 1024 * 1024
+
+
+class SourceChangedShape(Exception):
+    """The source no longer fits the table (columns or key changed); only a full rebuild can load it."""
+
+
+def RowsTableName(TableName: str) -> str:
+    return f"_ingest_rows_{TableName}"
+
+
+def HashFile(Path: str) -> str:
+    Digest = hashlib.sha256()
+    with open(Path, "rb") as File:
+        for Block in iter(lambda: File.read(FileHashBlock), b""):
+            Digest.update(Block)
+    return Digest.hexdigest()
+
+
+def RowHash(*Values) -> int:
+    # Signed 64 bits, so SQLite stores it as an INTEGER
+    return int.from_bytes(hashlib.blake2b(repr(Values).encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+def RowKey(*Values) -> str:
+    return json.dumps(Values, default=str)
+
+
+def RegisterFunctions(Connection):
+    # Hashed in SQL, so stored and staged rows are compared after the same column affinity
+    Connection.create_function("ingest_row_hash", -1, RowHash, deterministic=True)
+    Connection.create_function("ingest_row_key", -1, RowKey, deterministic=True)
+
+
+def EnsureStateTable(Connection):
+    Connection.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{StateTable}" (
+            table_name TEXT PRIMARY KEY,
+            source_path TEXT NOT NULL,
+            source_hash TEXT NOT NULL,
+            key_columns TEXT NOT NULL,
+            chunk_rows INTEGER NOT NULL,
+            chunk_hashes TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+
+
+def LoadState(Connection, TableName: str) -> Optional[Dict[str, Any]]:
+    Exists = Connection.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (StateTable,)).fetchone()
+    if not Exists:
+        return None
+    Cursor = Connection.execute(f'SELECT * FROM "{StateTable}" WHERE table_name = ?', (TableName,))
+    Row = Cursor.fetchone()
+    if Row is None:
+        return None
+    State = dict(zip([Description[0] for Description in Cursor.description], Row))
+    State["key_columns"] = json.loads(State["key_columns"])
+    State["chunk_hashes"] = json.loads(State["chunk_hashes"])
+    return State
+
+
+def SaveState(Connection, TableName: str, SourcePath: str, SourceHash: str, ChunkHashes: List[str], RowCount: int):
+    EnsureStateTable(Connection)
+    Connection.execute(f'INSERT OR REPLACE INTO "{StateTable}" VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                       (TableName, SourcePath, SourceHash, json.dumps(KeyColumns), ingest.ChunkRows,
+                        json.dumps(ChunkHashes), RowCount, time.time()))
+
+
+def Quote(Name: str) -> str:
+    return '"' + Name.replace('"', '""') + '"'
+
+
+def KeyExpression(Columns: List[str]) -> str:
+    if not KeyColumns:
+        return f'ingest_row_hash({", ".join(map(Quote, Columns))})'
+    return f'ingest_row_key({", ".join(map(Quote, KeyColumns))})'
+
+
+def RecordState(Connection, TableName: str, SourcePath: str, ChunkHashes: List[str]):
+    """
+    After a full load: remembers the source hash, its chunk hashes and every row's key and
+    hash, which the next re-ingest diffs against. Rows are numbered in source order, so
+    rowid - 1 is the row's position in the file.
+    """
+    Columns = stats.TableColumns(Connection, TableName)
+    Missing = [Column for Column in KeyColumns if Column not in Columns]
+    if Missing:
+        raise ValueError(f"INGEST_KEY_COLUMNS names columns missing from '{TableName}': {Missing}")
+    RegisterFunctions(Connection)
+    RowsTable = Quote(RowsTableName(TableName))
+    Hash = f'ingest_row_hash({", ".join(map(Quote, Columns))})'
+    with Connection:
+        Connection.execute(f"DROP TABLE IF EXISTS {RowsTable}")
+        Connection.execute(f"CREATE TABLE {RowsTable} (row_id INTEGER PRIMARY KEY, key NOT NULL, hash INTEGER NOT NULL, "
+                           f"chunk INTEGER NOT NULL)")
+        Connection.execute(f"INSERT INTO {RowsTable} SELECT rowid, {KeyExpression(Columns)}, {Hash}, "
+                           f"(rowid - 1) / {ingest.ChunkRows} FROM {Quote(TableName)}")
+        Connection.execute(f"CREATE INDEX {Quote(RowsTableName(TableName) + '_key')} ON {RowsTable} (key)")
+        RowCount = Connection.execute(f"SELECT COUNT(*) FROM {RowsTable}").fetchone()[0]
+        SaveState(Connection, TableName, SourcePath, HashFile(SourcePath), ChunkHashes, RowCount)
+
+
+def StageSource(Connection, SourcePath: str, TableName: str, Columns: List[str], State: Dict[str, Any]):
+    """
+    Reads the source once. Chunks whose hash matches the same chunk of the last load are
+    skipped; the rest go into temp.staged, typed like the table. Returns (ChunkHashes, Kept).
+    Raises SourceChangedShape when a value needs a wider column type than the table has, as
+    a full ingest would then declare the wider type.
+    """
+    Headers, Rows = ingest.OpenSource(SourcePath)
+    if Headers != Columns:
+        raise SourceChangedShape(f"Source columns differ from the columns of '{TableName}'")
+
+    Declared = {Row[1]: Row[2] for Row in Connection.execute(f"PRAGMA table_info({Quote(TableName)})").fetchall()}
+    Definitions = ", ".join(f"{Quote(Column)} {Declared[Column]}" for Column in Columns)
+    Connection.execute("DROP TABLE IF EXISTS temp.staged")
+    Connection.execute(f"CREATE TEMP TABLE staged ({Definitions}, __ordinal INTEGER, __chunk INTEGER)")
+    Insert = f"INSERT INTO temp.staged VALUES ({', '.join('?' * len(Columns))}, ?, ?)"
+    # A TEXT column with no values yet is one ingest could not type; the first values decide it
+    Types = [None if Declared[Column] == "TEXT" and Connection.execute(
+                 f"SELECT 1 FROM {Quote(TableName)} WHERE {Quote(Column)} IS NOT NULL LIMIT 1").fetchone() is None
+             else Declared[Column] for Column in Columns]
+
+    Previous = State["chunk_hashes"] if State["chunk_rows"] == ingest.ChunkRows else []
+    ChunkHashes = []
+    Kept = []
+    Ordinal = 0
+    for Index, Chunk in enumerate(ingest.Chunks(Rows, len(Headers), ingest.ChunkRows)):
+        Hash = ingest.ChunkHash(Chunk)
+        ChunkHashes.append(Hash)
+        if Index < len(Previous) and Previous[Index] == Hash:
+            # Same rows at the same position as last time: they are in the table already
+            Kept.append(Index)
+        else:
+            for Row in Chunk:
+                for Position, Value in enumerate(Row):
+                    if Value is not None:
+                        Current = Types[Position]
+                        if ingest.WidenType(Current, ingest.ValueType(Value)) != (Current or "TEXT"):
+                            raise SourceChangedShape(f"Column '{Columns[Position]}' now holds {ingest.ValueType(Value)} "
+                                                     f"values, wider than its {Current or 'TEXT'} type")
+            Connection.executemany(Insert, ([ingest.ConvertValue(Value) for Value in Row] + [Ordinal + Offset, Index]
+                                            for Offset, Row in enumerate(Chunk)))
+        Ordinal += len(Chunk)
+    return ChunkHashes, Kept
+
+
+def DiffStaged(Connection, TableName: str, Columns: List[str], Kept: List[int]) -> Dict[str, int]:
+    """
+    Matches staged rows to stored rows of the re-read chunks on (key, n-th occurrence of the key)
+    and fills temp.changes with one row per insert ("I"), update ("U"), move ("M") and delete ("D").
+    """
+    RowsTable = Quote(RowsTableName(TableName))
+    Connection.execute("DROP TABLE IF EXISTS temp.kept")
+    Connection.execute("CREATE TEMP TABLE kept (chunk INTEGER PRIMARY KEY)")
+    Connection.executemany("INSERT INTO temp.kept VALUES (?)", ((Chunk,) for Chunk in Kept))
+
+    Connection.execute("DROP TABLE IF EXISTS temp.source")
+    Connection.execute(f"CREATE TEMP TABLE source AS SELECT rowid AS staged_id, {KeyExpression(Columns)} AS key, "
+                       f'ingest_row_hash({", ".join(map(Quote, Columns))}) AS hash, __chunk AS chunk, '
+                       f"ROW_NUMBER() OVER (PARTITION BY {KeyExpression(Columns)} ORDER BY __ordinal) AS n "
+                       f"FROM temp.staged")
+    Connection.execute("DROP TABLE IF EXISTS temp.target")
+    Connection.execute(f"CREATE TEMP TABLE target AS SELECT row_id, key, hash, "
+                       f"ROW_NUMBER() OVER (PARTITION BY key ORDER BY row_id) AS n FROM {RowsTable} "
+                       f"WHERE chunk NOT IN (SELECT chunk FROM temp.kept)")
+    Connection.execute("CREATE INDEX temp.source_key ON source (key, n)")
+    Connection.execute("CREATE INDEX temp.target_key ON target (key, n)")
+
+    if KeyColumns:
+        Duplicate = Connection.execute(
+            f"SELECT key FROM temp.source WHERE n > 1 UNION ALL "
+            f"SELECT s.key FROM temp.source s JOIN {RowsTable} r ON r.key = s.key "
+            f"WHERE r.chunk IN (SELECT chunk FROM temp.kept) LIMIT 1").fetchone()
+        if Duplicate:
+            raise ValueError(f"INGEST_KEY_COLUMNS {KeyColumns} do not identify rows uniquely; key {Duplicate[0]} repeats")
+
+    Connection.execute("DROP TABLE IF EXISTS temp.changes")
+    Connection.execute("CREATE TEMP TABLE changes (kind TEXT NOT NULL, staged_id INTEGER, row_id INTEGER)")
+    Connection.execute("""
+        INSERT INTO temp.changes
+        SELECT CASE WHEN t.row_id IS NULL THEN 'I' WHEN t.hash != s.hash THEN 'U' ELSE 'M' END, s.staged_id, t.row_id
+        FROM temp.source s LEFT JOIN temp.target t ON t.key = s.key AND t.n = s.n
+    """)
+    Connection.execute("""
+        INSERT INTO temp.changes
+        SELECT 'D', NULL, t.row_id FROM temp.target t
+        WHERE NOT EXISTS (SELECT 1 FROM temp.source s WHERE s.key = t.key AND s.n = t.n)
+    """)
+    Connection.execute("CREATE INDEX temp.changes_kind ON changes (kind, row_id)")
+    return dict(Connection.execute("SELECT kind, COUNT(*) FROM temp.changes GROUP BY kind").fetchall())
+
+
+def ChangedColumns(Connection, TableName: str, Columns: List[str]) -> List[str]:
+    """Columns whose value differs in at least one updated row."""
+    if not Connection.execute("SELECT 1 FROM temp.changes WHERE kind = 'U' LIMIT 1").fetchone():
+        return []
+    Checks = ", ".join(f"MAX(s.{Quote(Column)} IS NOT t.{Quote(Column)})" for Column in Columns)
+    Row = Connection.execute(f"SELECT {Checks} FROM temp.changes c JOIN temp.staged s ON s.rowid = c.staged_id "
+                             f"JOIN {Quote(TableName)} t ON t.rowid = c.row_id WHERE c.kind = 'U'").fetchone()
+    return [Column for Column, Changed in zip(Columns, Row) if Changed]
+
+
+def ApplyChanges(Connection, TableName: str, Columns: List[str], Changed: List[str], Counts: Dict[str, int]):
+    """Deletes, updates and inserts on the live table, its row map and its samples; the caller commits."""
+    Table = Quote(TableName)
+    RowsTable = Quote(RowsTableName(TableName))
+    Names = ", ".join(map(Quote, Columns))
+    # New rows get rowids above every rowid used so far, so none is reused for a different row
+    NextRowId = Connection.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {Table}").fetchone()[0]
+
+    if Counts.get("D"):
+        Connection.execute(f"DELETE FROM {Table} WHERE rowid IN (SELECT row_id FROM temp.changes WHERE kind = 'D')")
+        Connection.execute(f"DELETE FROM {RowsTable} WHERE row_id IN (SELECT row_id FROM temp.changes WHERE kind = 'D')")
+    if Changed:
+        Assignments = ", ".join(f"{Quote(Column)} = s.{Quote(Column)}" for Column in Changed)
+        Connection.execute(f"UPDATE {Table} SET {Assignments} FROM temp.changes c JOIN temp.staged s "
+                           f"ON s.rowid = c.staged_id WHERE c.kind = 'U' AND {Table}.rowid = c.row_id")
+    if Counts.get("I"):
+        Connection.execute(f"UPDATE temp.changes SET row_id = {NextRowId} + staged_id WHERE kind = 'I'")
+        Connection.execute(f"INSERT INTO {Table} (rowid, {Names}) SELECT c.row_id, {', '.join('s.' + Quote(Column) for Column in Columns)} "
+                           f"FROM temp.changes c JOIN temp.staged s ON s.rowid = c.staged_id WHERE c.kind = 'I' ORDER BY c.row_id")
+
+    # Every re-read row's key, hash and chunk position, whether it changed or only moved
+    Connection.execute(f"INSERT OR REPLACE INTO {RowsTable} (row_id, key, hash, chunk) "
+                       f"SELECT c.row_id, s.key, s.hash, s.chunk FROM temp.changes c "
+                       f"JOIN temp.source s ON s.staged_id = c.staged_id WHERE c.kind != 'D'")
+
+    Touched = "SELECT row_id FROM temp.changes WHERE kind IN ('I', 'U', 'D')"
+    return sampling.ApplyRowChanges(Connection, TableName, Touched)
+
+
+def RefreshTable(Connection, SourcePath: str, TableName: str) -> Dict[str, Any]:
+    """
+    Re-ingests SourcePath into TableName by applying only the rows that changed since the last
+    load, in one transaction; queries keep reading the old rows until it commits. Column
+    statistics are then refreshed for the changed columns only. Raises SourceChangedShape
+    when the table has to be rebuilt instead.
+    """
+    Started = time.perf_counter()
+    State = LoadState(Connection, TableName)
+    if State is None or State["key_columns"] != KeyColumns:
+        raise SourceChangedShape(f"No incremental ingest state for '{TableName}' with key {KeyColumns}")
+    if pool.PoolImmutable:
+        raise SourceChangedShape("DB_POOL_IMMUTABLE readers would not see changes made in place")
+
+    SourceHash = HashFile(SourcePath)
+    Report = {"table": TableName, "source": SourcePath, "mode": "unchanged", "inserted": 0, "updated": 0,
+              "deleted": 0, "changed_columns": []}
+    if SourceHash == State["source_hash"]:
+        # Nothing is written, so the catalog version and every cache entry stay valid
+        return dict(Report, seconds=round(time.perf_counter() - Started, 3))
+
+    Columns = stats.TableColumns(Connection, TableName)
+    RegisterFunctions(Connection)
+    Connection.execute(f"PRAGMA busy_timeout = {BusyTimeoutMs}")
+    try:
+        ChunkHashes, Kept = StageSource(Connection, SourcePath, TableName, Columns, State)
+        Counts = DiffStaged(Connection, TableName, Columns, Kept)
+        Changed = ChangedColumns(Connection, TableName, Columns)
+        # Staging only wrote temp tables; the write lock on the live table starts here
+        Connection.commit()
+
+        Connection.execute("BEGIN IMMEDIATE")
+        try:
+            Samples = ApplyChanges(Connection, TableName, Columns, Changed, Counts)
+            RowCount = Connection.execute(f"SELECT COUNT(*) FROM {Quote(TableName)}").fetchone()[0]
+            SaveState(Connection, TableName, SourcePath, SourceHash, ChunkHashes, RowCount)
+            Connection.commit()
+        except Exception:
+            Connection.rollback()
+            raise
+    finally:
+        for Temporary in ("staged", "kept", "source", "target", "changes"):
+            Connection.execute(f"DROP TABLE IF EXISTS temp.{Temporary}")
+
+    # Deletes shrink every column's counts; appends merge into the stored sketches; updates
+    # rebuild only the columns they touched
+    if Counts.get("D"):
+        Stats = [stats.RefreshColumnStats(Connection, TableName, Full=True)]
+    else:
+        Stats = [stats.RefreshColumnStats(Connection, TableName)] if Counts.get("I") else []
+        if Changed:
+            Stats.append(stats.RefreshColumnStats(Connection, TableName, Columns=Changed))
+    if Samples is None:
+        # The table crossed SAMPLE_MIN_ROWS in one direction or the other
+        Samples = sampling.BuildSamples(Connection, TableName)
+
+    Report.update({
+        "mode": "incremental",
+        "chunks": len(ChunkHashes),
+        "chunks_unchanged": len(Kept),
+        "rows": RowCount,
+        "inserted": Counts.get("I", 0),
+        "updated": Counts.get("U", 0),
+        "deleted": Counts.get("D", 0),
+        "changed_columns": Changed,
+        "stats": Stats,
+        "samples": Samples,
+        "seconds": round(time.perf_counter() - Started, 3)
+    })
+    Logger.info("Re-ingest finished: %s", {Key: Value for Key, Value in Report.items() if Key not in ("stats", "samples")})
+    return Report
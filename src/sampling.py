@@ -0,0 +1,344 @@
+import math
+import os
+import time
+from collections import namedtuple
+from typing import List, Dict, Any, Optional, Tuple
+import pool
+import catalog
+import lexer
+
+SamplesTable = "_samples"
+# Nested Bernoulli samples kept per table, as fractions of its rows
+SampleFractions = sorted(float(Fraction) for Fraction in os.environ.get("SAMPLE_FRACTIONS", "0.01,0.1").split(",")
+                         if Fraction.strip())
+# Smaller tables are scanned in full; a sample would not save anything
+SampleMinRows = int(os.environ.get("SAMPLE_MIN_ROWS", "100000"))
+# Matching sample rows an estimate needs (per result row) before it is trusted; fewer escalate
+# to the next larger sample and finally to the full table. 400 hits keep a count within about 10%.
+SampleMinMatches = int(os.environ.get("SAMPLE_MIN_MATCHES", "400"))
+# profileColumns reads the smallest sample with at least this many rows (quartiles need values)
+SampleProfileRows = int(os.environ.get("SAMPLE_PROFILE_ROWS", "10000"))
+ConfidenceZ = 1.96
+
+# A row is in the sample at fraction p when its hashed rowid falls below p of the 32-bit range,
+# so every smaller sample is a subset of the larger ones and rebuilds pick the same rows
+HashMultiplier = 2654435761
+HashRange = 1 << 32
+
+Sample = namedtuple("Sample", ["Fraction", "Table", "Rows", "TableRows"])
+
+
+def SampleTableName(TableName: str, Fraction: float) -> str:
+    return f"_sample_{TableName}_{Fraction * 100:g}".replace(".", "_")
+
+
+def EnsureSamplesTable(Connection):
+    Connection.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{SamplesTable}" (
+            table_name TEXT NOT NULL,
+            fraction REAL NOT NULL,
+            sample_table TEXT NOT NULL,
+            sample_rows INTEGER NOT NULL,
+            table_rows INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (table_name, fraction)
+        )
+    """)
+
+
+def DropSamples(Connection, TableName: str):
+    Exists = Connection.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (SamplesTable,)).fetchone()
+    if not Exists:
+        return
+    for (SampleTable,) in Connection.execute(f'SELECT sample_table FROM "{SamplesTable}" WHERE table_name = ?',
+                                             (TableName,)).fetchall():
+        Connection.execute(f'DROP TABLE IF EXISTS "{SampleTable}"')
+    Connection.execute(f'DELETE FROM "{SamplesTable}" WHERE table_name = ?', (TableName,))
+
+
+def BuildSamples(Connection, TableName: str) -> Dict[str, Any]:
+    """
+    (Re)builds the sample tables of TableName: one pass over the table for the largest
+    fraction, each smaller sample filtered from the previous one. Tables under
+    SampleMinRows get none (and lose any they had).
+    """
+    Started = time.perf_counter()
+    TableRows = Connection.execute(f'SELECT COUNT(*) FROM "{TableName}"').fetchone()[0]
+    with Connection:
+        DropSamples(Connection, TableName)
+        if TableRows < SampleMinRows or not SampleFractions:
+            return {"table": TableName, "samples": [], "seconds": round(time.perf_counter() - Started, 3)}
+
+        EnsureSamplesTable(Connection)
+        Columns = ", ".join(f'"{Row[1]}"' for Row in Connection.execute(f"PRAGMA table_info('{TableName}')").fetchall())
+        Source, Key = TableName, "rowid"
+        Built = []
+        for Fraction in reversed(SampleFractions):
+            SampleTable = SampleTableName(TableName, Fraction)
+            # Sample rows keep the source rowid, so the nested samples hash the same values
+            Connection.execute(f'CREATE TABLE "{SampleTable}" AS SELECT {Key} AS "__rowid", {Columns} FROM "{Source}" '
+                               f'WHERE ({Key} * {HashMultiplier}) % {HashRange} < {int(Fraction * HashRange)}')
+            SampleRows = Connection.execute(f'SELECT COUNT(*) FROM "{SampleTable}"').fetchone()[0]
+            Connection.execute(f'INSERT INTO "{SamplesTable}" VALUES (?, ?, ?, ?, ?, ?)',
+                               (TableName, Fraction, SampleTable, SampleRows, TableRows, time.time()))
+            Built.append({"fraction": Fraction, "rows": SampleRows})
+            Source, Key = SampleTable, '"__rowid"'
+    return {"table": TableName, "rows": TableRows, "samples": Built[::-1],
+            "seconds": round(time.perf_counter() - Started, 3)}
+
+
+def ApplyRowChanges(Connection, TableName: str, RowIdsQuery: str) -> Optional[Dict[str, Any]]:
+    """
+    Keeps the samples of TableName in step with rows inserted, updated or deleted in place:
+    the rowids RowIdsQuery selects are dropped from every sample and re-added where the row
+    still exists and hashes into it. Runs inside the caller's transaction. Returns None when
+    the table crossed SampleMinRows, which needs BuildSamples instead.
+    """
+    Samples = LoadSamples(Connection, TableName)
+    TableRows = Connection.execute(f'SELECT COUNT(*) FROM "{TableName}"').fetchone()[0]
+    if bool(Samples) != (TableRows >= SampleMinRows and bool(SampleFractions)):
+        return None
+
+    Columns = ", ".join(f'"{Row[1]}"' for Row in Connection.execute(f"PRAGMA table_info('{TableName}')").fetchall())
+    Updated = []
+    for Fraction, SampleTable, _, _ in Samples:
+        Connection.execute(f'DELETE FROM "{SampleTable}" WHERE "__rowid" IN ({RowIdsQuery})')
+        Connection.execute(f'INSERT INTO "{SampleTable}" SELECT rowid, {Columns} FROM "{TableName}" '
+                           f'WHERE rowid IN ({RowIdsQuery}) '
+                           f'AND (rowid * {HashMultiplier}) % {HashRange} < {int(Fraction * HashRange)}')
+        SampleRows = Connection.execute(f'SELECT COUNT(*) FROM "{SampleTable}"').fetchone()[0]
+        Connection.execute(f'UPDATE "{SamplesTable}" SET sample_rows = ?, table_rows = ?, updated_at = ? '
+                           f'WHERE table_name = ? AND fraction = ?', (SampleRows, TableRows, time.time(), TableName, Fraction))
+        Updated.append({"fraction": Fraction, "rows": SampleRows})
+    return {"table": TableName, "rows": TableRows, "samples": Updated}
+
+
+def EnsureSamples(Connection) -> List[Dict[str, Any]]:
+    """Builds samples for large tables that have none yet (databases created before sampling existed)."""
+    Tables = [Row[0] for Row in Connection.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()
+              if not catalog.IsInternalTable(Row[0])]
+    Reports = []
+    for TableName in Tables:
+        if LoadSamples(Connection, TableName):
+            continue
+        # Cheap upper bound first: the largest rowid, without counting every row
+        if (Connection.execute(f'SELECT MAX(rowid) FROM "{TableName}"').fetchone()[0] or 0) < SampleMinRows:
+            continue
+        Reports.append(BuildSamples(Connection, TableName))
+    return Reports
+
+
+def LoadSamples(Connection, TableName: str) -> List[Sample]:
+    Exists = Connection.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (SamplesTable,)).fetchone()
+    if not Exists:
+        return []
+    return [Sample(*Row) for Row in Connection.execute(
+        f'SELECT fraction, sample_table, sample_rows, table_rows FROM "{SamplesTable}" WHERE table_name = ? ORDER BY fraction',
+        (TableName,)).fetchall()]
+
+
+def GetSamples(TableName: str) -> List[Sample]:
+    """Samples of TableName, smallest first, memoized until the database changes."""
+    Catalog = catalog.GetCatalog()
+
+    def Load():
+        with pool.GetPool().Acquire() as Connection:
+            return LoadSamples(Connection, TableName)
+
+    return Catalog.Memoize(f"samples:{TableName}", Load)
+
+
+# Aggregates the estimator can scale: COUNT and SUM by 1/p, AVG as is
+EstimableAggregates = frozenset({"count", "sum", "total", "avg"})
+Aggregates = EstimableAggregates | {"min", "max", "group_concat", "string_agg"}
+# Anything that makes a row of the sample stand for something other than 1/p rows of the table
+UnsupportedKeywords = frozenset({"with", "join", "union", "intersect", "except", "having", "over", "distinct",
+                                 "filter", "natural"})
+
+# GroupParts is the statement without aggregates, ORDER BY and LIMIT for grouped queries, else None
+ApproximatePlan = namedtuple("ApproximatePlan", ["Table", "Parts", "TableIndex", "Items", "GroupParts"])
+
+
+def SplitTopLevel(Tokens: List[lexer.Token]) -> List[List[lexer.Token]]:
+    Items = [[]]
+    Depth = 0
+    for Item in Tokens:
+        if Item.Kind == "symbol" and Item.Text == "(":
+            Depth += 1
+        elif Item.Kind == "symbol" and Item.Text == ")":
+            Depth -= 1
+        elif Depth == 0 and Item.Kind == "symbol" and Item.Text == ",":
+            Items.append([])
+            continue
+        Items[-1].append(Item)
+    return Items
+
+
+def ClassifyItem(Tokens: List[lexer.Token]) -> Optional[Tuple[Optional[str], str]]:
+    """
+    (Aggregate, Argument) for "AGG(argument) [[AS] alias]", (None, "") for an expression
+    without aggregates (a group key), None for anything the estimator cannot scale.
+    """
+    Significant = [Index for Index, Item in enumerate(Tokens) if Item.Kind not in ("space", "comment")]
+    if not any(Tokens[Index].Kind == "function" and Tokens[Index].Value in Aggregates for Index in Significant):
+        return (None, "")
+    First = Tokens[Significant[0]]
+    if First.Kind != "function" or First.Value not in EstimableAggregates:
+        return None
+
+    # The aggregate call must be the whole expression, apart from an alias
+    Depth = 0
+    for Position, Index in enumerate(Significant[1:], start=1):
+        if Tokens[Index].Kind == "symbol" and Tokens[Index].Text == "(":
+            Depth += 1
+        elif Tokens[Index].Kind == "symbol" and Tokens[Index].Text == ")":
+            Depth -= 1
+            if Depth == 0:
+                break
+    else:
+        return None
+    Rest = [Tokens[Index] for Index in Significant[Position + 1:]]
+    if Rest and Rest[0].Kind == "keyword" and Rest[0].Value == "as":
+        Rest = Rest[1:]
+    if len(Rest) > 1 or (Rest and Rest[0].Kind not in ("word", "quoted", "column", "keyword")):
+        return None
+    Inner = Tokens[Significant[1] + 1:Significant[Position]]
+    if any(Item.Kind == "function" and Item.Value in Aggregates for Item in Inner):
+        return None
+    return (First.Value, "".join(Item.Text for Item in Inner).strip())
+
+
+def PlanApproximateQuery(Sql: str) -> Optional[ApproximatePlan]:
+    """
+    Recognizes single-table aggregate queries (SELECT COUNT/SUM/AVG ... FROM t [WHERE]
+    [GROUP BY] [ORDER BY] [LIMIT]) that a sample can answer. None for anything else.
+    """
+    Catalog = catalog.GetCatalog()
+    Tokens = list(lexer.GetLexicon(Catalog).Analyze(Sql).Tokens)
+    Significant = [Index for Index, Item in enumerate(Tokens) if Item.Kind not in ("space", "comment")]
+    Keywords = [Tokens[Index].Value for Index in Significant if Tokens[Index].Kind == "keyword"]
+    if not Keywords or Keywords[0] != "select" or Keywords.count("select") > 1 or Keywords.count("from") != 1:
+        return None
+    if UnsupportedKeywords & set(Keywords):
+        return None
+
+    From = next(Index for Index in Significant if Tokens[Index].Kind == "keyword" and Tokens[Index].Value == "from")
+    Depths = {}
+    Depth = 0
+    for Index in Significant:
+        if Tokens[Index].Kind == "symbol" and Tokens[Index].Text in "()":
+            Depth += 1 if Tokens[Index].Text == "(" else -1
+        Depths[Index] = Depth
+    After = [Index for Index in Significant if Index > From]
+    if not After or Tokens[After[0]].Kind not in ("word", "quoted"):
+        return None
+    TableIndex = After[0]
+    TableName = next((Name for Name in Catalog.TableNames if Name.lower() == Tokens[TableIndex].Value.lower()), None)
+    if TableName is None:
+        return None
+    # A second table after a comma (past an optional alias) is a join
+    if any(Tokens[Index].Kind == "symbol" and Tokens[Index].Text == "," for Index in After[1:3]):
+        return None
+
+    Items = []
+    Keys = []
+    for ItemTokens in SplitTopLevel(Tokens[Significant[0] + 1:From]):
+        Classified = ClassifyItem(ItemTokens)
+        if Classified is None:
+            return None
+        Items.append(Classified)
+        # Aggregates become NULL so that GROUP BY ordinals and aliases still name the same keys
+        Keys.append("".join(Item.Text for Item in ItemTokens) if Classified[0] is None else " NULL")
+    if not any(Aggregate for Aggregate, _ in Items):
+        return None
+
+    # Helper columns for the error bounds, appended after the visible ones
+    Hidden = ['COUNT(*) AS "__matches"']
+    for Position, (Aggregate, Argument) in enumerate(Items):
+        if Aggregate in ("sum", "total"):
+            Hidden.append(f'SUM(({Argument}) * ({Argument})) AS "__squares{Position}"')
+        elif Aggregate == "avg":
+            Hidden.append(f'COUNT({Argument}) AS "__count{Position}"')
+            Hidden.append(f'SUM(({Argument}) * ({Argument})) AS "__squares{Position}"')
+
+    Parts = [Item.Text for Item in Tokens]
+    GroupParts = None
+    if "group" in Keywords:
+        # A group with no rows in the sample is missing from its answer; the group list (without
+        # ORDER BY, which may name aggregates, and LIMIT) lets the caller count the groups
+        End = next((Index for Index in After if Tokens[Index].Kind == "keyword" and Tokens[Index].Value in ("order", "limit")
+                    and Depths[Index] == 0), len(Tokens))
+        GroupParts = ["SELECT" + ",".join(Keys) + " "] + [""] * (From - 1) + Parts[From:End] + [""] * (len(Tokens) - End)
+    Parts[From] = ", " + ", ".join(Hidden) + " " + Parts[From]
+    return ApproximatePlan(TableName, Parts, TableIndex, Items, GroupParts)
+
+
+def SampleQuery(Plan: ApproximatePlan, Chosen: Sample) -> str:
+    Parts = list(Plan.Parts)
+    Parts[Plan.TableIndex] = f'"{Chosen.Table}"'
+    return "".join(Parts)
+
+
+def GroupCountQuery(Plan: ApproximatePlan, TableName: str) -> str:
+    """Number of groups the plan's GROUP BY forms over TableName (the table or one of its samples)."""
+    Parts = list(Plan.GroupParts)
+    Parts[Plan.TableIndex] = f'"{TableName}"'
+    return f"SELECT COUNT(*) FROM ({''.join(Parts)})"
+
+
+def IndexedPlan(Connection, Query: str) -> bool:
+    """True when SQLite answers Query from indexes alone, without reading every row of a table."""
+    for Row in Connection.execute("EXPLAIN QUERY PLAN " + Query).fetchall():
+        Detail = Row[-1]
+        if Detail.startswith("SCAN ") and not Detail.startswith("SCAN (") and "COVERING INDEX" not in Detail:
+            return False
+    return True
+
+
+def EstimateRows(Plan: ApproximatePlan, Columns: List[str], Rows: List[tuple], Fraction: float):
+    """
+    Scales the sample's rows to the table and adds a "<column> ±" 95% margin after every
+    estimated column. Returns (Columns, Rows, Sufficient), where Sufficient is False when
+    some row rests on fewer than SampleMinMatches sample rows.
+    """
+    Visible = len(Plan.Items)
+    OutputColumns = []
+    for Name, (Aggregate, _) in zip(Columns[:Visible], Plan.Items):
+        OutputColumns.append(Name)
+        if Aggregate:
+            OutputColumns.append(f"{Name} ±")
+
+    Scale = 1 / Fraction
+    Sufficient = bool(Rows)
+    OutputRows = []
+    for Row in Rows:
+        Helpers = dict(zip(Columns[Visible:], Row[Visible:]))
+        if (Helpers["__matches"] or 0) < SampleMinMatches:
+            Sufficient = False
+        Output = []
+        for Position, (Value, (Aggregate, _)) in enumerate(zip(Row[:Visible], Plan.Items)):
+            if not Aggregate:
+                Output.append(Value)
+                continue
+            Margin = None
+            if Value is None:
+                Estimate = None
+            elif Aggregate == "count":
+                Estimate = round(Value * Scale)
+                Margin = round(ConfidenceZ * math.sqrt(Value * (1 - Fraction)) * Scale)
+            elif Aggregate in ("sum", "total"):
+                Estimate = Value * Scale
+                Margin = ConfidenceZ * math.sqrt((1 - Fraction) * max(Helpers[f"__squares{Position}"] or 0.0, 0.0)) * Scale
+            else:
+                Estimate = Value
+                Count = Helpers[f"__count{Position}"] or 0
+                if Count > 1:
+                    Variance = max((Helpers[f"__squares{Position}"] or 0.0) / Count - Value * Value, 0.0) * Count / (Count - 1)
+                    Margin = ConfidenceZ * math.sqrt(Variance / Count * (1 - Fraction))
+            Output += [Estimate, Margin]
+        OutputRows.append(Output)
+    return OutputColumns, OutputRows, Sufficient
+
+
+def Describe(Chosen: Sample) -> str:
+    return f"estimated from a {Chosen.Fraction * 100:g}% sample ({Chosen.Rows} of {Chosen.TableRows} rows)"
@@ -0,0 +1,211 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
+import cache
+import prompt
+
+# Idle sessions expire after this many seconds, in memory and on disk
+IdleSeconds = float(os.environ.get("SESSION_IDLE_SECONDS", "3600"))
+# Memory bound of the in-process store; least recently used sessions go first
+MaxSessions = int(os.environ.get("SESSION_STORE_ENTRIES", "1000"))
+MaxSessionBytes = int(os.environ.get("SESSION_STORE_BYTES", str(64 * 1024 * 1024)))
+# Optional SQLite file that keeps sessions across restarts and memory evictions ("" keeps them in memory only)
+SessionDatabasePath = os.environ.get("SESSION_DB_PATH", "")
+# Stored history beyond this many tokens is compacted, oldest turns first
+MaxSessionTokens = int(os.environ.get("SESSION_MAX_TOKENS", "16000"))
+# Tool results of older user turns are cut down to their first line
+FullToolResultTurns = int(os.environ.get("SESSION_FULL_TOOL_TURNS", "2"))
+CompactedToolResultChars = 200
+CompactedMarker = " [older result compacted]"
+MaxEarlierQuestions = 20
+
+Store = cache.ResultCache("session", MaxEntries=MaxSessions, MaxBytes=MaxSessionBytes, TtlSeconds=IdleSeconds)
+
+
+class SessionBusyError(Exception):
+    pass
+
+
+class Session:
+    """
+    One conversation kept on the server: the client's system messages, the full message
+    list (tool calls and results included) and a note of the turns compacted away.
+    """
+
+    def __init__(self, Id: str, System: List[Dict[str, Any]] = None, Messages: List[Dict[str, Any]] = None,
+                 Earlier: List[str] = None, Compacted: int = 0):
+        self.Id = Id
+        self.System = System or []
+        self.Messages = Messages or []
+        self.Earlier = Earlier or []
+        self.Compacted = Compacted
+
+    def History(self) -> List[Dict[str, Any]]:
+        """The messages a new turn starts from."""
+        History = list(self.System)
+        if self.Compacted:
+            Content = f"{self.Compacted} earlier messages were compacted out of this session."
+            if self.Earlier:
+                Content += " Earlier the user asked: " + "; ".join(f'"{Question}"' for Question in self.Earlier)
+            History.append({"role": "system", "content": Content})
+        return History + self.Messages
+
+    def Append(self, Messages: List[Dict[str, Any]]):
+        self.Messages.extend(Messages)
+        self.Compact()
+
+    def Compact(self):
+        # A turn is a user message and everything the model and tools answered it with
+        Turns = []
+        for Message in self.Messages:
+            if Message.get("role") == "user" or not Turns:
+                Turns.append([Message])
+            else:
+                Turns[-1].append(Message)
+
+        # Old tool results are the bulk of a session and rarely needed verbatim again
+        for Turn in Turns[:-FullToolResultTurns] if FullToolResultTurns else Turns:
+            for Index, Message in enumerate(Turn):
+                Content = Message.get("content") or ""
+                if Message.get("role") == "tool" and len(Content) > CompactedToolResultChars \
+                        and not Content.endswith(CompactedMarker):
+                    Turn[Index] = dict(Message, content=Content.splitlines()[0][:CompactedToolResultChars] + CompactedMarker)
+
+        # The newest turn always stays
+        Tokens = sum(prompt.MessageTokens(Message) for Turn in Turns for Message in Turn)
+        while len(Turns) > 1 and Tokens > MaxSessionTokens:
+            Dropped = Turns.pop(0)
+            Tokens -= sum(prompt.MessageTokens(Message) for Message in Dropped)
+            self.Compacted += len(Dropped)
+            if Dropped[0].get("role") == "user" and Dropped[0].get("content"):
+                self.Earlier.append(" ".join(Dropped[0]["content"].split())[:160])
+        self.Earlier = self.Earlier[-MaxEarlierQuestions:]
+        self.Messages = [Message for Turn in Turns for Message in Turn]
+
+    def AsDict(self) -> Dict[str, Any]:
+        # Messages are replaced, never edited in place, so copying the lists detaches a snapshot
+        return {"id": self.Id, "system": list(self.System), "messages": list(self.Messages),
+                "earlier": list(self.Earlier), "compacted": self.Compacted}
+
+    @classmethod
+    def FromDict(cls, Data: Dict[str, Any]) -> "Session":
+        return cls(Data["id"], list(Data["system"]), list(Data["messages"]), list(Data["earlier"]), Data["compacted"])
+
+
+class SessionDatabase:
+    """Write-through SQLite copy of the store; rows idle longer than IdleSeconds are purged on write."""
+
+    def __init__(self, Path: str):
+        self.Connection = sqlite3.connect(Path, check_same_thread=False, isolation_level=None)
+        self.Lock = threading.Lock()
+        with self.Lock:
+            self.Connection.execute("PRAGMA journal_mode = WAL")
+            self.Connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)")
+            self.Connection.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def Load(self, Id: str) -> Optional[Dict[str, Any]]:
+        with self.Lock:
+            Row = self.Connection.execute("SELECT data FROM sessions WHERE id = ? AND updated_at >= ?",
+                                          (Id, time.time() - IdleSeconds)).fetchone()
+        return json.loads(Row[0]) if Row else None
+
+    def Save(self, Data: Dict[str, Any]):
+        Now = time.time()
+        with self.Lock:
+            self.Connection.execute("INSERT OR REPLACE INTO sessions (id, data, updated_at) VALUES (?, ?, ?)",
+                                    (Data["id"], json.dumps(Data, default=str), Now))
+            self.Connection.execute("DELETE FROM sessions WHERE updated_at < ?", (Now - IdleSeconds,))
+
+    def Delete(self, Id: str):
+        with self.Lock:
+            self.Connection.execute("DELETE FROM sessions WHERE id = ?", (Id,))
+
+    def Count(self) -> int:
+        with self.Lock:
+            return self.Connection.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def Close(self):
+        with self.Lock:
+            self.Connection.close()
+
+
+Database = None
+DatabaseLock = threading.Lock()
+Claimed = set()
+ClaimedLock = threading.Lock()
+
+
+def GetDatabase() -> Optional[SessionDatabase]:
+    global Database
+    if not SessionDatabasePath:
+        return None
+    with DatabaseLock:
+        if Database is None:
+            Database = SessionDatabase(SessionDatabasePath)
+        return Database
+
+
+def Create(System: str = None) -> Session:
+    NewSession = Session(secrets.token_urlsafe(16), [{"role": "system", "content": System}] if System else [])
+    Save(NewSession)
+    return NewSession
+
+
+def Find(Id: str) -> Optional[Session]:
+    """The session from memory, else from the SQLite copy; None if unknown or idle too long."""
+    Found, Data = Store.Get(Id)
+    if not Found and GetDatabase() is not None:
+        Data = GetDatabase().Load(Id)
+        if Data is not None:
+            Store.Put(Id, Data)
+    return Session.FromDict(Data) if Data is not None else None
+
+
+def Save(SavedSession: Session):
+    Data = SavedSession.AsDict()
+    # Stored as a snapshot, so a turn that fails halfway leaves the session as it was
+    Store.Put(SavedSession.Id, Data)
+    if GetDatabase() is not None:
+        GetDatabase().Save(Data)
+
+
+def Delete(Id: str):
+    with Store.Lock:
+        if Id in Store.Entries:
+            Store.Remove(Id)
+    if GetDatabase() is not None:
+        GetDatabase().Delete(Id)
+
+
+@contextmanager
+def Claim(Id: str):
+    """One turn at a time per session; a second concurrent message gets SessionBusyError."""
+    with ClaimedLock:
+        if Id in Claimed:
+            raise SessionBusyError("This session is still answering a previous message")
+        Claimed.add(Id)
+    try:
+        yield
+    finally:
+        with ClaimedLock:
+            Claimed.discard(Id)
+
+
+def Stats() -> Dict[str, Any]:
+    Result = Store.Stats()
+    Result["persisted"] = GetDatabase().Count() if GetDatabase() is not None else None
+    return Result
+
+
+def Close():
+    global Database
+    with DatabaseLock:
+        if Database is not None:
+            Database.Close()
+            Database = None
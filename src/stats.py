@@ -0,0 +1,270 @@
+import hashlib
+import json
+import math
+import time
+from collections import Counter
+from typing import List, Dict, Any, Optional
+import pool
+import catalog
+
+StatsTable = "_column_stats"
+
+ChunkSize = 10000
+TopValues = 10
+# More candidates than reported keep the merged top-k close to exact across incremental refreshes
+TopCandidates = 50
+HllPrecision = 12
+HllRegisters = 1 << HllPrecision
+
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch; the registers are persisted with the column stats."""
+
+    def __init__(self, Registers: Optional[bytes] = None):
+        self.Registers = bytearray(Registers) if Registers else bytearray(HllRegisters)
+
+    def Add(self, Value: Any):
+        Digest = hashlib.blake2b(repr(Value).encode("utf-8"), digest_size=8).digest()
+        Hash = int.from_bytes(Digest, "big")
+        Index = Hash >> (64 - HllPrecision)
+        Remainder = Hash & ((1 << (64 - HllPrecision)) - 1)
+        Rank = (64 - HllPrecision) - Remainder.bit_length() + 1
+        if Rank > self.Registers[Index]:
+            self.Registers[Index] = Rank
+
+    def Estimate(self) -> int:
+        Alpha = 0.7213 / (1 + 1.079 / HllRegisters)
+        Raw = Alpha * HllRegisters * HllRegisters / sum(2.0 ** -Register for Register in self.Registers)
+        Zeros = self.Registers.count(0)
+        if Raw <= 2.5 * HllRegisters and Zeros:
+            # Small-range correction (linear counting)
+            return int(round(HllRegisters * math.log(HllRegisters / Zeros)))
+        return int(round(Raw))
+
+
+def OrderKey(Value: Any):
+    # SQLite ordering across storage classes: numbers < text < blobs
+    if isinstance(Value, (int, float)):
+        return (0, Value)
+    if isinstance(Value, str):
+        return (1, Value)
+    return (2, bytes(Value))
+
+
+def IsNumber(Value: Any) -> bool:
+    return isinstance(Value, (int, float)) and not isinstance(Value, bool) and not (isinstance(Value, float) and math.isnan(Value))
+
+
+class ColumnAccumulator:
+    def __init__(self, Stored: Optional[Dict[str, Any]] = None):
+        Stored = Stored or {}
+        self.RowCount = Stored.get("row_count", 0)
+        self.NullCount = Stored.get("null_count", 0)
+        self.EmptyCount = Stored.get("empty_count", 0)
+        self.NumericCount = Stored.get("numeric_count", 0)
+        self.Sum = Stored.get("sum", 0.0)
+        self.SumSquares = Stored.get("sum_squares", 0.0)
+        self.Minimum = Stored.get("min")
+        self.Maximum = Stored.get("max")
+        self.Sketch = HyperLogLog(Stored.get("hll"))
+        self.Top = Counter(dict(Stored.get("top_candidates", [])))
+
+    def Add(self, Values: List[Any]):
+        Chunk = Counter()
+        for Value in Values:
+            self.RowCount += 1
+            if Value is None:
+                self.NullCount += 1
+                continue
+            if isinstance(Value, str) and not Value.strip():
+                self.EmptyCount += 1
+            if IsNumber(Value):
+                self.NumericCount += 1
+                self.Sum += Value
+                self.SumSquares += Value * Value
+            if self.Minimum is None or OrderKey(Value) < OrderKey(self.Minimum):
+                self.Minimum = Value
+            if self.Maximum is None or OrderKey(Value) > OrderKey(self.Maximum):
+                self.Maximum = Value
+            if isinstance(Value, bytes):
+                self.Sketch.Add(Value)
+            else:
+                Chunk[Value] += 1
+
+        # Repeats don't change the sketch, so each distinct value of the chunk is hashed once
+        for Value in Chunk:
+            self.Sketch.Add(Value)
+        self.Top.update(Chunk)
+        if len(self.Top) > TopCandidates:
+            self.Top = Counter(dict(self.Top.most_common(TopCandidates)))
+
+    def Finish(self) -> Dict[str, Any]:
+        return {
+            "row_count": self.RowCount,
+            "null_count": self.NullCount,
+            "empty_count": self.EmptyCount,
+            "distinct_estimate": self.Sketch.Estimate(),
+            "numeric_count": self.NumericCount,
+            "sum": self.Sum,
+            "sum_squares": self.SumSquares,
+            "min": self.Minimum,
+            "max": self.Maximum,
+            "hll": bytes(self.Sketch.Registers),
+            "top_candidates": [[Value, Count] for Value, Count in self.Top.most_common(TopCandidates)]
+        }
+
+
+def EnsureStatsTable(Connection):
+    Connection.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{StatsTable}" (
+            table_name TEXT NOT NULL,
+            column_name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            null_count INTEGER NOT NULL,
+            empty_count INTEGER NOT NULL,
+            distinct_estimate INTEGER NOT NULL,
+            numeric_count INTEGER NOT NULL,
+            sum REAL,
+            sum_squares REAL,
+            min,
+            max,
+            hll BLOB,
+            histogram TEXT,  -- unused: quartiles and outliers need the values (see profiling.py)
+            top_candidates TEXT,
+            last_rowid INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (table_name, column_name)
+        )
+    """)
+
+
+def LoadStoredStats(Connection, TableName: str) -> Dict[str, Dict[str, Any]]:
+    Cursor = Connection.execute(
+        f'SELECT * FROM "{StatsTable}" WHERE table_name = ? ORDER BY position', (TableName,)
+    )
+    Names = [Description[0] for Description in Cursor.description]
+    Stored = {}
+    for Row in Cursor.fetchall():
+        Entry = dict(zip(Names, Row))
+        Entry["top_candidates"] = json.loads(Entry["top_candidates"]) if Entry["top_candidates"] else []
+        Stored[Entry["column_name"]] = Entry
+    return Stored
+
+
+def TableColumns(Connection, TableName: str) -> List[str]:
+    return [Row[1] for Row in Connection.execute(f"PRAGMA table_info('{TableName}')").fetchall()]
+
+
+def RefreshColumnStats(Connection, TableName: str, Full: bool = False, Columns: List[str] = None) -> Dict[str, Any]:
+    """
+    Brings the persisted statistics of TableName up to date. Rows appended since the last
+    refresh (rowid above the stored watermark) are merged into the stored sketches; anything
+    else (deletes, schema change, Full=True) rebuilds the listed Columns, or all of them.
+    """
+    Started = time.perf_counter()
+    EnsureStatsTable(Connection)
+    AllColumns = TableColumns(Connection, TableName)
+    Stored = {} if Full else LoadStoredStats(Connection, TableName)
+    RowCount, MaxRowId = Connection.execute(f'SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM "{TableName}"').fetchone()
+
+    Watermark = 0
+    Incremental = bool(Stored) and set(Stored) == set(AllColumns) and not Columns
+    if Incremental:
+        Watermark = min(Entry["last_rowid"] for Entry in Stored.values())
+        StoredRows = min(Entry["row_count"] for Entry in Stored.values())
+        NewRows = Connection.execute(f'SELECT COUNT(*) FROM "{TableName}" WHERE rowid > ?', (Watermark,)).fetchone()[0]
+        # Anything but a pure append (rows deleted or rewritten below the watermark) needs a rebuild
+        Incremental = StoredRows + NewRows == RowCount
+        if Incremental and NewRows == 0:
+            return {"table": TableName, "mode": "unchanged", "rows_scanned": 0, "seconds": 0.0}
+
+    Targets = AllColumns if Incremental or not Columns else [Column for Column in AllColumns if Column in Columns]
+    if not Incremental:
+        Watermark = 0
+        Stored = {}
+
+    Accumulators = {Column: ColumnAccumulator(Stored.get(Column)) for Column in Targets}
+
+    SelectList = ", ".join(f'"{Column}"' for Column in Targets)
+    Cursor = Connection.execute(f'SELECT {SelectList} FROM "{TableName}" WHERE rowid > ? ORDER BY rowid', (Watermark,))
+    Scanned = 0
+    while True:
+        Rows = Cursor.fetchmany(ChunkSize)
+        if not Rows:
+            break
+        Scanned += len(Rows)
+        for Index, Column in enumerate(Targets):
+            Values = [Row[Index] for Row in Rows]
+            Accumulators[Column].Add(Values)
+
+    Now = time.time()
+    with Connection:
+        for Column in Targets:
+            Result = Accumulators[Column].Finish()
+            Connection.execute(
+                f'INSERT OR REPLACE INTO "{StatsTable}" VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    TableName, Column, AllColumns.index(Column), Result["row_count"], Result["null_count"],
+                    Result["empty_count"], Result["distinct_estimate"], Result["numeric_count"], Result["sum"],
+                    Result["sum_squares"], Result["min"], Result["max"], Result["hll"],
+                    None,
+                    json.dumps(Result["top_candidates"], default=str), MaxRowId, Now
+                )
+            )
+        Connection.execute(
+            f'DELETE FROM "{StatsTable}" WHERE table_name = ? AND column_name NOT IN ({", ".join("?" * len(AllColumns))})',
+            (TableName, *AllColumns)
+        )
+
+    return {
+        "table": TableName,
+        "mode": "incremental" if Incremental else "full",
+        "columns": len(Targets),
+        "rows_scanned": Scanned,
+        "seconds": round(time.perf_counter() - Started, 3)
+    }
+
+
+def EnsureColumnStats(Connection) -> List[Dict[str, Any]]:
+    EnsureStatsTable(Connection)
+    Tables = [Row[0] for Row in Connection.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()]
+    return [RefreshColumnStats(Connection, Table) for Table in Tables if not catalog.IsInternalTable(Table)]
+
+
+def SummarizeColumn(Entry: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Profile of one column from its persisted statistics, without touching the table.
+    Quartiles and outlier counts are not among them: no bounded summary kept them close to
+    the exact figures, so profiling.py computes them from the values.
+    """
+    Summary = {
+        "nulls": Entry["null_count"],
+        "empty_strings": Entry["empty_count"],
+        "distinct_estimate": Entry["distinct_estimate"],
+        "min": Entry["min"],
+        "max": Entry["max"],
+        "top_values": [Value for Value, _ in Entry["top_candidates"][:TopValues]]
+    }
+
+    Count = Entry["numeric_count"]
+    if Count:
+        Mean = Entry["sum"] / Count
+        Variance = max(Entry["sum_squares"] / Count - Mean * Mean, 0.0)
+        StdDev = math.sqrt(Variance * Count / (Count - 1)) if Count > 1 else 0.0
+        Summary.update({"numeric_values": Count, "mean": Mean, "stddev": StdDev})
+    return Summary
+
+
+def GetColumnStats(TableName: str) -> Dict[str, Dict[str, Any]]:
+    """Persisted statistics of TableName keyed by column, memoized until the database changes."""
+    Catalog = catalog.GetCatalog()
+
+    def Load():
+        with pool.GetPool().Acquire() as Connection:
+            Exists = Connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (StatsTable,)
+            ).fetchone()
+            return LoadStoredStats(Connection, TableName) if Exists else {}
+
+    return Catalog.Memoize(f"column_stats:{TableName}", Load)
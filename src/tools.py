@@ -1,28 +1,111 @@
 import json
-import pandas
 import os
 import sqlite3
-import re
-from typing import List, Dict, Any
+import threading
+import time
+import secrets
+from typing import List, Dict, Any, Optional, Tuple
+import pool
+import backends
+import catalog
+import lexer
+import cache
+import stats
+import ingest
+import indexes
+import encoding
+import guards
+import tracing
+import sampling
+import reingest
+
+SourcePath = os.environ.get("SOURCE_PATH", "Data Dump - Accrual Accounts.xlsx")
+# Rows returned per selectSQL call; the query fetches one more to detect truncation
+ResultRowLimit = int(os.environ.get("QUERY_ROW_LIMIT", "5"))
+# Server-enforced ceiling on the Limit a caller may ask for
+MaxRowLimit = int(os.environ.get("QUERY_MAX_ROW_LIMIT", "200"))
+# Sub-queries one batchSQL call may carry
+MaxBatchQueries = int(os.environ.get("BATCH_MAX_QUERIES", "16"))
+IndexColumns = [Column.strip() for Column in os.environ.get("INGEST_INDEX_COLUMNS", "").split(",") if Column.strip()]
+
+InitializeLock = threading.Lock()
 
 def GetDatabaseConnection():
-    DatabaseExists = os.path.exists("demo.db")
-    Connection = sqlite3.connect("demo.db")
+    # Writable connection for ingest and bookkeeping; request paths read through the pool
+    return sqlite3.connect(pool.DatabasePath)
 
-    if not DatabaseExists:
-        PopulateDatabase(Connection)
-    else:
+def DatabaseHasTables() -> bool:
+    if not os.path.exists(pool.DatabasePath):
+        return False
+    Connection = GetDatabaseConnection()
+    try:
         Cursor = Connection.cursor()
         Cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        Tables = Cursor.fetchall()
-        if not Tables:
-            PopulateDatabase(Connection)
+        return any(not catalog.IsInternalTable(Row[0]) for Row in Cursor.fetchall())
+    finally:
+        Connection.close()
+
+def RebuildDatabase() -> Dict[str, Any]:
+    """
+    Builds the database into a temporary file and renames it over the live one, so readers
+    keep using the old file until the new one is complete.
+    """
+    TemporaryPath = pool.DatabasePath + ".building"
+    if os.path.exists(TemporaryPath):
+        os.remove(TemporaryPath)
+
+    Connection = sqlite3.connect(TemporaryPath)
+    try:
+        Report = PopulateDatabase(Connection)
+    finally:
+        Connection.close()
+
+    os.replace(TemporaryPath, pool.DatabasePath)
 
-    return Connection
+    # Pooled connections still point at the replaced file; recycle them
+    pool.ClosePool()
+    catalog.InvalidateCatalog()
+    cache.InvalidateAll()
+    return {"mode": "full", **{Key: Value for Key, Value in Report.items() if Key != "chunk_hashes"}}
+
+def RefreshDatabase() -> Dict[str, Any]:
+    """
+    Re-ingests the source in place, applying only the rows that changed; falls back to a full
+    rebuild when the database has no ingest state yet or the source's columns or types changed.
+    """
+    Connection = GetDatabaseConnection()
+    try:
+        return reingest.RefreshTable(Connection, SourcePath, "accounts")
+    except reingest.SourceChangedShape as E:
+        reingest.Logger.info("Rebuilding instead of re-ingesting incrementally: %s", E)
+    finally:
+        Connection.close()
+    return RebuildDatabase()
+
+def InitializeDatabase(Rebuild: bool = False, Full: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Populates on first start, re-ingests with Rebuild (from scratch with Full), then hands all
+    reads over to the read-only pool. Returns the load report, if anything was loaded.
+    """
+    with InitializeLock:
+        if not DatabaseHasTables():
+            Report = RebuildDatabase()
+        elif Rebuild:
+            Report = RefreshDatabase() if reingest.IncrementalReingest and not Full else RebuildDatabase()
+        else:
+            Report = None
+            Connection = GetDatabaseConnection()
+            try:
+                stats.EnsureColumnStats(Connection)
+                sampling.EnsureSamples(Connection)
+            finally:
+                Connection.close()
+        # Opens the read-only pool that serves every request from here on
+        pool.GetPool()
+        return Report
 
-def PopulateDatabase(Connection):
-    DataFrame = pandas.read_excel('Data Dump - Accrual Accounts.xlsx')
-    DataFrame.to_sql("accounts", con=Connection, if_exists='replace', index=False)
+def PopulateDatabase(Connection) -> Dict[str, Any]:
+    Report = ingest.IngestFile(Connection, SourcePath, "accounts", IndexColumns, HashChunks=True)
 
     Cursor = Connection.cursor()
     Cursor.execute("PRAGMA table_info(accounts)")
@@ -45,212 +128,547 @@ def PopulateDatabase(Connection):
         }
         TableSchema["accounts"]["columns"].append(ColumnInformation)
 
-    with open('db_schema.json', 'w') as File:
+    TemporarySchemaPath = catalog.SchemaPath + ".tmp"
+    with open(TemporarySchemaPath, 'w') as File:
         json.dump(TableSchema, File, indent=2)
+    os.replace(TemporarySchemaPath, catalog.SchemaPath)
+
+    stats.RefreshColumnStats(Connection, "accounts", Full=True)
+    sampling.BuildSamples(Connection, "accounts")
+    reingest.RecordState(Connection, "accounts", SourcePath, Report["chunk_hashes"])
+
+    catalog.InvalidateCatalog()
+    cache.InvalidateAll()
+    return Report
 
-def SanitizeInput(InputString: str) -> str:
-    DangerousPatterns = [
-        ';', '--', '/*', '*/', 'xp_', 'sp_', 'exec', 'execute', 'drop', 'delete',
-        'update', 'insert', 'alter', 'truncate', 'merge', 'grant', 'revoke'
-    ]
+DangerousKeywords = frozenset({
+    'exec', 'execute', 'drop', 'delete', 'update', 'insert', 'alter', 'truncate', 'merge', 'grant',
+    'revoke', 'attach', 'detach', 'pragma', 'vacuum', 'create', 'reindex', 'begin', 'commit', 'rollback'
+})
 
-    InputLower = InputString.lower()
-    for Pattern in DangerousPatterns:
-        if Pattern in InputLower:
-            raise ValueError("Dangerous SQL detected: " + Pattern)
 
-    Sanitized = InputString.replace("'", "''")
-    return Sanitized
+def CheckDangerousPatterns(InputString: str, TableName: str = None, Connection=None):
+    """
+    Rejects statement separators, comments and data-modifying keywords. The clause is
+    tokenized first, so string literals ('executed') and column names ("Last Update")
+    are never mistaken for SQL.
+    """
+    Lexicon = lexer.GetLexicon(catalog.GetCatalog(Connection), TableName)
+    for Item in Lexicon.Analyze(InputString).Tokens:
+        if Item.Kind == "comment":
+            raise ValueError("Dangerous SQL detected: " + Item.Text[:2])
+        if Item.Kind == "symbol" and Item.Text == ";":
+            raise ValueError("Dangerous SQL detected: ;")
+        if Item.Kind == "word" and Item.Value in DangerousKeywords:
+            raise ValueError("Dangerous SQL detected: " + Item.Value)
 
 
-def QuoteColumnInWhere(WhereClause: str, Connection) -> str:
+def QuoteColumnInWhere(WhereClause: str, Connection=None, TableName: str = None) -> str:
     if not WhereClause:
         return WhereClause
 
-    Cursor = Connection.cursor()
-    Cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    Tables = Cursor.fetchall()
-
-    AllColumns = []
-    for Table in Tables:
-        TableName = Table[0]
-        Cursor.execute(f"PRAGMA table_info('{TableName}')")
-        ColumnsInformation = Cursor.fetchall()
-        for ColumnInformation in ColumnsInformation:
-            AllColumns.append(ColumnInformation[1])
-
-    # Sort columns by length in descending order to match longer column names first
-    # This helps prevent partial matches (e.g., matching "Date" in "Clearing Date")
-    AllColumns = sorted(AllColumns, key=len, reverse=True)
-
-    ProcessedWhere = WhereClause
-    for ColumnName in AllColumns:
-        # Use word boundaries with special handling for column names that contain spaces
-        # For column names with spaces, we can't use \b, so we'll use a more general approach
-        escaped_name = re.escape(ColumnName)
-        # Match the column name as a whole word/unit, handling cases with/without spaces
-        if ' ' in ColumnName:
-            # For names with spaces, look for the full name surrounded by word boundaries or operators
-            ProcessedWhere = re.sub(r'(?<!\w)(' + escaped_name + r')(?!\w)', f'"{ColumnName}"', ProcessedWhere)
-        else:
-            # For names without spaces, use word boundaries
-            ProcessedWhere = re.sub(r'\b' + escaped_name + r'\b', f'"{ColumnName}"', ProcessedWhere)
+    # One pass over the clause: string literals are kept verbatim and known column names
+    # (longest match first, so "Clearing Date" wins over "Date") are quoted exactly once
+    Lexicon = lexer.GetLexicon(catalog.GetCatalog(Connection), TableName)
+    return Lexicon.Analyze(WhereClause).Text
+
+
+def KeysetOrder(TableName: str, OrderBy: str = None) -> Optional[Tuple[Optional[str], bool]]:
+    """
+    (Column, Descending) when the result can be paged by keyset: no ORDER BY (rowid order)
+    or a single column with an optional ASC/DESC. None means paging falls back to OFFSET.
+    """
+    if not OrderBy:
+        return (None, False)
+    Tokens = [Item for Item in lexer.GetLexicon(catalog.GetCatalog(), TableName).Analyze(OrderBy).Tokens
+              if Item.Kind not in ("space", "comment")]
+    if not Tokens or len(Tokens) > 2 or Tokens[0].Kind != "column":
+        return None
+    if len(Tokens) == 2 and not (Tokens[1].Kind == "keyword" and Tokens[1].Value in ("asc", "desc")):
+        return None
+    return (Tokens[0].Value, len(Tokens) == 2 and Tokens[1].Value == "desc")
+
+
+def KeysetPredicate(Keyset: Tuple[Optional[str], bool], After: Tuple[Any, int]) -> Tuple[str, List[Any]]:
+    """
+    Rows strictly after (Key, RowId) in "ORDER BY Column [DESC], rowid [DESC]" order.
+    SQLite sorts NULLs first ascending and last descending, and rowid breaks ties.
+    """
+    Column, Descending = Keyset
+    Key, RowId = After
+    if Column is None:
+        return ("rowid > ?", [RowId])
 
-    return ProcessedWhere
+    Quoted = f'"{Column}"'
+    if not Descending:
+        if Key is None:
+            return (f"(({Quoted} IS NULL AND rowid > ?) OR {Quoted} IS NOT NULL)", [RowId])
+        return (f"({Quoted} > ? OR ({Quoted} = ? AND rowid > ?))", [Key, Key, RowId])
+    if Key is None:
+        return (f"({Quoted} IS NULL AND rowid < ?)", [RowId])
+    return (f"({Quoted} < ? OR ({Quoted} = ? AND rowid < ?) OR {Quoted} IS NULL)", [Key, Key, RowId])
 
 
 def BuildSelectQuery(TableName: str, Columns: List[str] = None, WhereClause: str = None,
-                     OrderBy: str = None) -> str:
-
-    TableName = SanitizeInput(TableName)
-    QuotedTableName = f'"{TableName}"'
+                     OrderBy: str = None, Connection=None, Limit: int = 5, Offset: int = 0,
+                     Keyset: Tuple[Optional[str], bool] = None, After: Tuple[Any, int] = None) -> str:
+    """
+    With Keyset the query also selects rowid (and the order column) as the trailing columns
+    "__rowid"/"__key" and orders by them; After adds the predicate whose parameters
+    KeysetPredicate returns. Identifier quoting and the row limit follow the backend's dialect;
+    Limit=None leaves the limit out.
+    """
+    Backend = backends.GetBackend()
+    QuotedTableName = Backend.QuoteIdentifier(TableName)
 
     if Columns:
-        QuotedColumns = []
-        for Col in Columns:
-            SanitizedColumn = SanitizeInput(Col.strip())
-            QuotedColumns.append(f'"{SanitizedColumn}"')
-        ColumnsString = ", ".join(QuotedColumns)
+        ColumnsString = ", ".join(Backend.QuoteIdentifier(Col.strip()) for Col in Columns)
     else:
         ColumnsString = "*"
 
+    if Keyset is not None:
+        ColumnsString += ', rowid AS "__rowid"'
+        if Keyset[0] is not None:
+            ColumnsString += f', "{Keyset[0]}" AS "__key"'
+
     Query = f"SELECT {ColumnsString} FROM {QuotedTableName}"
 
+    # The lexer keeps string literals intact, so the clauses are only checked, not re-escaped
+    Conditions = []
     if WhereClause:
-        DatabaseConnection = GetDatabaseConnection()
-        try:
-            WhereClause = SanitizeInput(WhereClause)
-            WhereClause = QuoteColumnInWhere(WhereClause, DatabaseConnection)
-            Query += f" WHERE {WhereClause}"
-        finally:
-            DatabaseConnection.close()
-
-    if OrderBy:
-        if OrderBy:
-            DatabaseConnection = GetDatabaseConnection()
-            try:
-                OrderBy = SanitizeInput(OrderBy)
-                OrderBy = QuoteColumnInWhere(OrderBy, DatabaseConnection)
-                Query += f" ORDER BY {OrderBy}"
-            finally:
-                DatabaseConnection.close()
-
-    Query += " LIMIT 5;"
-    return Query
-
-
-def ValidateWhereClause(WhereClause: str, TableName: str) -> bool:
+        CheckDangerousPatterns(WhereClause, TableName, Connection)
+        WhereClause = QuoteColumnInWhere(WhereClause, Connection, TableName)
+        Conditions.append(WhereClause)
+    if After is not None:
+        Conditions.append(KeysetPredicate(Keyset, After)[0])
+    if len(Conditions) == 1:
+        Query += f" WHERE {Conditions[0]}"
+    elif Conditions:
+        Query += " WHERE " + " AND ".join(f"({Condition})" for Condition in Conditions)
+
+    if Keyset is not None:
+        Column, Descending = Keyset
+        Direction = " DESC" if Descending else ""
+        Query += f' ORDER BY "{Column}"{Direction}, rowid{Direction}' if Column else " ORDER BY rowid"
+    elif OrderBy:
+        CheckDangerousPatterns(OrderBy, TableName, Connection)
+        OrderBy = QuoteColumnInWhere(OrderBy, Connection, TableName)
+        Query += f" ORDER BY {OrderBy}"
+
+    if Limit is not None:
+        Query += Backend.LimitClause(Limit, Offset, Ordered=Keyset is not None or bool(OrderBy))
+    return Query + ";"
+
+
+def ValidateWhereClause(WhereClause: str, TableName: str, Connection=None) -> bool:
     """
     Validates the WHERE clause by checking if it contains potentially non-existent column names.
-    This is a heuristic check that looks for column references that might not exist in the table.
+    Identifiers are resolved against the table's columns while skipping string literals.
     """
     if not WhereClause:
         return True
 
-    DatabaseConnection = GetDatabaseConnection()
-    try:
-        Cursor = DatabaseConnection.cursor()
-        # Get all columns for the table
-        Cursor.execute(f"PRAGMA table_info('{TableName}')")
-        ValidColumns = [row[1] for row in Cursor.fetchall()]
-
-        # Clean up the WhereClause to handle quoted identifiers properly
-        # Remove single and double quotes portions which are usually literals, not columns
-        cleaned_clause = WhereClause
-
-        # Extract potential column names from the where clause by looking for identifiers
-        # This regex finds words that could be column names (ignoring operators, values, etc.)
-        # We'll use a more sophisticated method that considers SQL structure
-        import re
-
-        # This captures potential column names in common SQL patterns like:
-        # column = value, column > value, column BETWEEN value AND value, etc.
-        # Split the clause by SQL operators and look for identifiers
-        # First, remove quoted string literals
-        clause_no_strings = re.sub(r"'[^']*'", '', WhereClause)  # Remove single-quoted strings
-        clause_no_strings = re.sub(r'"[^"]*"', '', clause_no_strings)  # Remove double-quoted strings (but preserve quoted column names)
-
-        # Find potential column names (word-like tokens that could be column names)
-        # We'll look for unquoted identifiers only
-        potential_columns = re.findall(r'\b([a-zA-Z_][a-zA-Z0-9_\.]*)\b', clause_no_strings)
-
-        # Filter out SQL keywords and operators that aren't column names
-        sql_keywords = {
-            'select', 'from', 'where', 'order', 'by', 'group', 'having', 'distinct', 'limit',
-            'and', 'or', 'not', 'in', 'like', 'between', 'is', 'null', 'true', 'false',
-            'as', 'on', 'inner', 'outer', 'left', 'right', 'join', 'union', 'intersect', 'except',
-            'avg', 'count', 'max', 'min', 'sum', 'abs', 'round', 'length', 'upper', 'lower',
-            'datetime', 'date', 'timestamp', 'integer', 'text', 'real', 'numeric', 'varchar',
-            'int', 'bool', 'float', 'double', 'char'
-        }
+    Catalog = catalog.GetCatalog(Connection)
+    ValidColumns = Catalog.Tables.get(TableName, [])
+    Result = lexer.GetLexicon(Catalog, TableName).Analyze(WhereClause)
 
-        potential_columns = [col for col in potential_columns if col.lower() not in sql_keywords]
-
-        for col in potential_columns:
-            if '.' in col:
-                parts = col.split('.', 1)
-                if len(parts) == 2:
-                    # Assuming first part is table alias (could be checked more rigorously)
-                    col_name = parts[1]
-                else:
-                    col_name = parts[0]
-            else:
-                col_name = col
-
-            # For column names with spaces, the AI might provide parts of the name
-            # We need strict matching for full column names
-            if col_name.lower() not in [vc.lower() for vc in ValidColumns]:
-                if len([vc for vc in ValidColumns if col_name.lower() in vc.lower()]) > 0:
-                    similar_cols = [vc for vc in ValidColumns if col_name.lower() in vc.lower()]
-                    raise ValueError(f"Column '{col_name}' not found in table '{TableName}'. Did you mean one of these: {similar_cols}? Valid columns are: {ValidColumns}")
-                else:
-                    raise ValueError(f"Column '{col_name}' not found in table '{TableName}'. Valid columns are: {ValidColumns}")
+    for col_name in Result.Unknown:
+        similar_cols = lexer.SimilarColumns(col_name, ValidColumns)
+        if similar_cols:
+            raise ValueError(f"Column '{col_name}' not found in table '{TableName}'. Did you mean one of these: {similar_cols}? Valid columns are: {ValidColumns}")
+        else:
+            raise ValueError(f"Column '{col_name}' not found in table '{TableName}'. Valid columns are: {ValidColumns}")
 
-        return True
-    finally:
-        DatabaseConnection.close()
+    return True
 
 
-def ExecuteSQL(TableName: str, Columns: List[str] = None, WhereClause: str = None,
-               OrderBy: str = None) -> List[Dict[str, Any]]:
+def QueryCacheKey(Catalog, TableName: str, Columns: List[str] = None, WhereClause: str = None,
+                  OrderBy: str = None, Limit: int = None, Offset: int = 0, After: Tuple[Any, int] = None) -> tuple:
+    Lexicon = lexer.GetLexicon(Catalog, TableName)
+    return (
+        Catalog.Version,
+        TableName,
+        tuple(Col.strip() for Col in Columns) if Columns else None,
+        lexer.NormalizeClause(Lexicon.Analyze(WhereClause)) if WhereClause else None,
+        lexer.NormalizeClause(Lexicon.Analyze(OrderBy)) if OrderBy else None,
+        Limit,
+        Offset,
+        tuple(After) if After is not None else None
+    )
+
+
+def SaveCursor(State: Dict[str, Any]) -> str:
+    Token = secrets.token_urlsafe(12)
+    cache.CursorStore.Put(Token, State)
+    return Token
 
-    DatabaseConnection = GetDatabaseConnection()
-    try:
-        Cursor = DatabaseConnection.cursor()
-        Cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        AvailableTables = [Row[0] for Row in Cursor.fetchall()]
 
-        if TableName not in AvailableTables:
-            raise ValueError(f"Table '{TableName}' does not exist in the database. Available tables: {AvailableTables}")
+def LoadCursor(Token: str) -> Dict[str, Any]:
+    Found, State = cache.CursorStore.Get(Token)
+    if not Found:
+        raise ValueError(f"Cursor '{Token}' is unknown or has expired. Run the query again without a Cursor.")
+    return State
 
+
+def ClampLimit(Limit: Any) -> int:
+    if Limit is None:
+        return ResultRowLimit
+    return max(1, min(int(Limit), MaxRowLimit))
+
+
+def ExecuteSQL(TableName: str = None, Columns: List[str] = None, WhereClause: str = None,
+               OrderBy: str = None, Limit: int = None, Offset: int = None, Cursor: str = None) -> Dict[str, Any]:
+    """
+    Runs the SELECT and returns a columnar result set (see encoding.ResultSet) of at most Limit
+    rows. A truncated result carries a next_cursor; passing it back as Cursor continues after
+    the last row (by keyset on a single ORDER BY column or rowid, by OFFSET otherwise).
+    """
+    After = None
+    if Cursor:
+        State = LoadCursor(Cursor)
+        if State["kind"] == "sql":
+            return ExecuteQuery(Cursor=Cursor)
+        TableName, Columns, WhereClause, OrderBy = State["table"], State["columns"], State["where"], State["order_by"]
+        Limit, Offset, After = State["limit"], State["offset"], State["after"]
+
+    Catalog = catalog.GetCatalog()
+    if not Catalog.HasTable(TableName):
+        raise ValueError(f"Table '{TableName}' does not exist in the database. Available tables: {Catalog.TableNames}")
+
+    if Cursor and State["version"] != list(Catalog.Version):
+        raise ValueError("The data changed since this cursor was created. Run the query again without a Cursor.")
+
+    with tracing.Span("sql.validate", table=TableName):
         if WhereClause:
             ValidateWhereClause(WhereClause, TableName)
 
         if OrderBy:
             ValidateWhereClause(OrderBy, TableName)  # Reusing the same validator since logic is similar
 
-        Query = BuildSelectQuery(TableName, Columns, WhereClause, OrderBy)
+    Limit = ClampLimit(Limit)
+    Offset = max(int(Offset or 0), 0)
+    Backend = backends.GetBackend()
+    # Keysets page by rowid; other engines page by OFFSET
+    Keyset = KeysetOrder(TableName, OrderBy) if Backend.SupportsRowid else None
+    # Keyset pages after the first seek with the predicate instead of skipping rows
+    SqlOffset = Offset if Keyset is None or After is None else 0
+
+    CacheKey = QueryCacheKey(Catalog, TableName, Columns, WhereClause, OrderBy, Limit, Offset, After)
+    Found, Cached = cache.QueryCache.Get(CacheKey)
+    if not Found:
+        with tracing.Span("sql.build", table=TableName):
+            Query = BuildSelectQuery(TableName, Columns, WhereClause, OrderBy, Limit=Limit + 1, Offset=SqlOffset,
+                                     Keyset=Keyset, After=After)
+            Parameters = KeysetPredicate(Keyset, After)[1] if After is not None else []
+
+        Started = time.perf_counter()
+        with tracing.Span("sql.execute", table=TableName, backend=Backend.Name) as Span, \
+                Backend.Acquire() as DatabaseConnection, guards.Guard(DatabaseConnection) as Guard:
+            DatabaseCursor = DatabaseConnection.cursor()
+            DatabaseCursor.execute(Query, Parameters)
+
+            ColumnsInformation = [Column[0] for Column in DatabaseCursor.description]
+
+            Rows = DatabaseCursor.fetchmany(Limit + 1)
+            Guard.CheckRows(Rows)
+            Span["rows"] = len(Rows)
+
+        if not Parameters and Backend.SupportsRowid:
+            Lexicon = lexer.GetLexicon(Catalog, TableName)
+            indexes.RecordQuery(
+                TableName, Query,
+                Lexicon.Analyze(WhereClause).Columns if WhereClause else (),
+                Lexicon.Analyze(OrderBy).Columns if OrderBy else (),
+                time.perf_counter() - Started
+            )
+
+        NextAfter = None
+        if Keyset is not None:
+            Hidden = 1 if Keyset[0] is None else 2
+            if len(Rows) > Limit:
+                Last = Rows[Limit - 1]
+                NextAfter = [Last[-1], Last[-2]] if Hidden == 2 else [None, Last[-1]]
+            ColumnsInformation = ColumnsInformation[:-Hidden]
+            Rows = [Row[:-Hidden] for Row in Rows]
+
+        Results = encoding.ResultSet(ColumnsInformation, Rows, Limit, offset=Offset)
+        NextState = None
+        if Results["truncated"]:
+            NextState = {
+                "kind": "select", "table": TableName, "columns": Columns, "where": WhereClause, "order_by": OrderBy,
+                "limit": Limit, "offset": Offset + Limit, "after": NextAfter, "version": list(Catalog.Version)
+            }
+        Cached = (Results, NextState)
+        cache.QueryCache.Put(CacheKey, Cached)
 
-        Cursor.execute(Query)
+    Results, NextState = Cached
+    # Tokens are minted per response so a cached page never hands out an expired cursor
+    return dict(Results, next_cursor=SaveCursor(NextState) if NextState else None)
 
-        ColumnsInformation = [Column[0] for Column in Cursor.description]
 
-        Rows = Cursor.fetchall()
+# Authorizer actions a read-only SELECT needs; everything else (writes, PRAGMA, ATTACH...) is denied
+ReadOnlyActions = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION,
+                   getattr(sqlite3, "SQLITE_RECURSIVE", 33)}
+DeniedFunctions = frozenset({"load_extension", "readfile", "writefile", "edit", "fts3_tokenizer"})
 
-        Results = []
-        for Row in Rows:
-            RowDictionary = {}
-            for Index, Col in enumerate(ColumnsInformation):
-                RowDictionary[Col] = Row[Index]
-            Results.append(RowDictionary)
 
-        return Results
+def ReadOnlyAuthorizer(Action: int, Argument1: str, Argument2: str, DatabaseName: str, Source: str) -> int:
+    if Action not in ReadOnlyActions:
+        return sqlite3.SQLITE_DENY
+    if Action == sqlite3.SQLITE_READ and Argument1 and catalog.IsInternalTable(Argument1):
+        return sqlite3.SQLITE_DENY
+    if Action == sqlite3.SQLITE_FUNCTION and (Argument2 or "").lower() in DeniedFunctions:
+        return sqlite3.SQLITE_DENY
+    return sqlite3.SQLITE_OK
 
-    finally:
-        DatabaseConnection.close()
+
+def SampleAuthorizer(SampleTable: str):
+    """ReadOnlyAuthorizer that also lets the rewritten statement read one (internal) sample table."""
+    def Authorizer(Action: int, Argument1: str, Argument2: str, DatabaseName: str, Source: str) -> int:
+        if Action == sqlite3.SQLITE_READ and Argument1 == SampleTable:
+            return sqlite3.SQLITE_OK
+        return ReadOnlyAuthorizer(Action, Argument1, Argument2, DatabaseName, Source)
+    return Authorizer
+
+
+# Tokens that can end an expression or a table reference, so a quoted name right after them is an alias
+AliasedKinds = ("column", "quoted", "word", "table", "number", "string")
+
+
+def ValidateSelectStatement(Sql: str) -> str:
+    """
+    Cheap structural checks before SQLite parses the statement: one statement that starts
+    with SELECT or WITH. Table, column and permission checks happen when it is prepared
+    under ReadOnlyAuthorizer. Returns the statement without its trailing semicolon.
+    """
+    Sql = (Sql or "").strip()
+    while Sql.endswith(";"):
+        Sql = Sql[:-1].rstrip()
+    if not Sql:
+        raise ValueError("The SQL statement is empty")
+
+    Tokens = lexer.GetLexicon(catalog.GetCatalog()).Analyze(Sql).Tokens
+    Significant = [Item for Item in Tokens if Item.Kind not in ("space", "comment")]
+    if not Significant or Significant[0].Kind != "keyword" or Significant[0].Value not in ("select", "with"):
+        raise ValueError("Only a single SELECT statement (optionally starting with WITH) is allowed")
+    if any(Item.Kind == "symbol" and Item.Text == ";" for Item in Significant):
+        raise ValueError("Only a single SQL statement is allowed")
+
+    # SQLite reads an unknown "double-quoted" name as a string literal; only catalog names
+    # and aliases may be quoted
+    Catalog = catalog.GetCatalog()
+    Aliases = {Name.lower() for Name in Catalog.TableNames}
+    for Index, Item in enumerate(Significant):
+        if Item.Kind == "keyword" and Item.Value == "as":
+            for Neighbour in Significant[max(Index - 1, 0):Index] + Significant[Index + 1:Index + 2]:
+                if Neighbour.Kind in ("quoted", "word"):
+                    Aliases.add(Neighbour.Value.lower())
+        elif Item.Kind == "quoted" and Index and (Significant[Index - 1].Kind in AliasedKinds
+                                                  or Significant[Index - 1].Text == ")"):
+            # An alias without AS directly follows the expression or table it names
+            Aliases.add(Item.Value.lower())
+    for Item in Significant:
+        if Item.Kind == "quoted" and Item.Value.lower() not in Aliases:
+            raise ValueError(f"Column '{Item.Value}' not found. Quoted names must be columns or tables from the schema, or aliases.")
+    return Sql
+
+
+def DescribeQueryError(Error: sqlite3.Error, Catalog) -> str:
+    Message = str(Error)
+    if "not authorized" in Message or "prohibited" in Message:
+        return f"Only read-only SELECT statements over the tables {Catalog.TableNames} are allowed"
+    if Message.startswith("no such column"):
+        Name = Message.split(":", 1)[1].strip().split(".")[-1].strip('"')
+        Similar = [Column for Columns in Catalog.Tables.values() for Column in lexer.SimilarColumns(Name, Columns)]
+        Hint = f" Did you mean one of these: {Similar}?" if Similar else ""
+        return f"Column '{Name}' not found.{Hint} Column names containing spaces must be double-quoted. Valid columns are: {Catalog.Tables}"
+    if Message.startswith("no such table"):
+        return f"{Message}. Available tables: {Catalog.TableNames}"
+    return f"SQL error: {Message}"
+
+
+def CountTableGroups(Plan) -> Optional[int]:
+    """
+    Exact number of groups a grouped approximate plan forms over the whole table, or None
+    when SQLite could only count them by reading every row (no index covers the group keys
+    and filter), which would cost as much as the exact answer.
+    """
+    Query = sampling.GroupCountQuery(Plan, Plan.Table)
+    with tracing.Span("sql.groups", table=Plan.Table) as Span, \
+            pool.GetPool().Acquire() as DatabaseConnection, guards.Guard(DatabaseConnection) as Guard:
+        DatabaseConnection.set_authorizer(ReadOnlyAuthorizer)
+        try:
+            if not sampling.IndexedPlan(DatabaseConnection, Query):
+                Span["indexed"] = False
+                return None
+            Span["indexed"] = True
+            return DatabaseConnection.execute(Query).fetchone()[0]
+        except sqlite3.Error as E:
+            Guard.Check(E)
+            return None
+        finally:
+            DatabaseConnection.set_authorizer(None)
+
+
+def ApproximateQuery(Sql: str, Limit: int, Offset: int, Catalog, SampleTable: str = None) -> Optional[Dict[str, Any]]:
+    """
+    Answers a single-table COUNT/SUM/AVG query from the smallest sample holding enough
+    matching rows, with 95% margins next to the estimates. None when the statement or the
+    table has no sample answer (or every sample is too thin), so the caller scans the table.
+    A GROUP BY is answered from a sample only when an index can count the table's groups
+    and the sample holds every one of them; a group too rare to be sampled would otherwise
+    be left out of the answer.
+    """
+    Plan = sampling.PlanApproximateQuery(Sql)
+    if Plan is None:
+        return None
+    Samples = [Chosen for Chosen in sampling.GetSamples(Plan.Table) if SampleTable in (None, Chosen.Table)]
+    if not Samples:
+        return None
+
+    CacheKey = ("approximate", Catalog.Version, " ".join(Sql.split()), Limit, Offset, SampleTable)
+    Found, Cached = cache.QueryCache.Get(CacheKey)
+    if not Found:
+        TableGroups = None
+        # A later page was checked when its first page was answered
+        if Plan.GroupParts is not None and not SampleTable:
+            TableGroups = CountTableGroups(Plan)
+            if TableGroups is None:
+                return None
+        for Chosen in Samples:
+            with tracing.Span("sql.sample", table=Plan.Table, fraction=Chosen.Fraction) as Span, \
+                    pool.GetPool().Acquire() as DatabaseConnection, guards.Guard(DatabaseConnection) as Guard:
+                DatabaseConnection.set_authorizer(SampleAuthorizer(Chosen.Table))
+                try:
+                    DatabaseCursor = DatabaseConnection.cursor()
+                    DatabaseCursor.execute(sampling.SampleQuery(Plan, Chosen))
+                    ColumnsInformation = [Column[0] for Column in DatabaseCursor.description]
+                    Rows = DatabaseCursor.fetchmany(Offset + Limit + 1)[Offset:]
+                    Guard.CheckRows(Rows)
+                    Span["rows"] = len(Rows)
+                    SampleGroups = None
+                    if TableGroups is not None:
+                        SampleGroups = DatabaseConnection.execute(sampling.GroupCountQuery(Plan, Chosen.Table)).fetchone()[0]
+                        Span["groups"] = f"{SampleGroups}/{TableGroups}"
+                except sqlite3.Error as E:
+                    # The full-table run reports the error in terms of the user's statement
+                    Guard.Check(E)
+                    return None
+                finally:
+                    DatabaseConnection.set_authorizer(None)
+
+            ColumnsInformation, Rows, Sufficient = sampling.EstimateRows(Plan, ColumnsInformation, Rows, Chosen.Fraction)
+            # Groups without a single sample row would be missing from the answer, not estimated
+            Sufficient = Sufficient and SampleGroups == TableGroups
+            Span["sufficient"] = Sufficient
+            # A later page stays on the sample its first page came from
+            if Sufficient or SampleTable:
+                break
+        else:
+            return None
+
+        Note = sampling.Describe(Chosen) + "; '±' columns are 95% margins of error; pass Exact=true for exact figures"
+        Results = encoding.ResultSet(ColumnsInformation, Rows, Limit, offset=Offset, approximate=Note)
+        NextState = None
+        if Results["truncated"]:
+            NextState = {"kind": "sql", "sql": Sql, "limit": Limit, "offset": Offset + Limit,
+                         "version": list(Catalog.Version), "sample": Chosen.Table}
+        Cached = (Results, NextState)
+        cache.QueryCache.Put(CacheKey, Cached)
+
+    Results, NextState = Cached
+    return dict(Results, next_cursor=SaveCursor(NextState) if NextState else None)
+
+
+def ExecuteQuery(Sql: str = None, Limit: int = None, Offset: int = None, Cursor: str = None,
+                 Exact: bool = False) -> Dict[str, Any]:
+    """
+    Runs one read-only SELECT (joins, GROUP BY, HAVING, aggregates, CTEs) on a pooled
+    connection guarded by ReadOnlyAuthorizer and query_only, and returns at most Limit rows
+    as a columnar result set. Later pages re-run the statement and skip the earlier rows.
+    Unless Exact is set, simple aggregates over large tables are estimated from a sample
+    (see ApproximateQuery).
+    """
+    SampleTable = None
+    if Cursor:
+        State = LoadCursor(Cursor)
+        if State["kind"] != "sql":
+            return ExecuteSQL(Cursor=Cursor)
+        Sql, Limit, Offset = State["sql"], State["limit"], State["offset"]
+        SampleTable = State.get("sample")
+        Exact = SampleTable is None
+
+    if not backends.GetBackend().SupportsReadOnlyQueries:
+        raise ValueError(f"querySQL is not available on the {backends.BackendName} backend; use selectSQL")
+
+    Catalog = catalog.GetCatalog()
+    if Cursor and State["version"] != list(Catalog.Version):
+        raise ValueError("The data changed since this cursor was created. Run the query again without a Cursor.")
+
+    with tracing.Span("sql.validate"):
+        Sql = ValidateSelectStatement(Sql)
+    Limit = ClampLimit(Limit)
+    Offset = max(int(Offset or 0), 0)
+
+    if not Exact:
+        Approximate = ApproximateQuery(Sql, Limit, Offset, Catalog, SampleTable)
+        if Approximate is not None:
+            return Approximate
+
+    CacheKey = ("sql", Catalog.Version, " ".join(Sql.split()), Limit, Offset)
+    Found, Cached = cache.QueryCache.Get(CacheKey)
+    if not Found:
+        with tracing.Span("sql.execute") as Span, \
+                pool.GetPool().Acquire() as DatabaseConnection, guards.Guard(DatabaseConnection) as Guard:
+            # Setting an authorizer expires prepared statements, so a cached statement cannot skip it
+            DatabaseConnection.set_authorizer(ReadOnlyAuthorizer)
+            try:
+                DatabaseCursor = DatabaseConnection.cursor()
+                DatabaseCursor.execute(Sql)
+                ColumnsInformation = [Column[0] for Column in DatabaseCursor.description]
+                Skipped = 0
+                while Skipped < Offset and DatabaseCursor.fetchmany(min(Offset - Skipped, 10000)):
+                    Skipped = min(Offset, Skipped + 10000)
+                Rows = DatabaseCursor.fetchmany(Limit + 1)
+                Guard.CheckRows(Rows)
+                Span["rows"] = len(Rows)
+            except sqlite3.Error as E:
+                Guard.Check(E)
+                raise ValueError(DescribeQueryError(E, Catalog))
+            finally:
+                DatabaseConnection.set_authorizer(None)
+
+        Results = encoding.ResultSet(ColumnsInformation, Rows, Limit, offset=Offset)
+        NextState = None
+        if Results["truncated"]:
+            NextState = {"kind": "sql", "sql": Sql, "limit": Limit, "offset": Offset + Limit,
+                         "version": list(Catalog.Version)}
+        Cached = (Results, NextState)
+        cache.QueryCache.Put(CacheKey, Cached)
+
+    Results, NextState = Cached
+    return dict(Results, next_cursor=SaveCursor(NextState) if NextState else None)
+
+
+def FetchPage(Cursor: str) -> Dict[str, Any]:
+    return ExecuteSQL(Cursor=Cursor)
 
 
 def GetToolSchema() -> Dict[str, Any]:
+    return catalog.GetCatalog().Memoize("tool_schema", BuildToolSchema)
+
+
+def GetToolSchemas() -> List[Dict[str, Any]]:
+    def Build():
+        Schemas = [GetToolSchema(), BuildQueryToolSchema(), BuildProfileToolSchema()]
+        if not backends.GetBackend().SupportsReadOnlyQueries:
+            Schemas = [Schema for Schema in Schemas if Schema["function"]["name"] != "querySQL"]
+        return Schemas + [BuildBatchToolSchema([Schema["function"]["name"] for Schema in Schemas])]
+
+    return catalog.GetCatalog().Memoize("tool_schemas", Build)
+
+
+def BuildToolSchema() -> Dict[str, Any]:
     db_schema = GetTablesSchema()
 
     table_columns = {}
@@ -262,7 +680,7 @@ def GetToolSchema() -> Dict[str, Any]:
         "type": "function",
         "function": {
             "name": "selectSQL",
-            "description": "Execute a SELECT query on the database to retrieve data. This tool can only read data and cannot modify the database. Each response is limited to 5 rows of responses.",
+            "description": "Execute a SELECT query on the database to retrieve data. This tool can only read data and cannot modify the database. Each response returns at most Limit rows (default " + str(ResultRowLimit) + ", maximum " + str(MaxRowLimit) + "). Results come back as a " + encoding.ToolResultFormat + " table under a line giving the row count, whether the result was truncated and, if so, a next_cursor for fetching the following rows.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -286,6 +704,21 @@ def GetToolSchema() -> Dict[str, Any]:
                     "OrderBy": {
                         "type": "string",
                         "description": "ORDER BY clause to sort results (optional)"
+                    },
+                    "Limit": {
+                        "type": "integer",
+                        "description": f"Maximum number of rows to return (optional, defaults to {ResultRowLimit}, at most {MaxRowLimit})",
+                        "minimum": 1,
+                        "maximum": MaxRowLimit
+                    },
+                    "Offset": {
+                        "type": "integer",
+                        "description": "Number of rows to skip before the first returned row (optional)",
+                        "minimum": 0
+                    },
+                    "Cursor": {
+                        "type": "string",
+                        "description": "next_cursor value from a previous selectSQL result; returns the rows following that page. The other arguments are then taken from the original query."
                     }
                 },
                 "required": ["TableName"],
@@ -297,12 +730,123 @@ def GetToolSchema() -> Dict[str, Any]:
     return schema
 
 
+def BuildQueryToolSchema() -> Dict[str, Any]:
+    return {
+        "type": "function",
+        "function": {
+            "name": "querySQL",
+            "description": "Run one read-only SQLite SELECT statement. Joins, GROUP BY, HAVING, aggregates (COUNT, SUM, AVG, MIN, MAX), subqueries and WITH are allowed, so compute totals, averages, counts and groupings in the database with this tool instead of fetching rows with selectSQL. Column names containing spaces must be double-quoted, e.g. SELECT \"Currency\", SUM(\"Transaction Value\") FROM accounts GROUP BY \"Currency\". Each response returns at most Limit rows (default " + str(ResultRowLimit) + ", maximum " + str(MaxRowLimit) + ") as a " + encoding.ToolResultFormat + " table; a truncated result includes a next_cursor.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "Sql": {
+                        "type": "string",
+                        "description": "A single SELECT (or WITH ... SELECT) statement"
+                    },
+                    "Limit": {
+                        "type": "integer",
+                        "description": f"Maximum number of rows to return (optional, defaults to {ResultRowLimit}, at most {MaxRowLimit})",
+                        "minimum": 1,
+                        "maximum": MaxRowLimit
+                    },
+                    "Offset": {
+                        "type": "integer",
+                        "description": "Number of result rows to skip (optional)",
+                        "minimum": 0
+                    },
+                    "Cursor": {
+                        "type": "string",
+                        "description": "next_cursor value from a previous querySQL result; returns the rows following that page"
+                    },
+                    "Exact": {
+                        "type": "boolean",
+                        "description": "Scan the whole table. Without it, COUNT/SUM/AVG over one large table may be estimated from a sample; such results say so and carry a '±' 95% margin column next to each estimate. Set it when the user needs exact figures.",
+                        "default": False
+                    }
+                },
+                "required": [],
+                "additionalProperties": False
+            }
+        }
+    }
+
+
+def BuildProfileToolSchema() -> Dict[str, Any]:
+    table_names = catalog.GetCatalog().TableNames
+
+    return {
+        "type": "function",
+        "function": {
+            "name": "profileColumns",
+            "description": "Compute data-quality statistics over the whole table in one call: row count and, per column, null and empty-string counts, distinct count, min/max and, for numeric columns, mean, standard deviation, quartiles, IQR and IQR/z-score outlier counts. Prefer this over selectSQL for questions about empty fields, value ranges or outliers.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "TableName": {
+                        "type": "string",
+                        "description": "Name of the table to profile",
+                        "enum": table_names if table_names else ["accounts"]
+                    },
+                    "Columns": {
+                        "type": "array",
+                        "items": {
+                            "type": "string"
+                        },
+                        "description": "Columns to profile (optional, defaults to all columns)"
+                    },
+                    "Exact": {
+                        "type": "boolean",
+                        "description": "Scan the table for exact quartiles and outlier counts instead of answering from the precomputed column statistics (distinct counts, quartiles and outliers are then approximate)",
+                        "default": False
+                    }
+                },
+                "required": ["TableName"],
+                "additionalProperties": False
+            }
+        }
+    }
+
+
 def GetTablesSchema() -> Dict[str, Any]:
-    try:
-        with open('db_schema.json', 'r') as File:
-            return json.load(File)
-    except FileNotFoundError:
-        return {
-            "description": "Database schema information",
-            "tables": {}
-        }
\ No newline at end of file
+    return catalog.GetCatalog().SchemaDocument
+
+
+def BuildBatchToolSchema(ToolNames: List[str]) -> Dict[str, Any]:
+    return {
+        "type": "function",
+        "function": {
+            "name": "batchSQL",
+            "description": "Run several independent selectSQL, querySQL or profileColumns calls at once, in parallel, and get all their results in one response. Use it instead of separate calls when the queries don't depend on each other, e.g. the same null-count check on every table or profiling several tables.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "Queries": {
+                        "type": "array",
+                        "minItems": 1,
+                        "maxItems": MaxBatchQueries,
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "Tool": {
+                                    "type": "string",
+                                    "description": "The tool this sub-query calls",
+                                    "enum": ToolNames
+                                },
+                                "Arguments": {
+                                    "type": "object",
+                                    "description": "The arguments that tool takes"
+                                },
+                                "Label": {
+                                    "type": "string",
+                                    "description": "Short name for this sub-query's result (optional)"
+                                }
+                            },
+                            "required": ["Tool", "Arguments"]
+                        }
+                    }
+                },
+                "required": ["Queries"],
+                "additionalProperties": False
+            }
+        }
+    }
@@ -0,0 +1,223 @@
+import contextvars
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, List, Tuple
+
+LatencyBuckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CountBuckets = (0, 1, 2, 3, 4, 5, 8, 13, 21)
+
+
+def LabelKey(Labels: Dict[str, Any]) -> Tuple:
+    return tuple(sorted((Name, str(Value)) for Name, Value in Labels.items()))
+
+
+def FormatLabels(Key: Tuple, Extra: Tuple = ()) -> str:
+    Pairs = list(Key) + list(Extra)
+    if not Pairs:
+        return ""
+    Escaped = [(Name, Value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for Name, Value in Pairs]
+    return "{" + ",".join(f'{Name}="{Value}"' for Name, Value in Escaped) + "}"
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with labels."""
+
+    def __init__(self, Name: str, Help: str, Buckets: Tuple = LatencyBuckets):
+        self.Name = Name
+        self.Help = Help
+        self.Buckets = Buckets
+        self.Series = {}
+        self.Lock = threading.Lock()
+        Registry.append(self)
+
+    def Observe(self, Value: float, **Labels):
+        Key = LabelKey(Labels)
+        with self.Lock:
+            Series = self.Series.get(Key)
+            if Series is None:
+                Series = self.Series[Key] = {"counts": [0] * len(self.Buckets), "sum": 0.0, "count": 0}
+            for Index, Bound in enumerate(self.Buckets):
+                if Value <= Bound:
+                    Series["counts"][Index] += 1
+            Series["sum"] += Value
+            Series["count"] += 1
+
+    def Render(self) -> List[str]:
+        Lines = [f"# HELP {self.Name} {self.Help}", f"# TYPE {self.Name} histogram"]
+        with self.Lock:
+            for Key, Series in sorted(self.Series.items()):
+                for Bound, Count in zip(self.Buckets, Series["counts"]):
+                    Lines.append(f"{self.Name}_bucket{FormatLabels(Key, (('le', repr(float(Bound))),))} {Count}")
+                Lines.append(f"{self.Name}_bucket{FormatLabels(Key, (('le', '+Inf'),))} {Series['count']}")
+                Lines.append(f"{self.Name}_sum{FormatLabels(Key)} {Series['sum']}")
+                Lines.append(f"{self.Name}_count{FormatLabels(Key)} {Series['count']}")
+        return Lines
+
+
+class Counter:
+    def __init__(self, Name: str, Help: str):
+        self.Name = Name
+        self.Help = Help
+        self.Series = {}
+        self.Lock = threading.Lock()
+        Registry.append(self)
+
+    def Increment(self, Amount: float = 1, **Labels):
+        Key = LabelKey(Labels)
+        with self.Lock:
+            self.Series[Key] = self.Series.get(Key, 0) + Amount
+
+    def Render(self) -> List[str]:
+        Lines = [f"# HELP {self.Name} {self.Help}", f"# TYPE {self.Name} counter"]
+        with self.Lock:
+            for Key, Value in sorted(self.Series.items()):
+                Lines.append(f"{self.Name}{FormatLabels(Key)} {Value}")
+        return Lines
+
+
+Registry = []
+
+RequestSeconds = Histogram("http_request_duration_seconds", "HTTP request latency until the response headers are sent")
+SpanSeconds = Histogram("span_duration_seconds", "Duration of traced operations (prompt build, completions, tool calls, SQL)")
+TraceSeconds = Histogram("trace_duration_seconds", "End-to-end duration of traced requests")
+ToolRounds = Histogram("chat_tool_rounds", "Model/tool round trips per chat conversation", CountBuckets)
+ToolRows = Histogram("tool_result_rows", "Rows returned per tool call", (0, 1, 5, 10, 50, 100, 200, 500, 1000))
+TokenCount = Counter("llm_tokens_total", "Tokens reported by the completions API")
+ToolCallCount = Counter("tool_calls_total", "Tool calls by tool and outcome")
+
+
+def RenderMetrics() -> str:
+    Lines = []
+    for Metric in Registry:
+        Lines += Metric.Render()
+    return "\n".join(Lines) + "\n"
+
+
+class Trace:
+    """Spans of one request. Spans may be recorded from worker threads, hence the lock."""
+
+    def __init__(self, Name: str):
+        self.Id = uuid.uuid4().hex[:16]
+        self.Name = Name
+        self.Started = time.perf_counter()
+        self.StartedAt = time.time()
+        self.Spans = []
+        self.Lock = threading.Lock()
+        self.DurationMs = None
+
+    def Add(self, Name: str, Started: float, Seconds: float, Attributes: Dict[str, Any]):
+        with self.Lock:
+            self.Spans.append({
+                "name": Name,
+                "start_ms": round((Started - self.Started) * 1000, 3),
+                "duration_ms": round(Seconds * 1000, 3),
+                **Attributes
+            })
+
+    def Finish(self):
+        self.DurationMs = round((time.perf_counter() - self.Started) * 1000, 3)
+
+    def Totals(self) -> Dict[str, float]:
+        """Milliseconds per span category (the part of the name before the first dot)."""
+        Totals = {}
+        with self.Lock:
+            for Span in self.Spans:
+                Category = Span["name"].split(".")[0]
+                Totals[Category] = round(Totals.get(Category, 0.0) + Span["duration_ms"], 3)
+        return Totals
+
+    def ServerTiming(self) -> str:
+        Parts = [f"{Category};dur={Milliseconds}" for Category, Milliseconds in self.Totals().items()]
+        if self.DurationMs is not None:
+            Parts.append(f"total;dur={self.DurationMs}")
+        return ", ".join(Parts)
+
+    def AsDict(self) -> Dict[str, Any]:
+        with self.Lock:
+            Spans = sorted(self.Spans, key=lambda Span: Span["start_ms"])
+        return {
+            "trace_id": self.Id,
+            "name": self.Name,
+            "started_at": self.StartedAt,
+            "duration_ms": self.DurationMs,
+            "totals_ms": self.Totals(),
+            "spans": Spans
+        }
+
+
+_Trace = contextvars.ContextVar("trace", default=None)
+RecentTraces = deque(maxlen=100)
+
+
+def CurrentTrace() -> Trace:
+    return _Trace.get()
+
+
+@contextmanager
+def StartTrace(Name: str):
+    """Makes a new trace current for this task (and the tasks and copied contexts it starts)."""
+    NewTrace = Trace(Name)
+    Token = _Trace.set(NewTrace)
+    try:
+        yield NewTrace
+    finally:
+        NewTrace.Finish()
+        TraceSeconds.Observe(NewTrace.DurationMs / 1000, trace=Name)
+        RecentTraces.append(NewTrace)
+        try:
+            _Trace.reset(Token)
+        except ValueError:
+            # Async generators can be finalized from another context
+            pass
+
+
+@contextmanager
+def Span(Name: str, **Attributes):
+    """
+    Times a block into the span histogram and, when a trace is current, into the trace.
+    The yielded dict takes attributes discovered inside the block (rows, tokens...).
+    """
+    Started = time.perf_counter()
+    try:
+        yield Attributes
+    except BaseException as E:
+        Attributes["error"] = type(E).__name__
+        raise
+    finally:
+        Seconds = time.perf_counter() - Started
+        SpanSeconds.Observe(Seconds, span=Name)
+        Current = _Trace.get()
+        if Current is not None:
+            Current.Add(Name, Started, Seconds, Attributes)
+
+
+class RequestMetrics:
+    """ASGI middleware observing request latency per route template, method and status."""
+
+    def __init__(self, App):
+        self.App = App
+
+    async def __call__(self, Scope, Receive, Send):
+        if Scope["type"] != "http":
+            return await self.App(Scope, Receive, Send)
+        Started = time.perf_counter()
+
+        async def SendAndObserve(Message):
+            if Message["type"] == "http.response.start":
+                # The router records the matched route on the scope; templates keep label cardinality bounded
+                Route = Scope.get("route")
+                RequestSeconds.Observe(time.perf_counter() - Started, method=Scope["method"],
+                                       path=getattr(Route, "path", "unmatched"), status=Message["status"])
+            await Send(Message)
+
+        await self.App(Scope, Receive, SendAndObserve)
+
+
+def FindTrace(TraceId: str) -> Trace:
+    for Item in reversed(RecentTraces):
+        if Item.Id == TraceId:
+            return Item
+    return None